@@ -3,6 +3,8 @@
 @Description : Initialization of "effect" package
 """
 from datetime import datetime
+from os import path, fsync
+from pickle import dump, load, UnpicklingError
 
 
 class Monitor(object):
@@ -76,10 +78,79 @@ class Monitor(object):
             print()
 
 
-from effect.networks import RestrictedWeight, RestrictedBias, NeuralMotif  # noqa
-from effect.operations import prepare_data, prepare_data_flexible, prepare_motifs  # noqa
+class Checkpoint(object):
+    """
+    Store the results of the finished tasks in an append-only file.
+    """
+
+    def __init__(self,
+                 file_path: str):
+        """
+        Initialize the checkpoint and load the results stored in the file.
+
+        The file can be read while the tasks are running in another process,
+        because the stored results are never rewritten.
+
+        :param file_path: path of the checkpoint file.
+        :type file_path: str
+        """
+        self.file_path, self.results, self.valid_size = file_path, {}, 0
+        self.load()
+
+    def load(self):
+        """
+        Load the stored results, where an incomplete tail (interrupted writing) is ignored.
+        """
+        self.results, self.valid_size = {}, 0
+        if path.exists(self.file_path):
+            with open(self.file_path, "rb") as file:
+                while True:
+                    try:
+                        self.results.update(load(file))
+                        self.valid_size = file.tell()
+                    except (EOFError, UnpicklingError):
+                        break
+
+    def append(self,
+               results: dict):
+        """
+        Append the results of the finished tasks into the file.
+
+        :param results: results of the finished tasks, keyed by their indices.
+        :type results: dict
+        """
+        with open(self.file_path, "ab") as file:
+            # remove the incomplete tail before appending.
+            if file.tell() > self.valid_size:
+                file.truncate(self.valid_size)
+            dump(results, file)
+            file.flush()
+            fsync(file.fileno())
+            self.valid_size = file.tell()
+
+        self.results.update(results)
+
+    def __contains__(self, index):
+        return index in self.results
+
+    def __getitem__(self, index):
+        return self.results[index]
+
+    def __len__(self):
+        return len(self.results)
+
+
+from effect.networks import RestrictedWeight, RestrictedBias, NeuralMotif, BatchedNeuralMotif, MotifTrajectory  # noqa
+from effect.operations import prepare_data, prepare_data_flexible, prepare_motifs, obtain_parameters  # noqa
 from effect.operations import calculate_landscape, calculate_values, calculate_gradients, detect_curvature_feature  # noqa
+from effect.operations import classify_curvature_features  # noqa
+from effect.operations import calculate_landscapes  # noqa
 from effect.operations import generate_motifs, generate_outputs, calculate_differences  # noqa
+from effect.operations import calculate_squared_differences  # noqa
+from effect.neighbors import LandscapeIndex, LandscapeLibrary  # noqa
+from effect.gradients import calculate_gradient_fields, estimate_lipschitz_bound  # noqa
 from effect.robustness import estimate_lipschitz_by_motif, estimate_lipschitz, evaluate_propagation  # noqa
-from effect.similarity import maximum_minimum_loss_search, minimum_loss_search  # noqa
+from effect.robustness import evaluate_propagations, estimate_lipschitz_batch  # noqa
+from effect.similarity import maximum_minimum_loss_search, minimum_loss_search, population_minimum_loss_search  # noqa
 from effect.similarity import execute_catch_processes, execute_escape_processes  # noqa
+from effect.similarity import benchmark_optimizers, seed_catchers  # noqa
@@ -0,0 +1,464 @@
+"""
+@Author      : Haoling Zhang
+@Description : Closed-form gradients and Lipschitz bounds of neural motifs
+"""
+from numpy import ndarray, array, linspace, meshgrid, stack, ones_like, where, clip
+from numpy import abs, min, max, sqrt, tanh, exp, maximum, minimum, finfo, float32
+from typing import Tuple
+
+from effect.networks import NeuralMotif
+
+# relative precision of the rounding errors in float32 with a safety factor.
+rounding_precision = 16.0 * float(finfo(float32).eps)
+
+
+def calculate_gradient_fields(value_range: tuple,
+                              points: int,
+                              motif: NeuralMotif) \
+        -> ndarray:
+    """
+    Calculate the closed-form input gradients of the selected motif in the definition field.
+
+    The gradients include the min-max rescaling in "effect.networks.NeuralMotif.forward",
+    where the output range of the sampled landscape is regarded as a constant.
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: number of equidistant sampling in the definition field.
+    :type points: int
+
+    :param motif: 3-node network motif with two inputs (collider, coherent loop, or incoherent loop).
+    :type motif: effect.networks.NeuralMotif
+
+    :return: gradient fields with shape (points, points, 2), i.e. the partial derivatives of two input signals.
+    :rtype: numpy.ndarray
+    """
+    x, y = prepare_grid(value_range=value_range, points=points)
+    outputs, gradient_x, gradient_y = differentiate(motif=motif, x=x, y=y)
+
+    return stack((gradient_x, gradient_y), axis=2) * calculate_scale(outputs)
+
+
+def estimate_lipschitz_bound(value_range: tuple,
+                             points: int,
+                             motif: NeuralMotif,
+                             norm_type: str = "L-2",
+                             cells: int = 64) \
+        -> float:
+    """
+    Calculate an upper bound of the Lipschitz constant of the selected motif.
+
+    The definition field is split into cells, in which the gradient of the motif is bounded by interval arithmetic.
+    Since the Lipschitz constant under a given input norm is the supremum of the dual norm of the gradient,
+    the bound covers the exact (float64) landscape.
+    The sampled landscape ("estimate_lipschitz_by_motif") is calculated in float32,
+    so an explicit margin of its rounding errors (see "calculate_rounding_error") is added to the bound,
+    which keeps the bound above the constant estimated from the sampled landscape.
+    If the rounding errors can dominate the output range of the landscape, the bound is infinite.
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: number of equidistant sampling in the definition field (decide the min-max rescaling).
+    :type points: int
+
+    :param motif: 3-node network motif with two inputs (collider, coherent loop, or incoherent loop).
+    :type motif: effect.networks.NeuralMotif
+
+    :param norm_type: norm type, including "L-1", "L-2", and "L-inf".
+    :type norm_type: str
+
+    :param cells: number of cells in each dimension of the definition field.
+    :type cells: int
+
+    :return: upper bound of the Lipschitz constant.
+    :rtype: float
+    """
+    x, y = prepare_grid(value_range=value_range, points=points)
+    outputs = differentiate(motif=motif, x=x, y=y)[0]
+    if calculate_scale(outputs) == 0.0:
+        return 0.0
+
+    x_edges, y_edges = prepare_grid(value_range=value_range, points=cells + 1)
+    x_bounds, y_bounds = (x_edges[:-1, :-1], x_edges[1:, 1:]), (y_edges[:-1, :-1], y_edges[1:, 1:])
+    gradient_x, gradient_y = bound_gradients(motif=motif, x_bounds=x_bounds, y_bounds=y_bounds)
+    gradient_x = maximum(abs(gradient_x[0]), abs(gradient_x[1]))
+    gradient_y = maximum(abs(gradient_y[0]), abs(gradient_y[1]))
+
+    if norm_type == "L-1":  # dual norm is L-inf.
+        gradient_norms = maximum(gradient_x, gradient_y)
+    elif norm_type == "L-2":  # dual norm is L-2.
+        gradient_norms = sqrt(gradient_x ** 2 + gradient_y ** 2)
+    elif norm_type == "L-inf":  # dual norm is L-1.
+        gradient_norms = gradient_x + gradient_y
+    else:
+        raise ValueError("No such norm type!")
+
+    # the output range and the rescaled outputs of the sampled landscape may deviate by the rounding errors.
+    raw_error = calculate_rounding_error(value_range=value_range, motif=motif, gradient_bound=max(gradient_norms))
+    output_range = max(outputs) - min(outputs) - 2.0 * raw_error
+    if output_range <= 0.0:
+        return float("inf")
+
+    scale = 2.0 / output_range
+    output_error = scale * raw_error + rounding_precision
+    if len(value_range) == 2:
+        interval = (value_range[1] - value_range[0]) / (points - 1)
+    else:
+        interval = min([value_range[1] - value_range[0], value_range[3] - value_range[2]]) / (points - 1)
+
+    # the shortest input difference of the sampled landscape is the interval.
+    return float(max(gradient_norms) * scale + 2.0 * output_error / interval)
+
+
+def calculate_rounding_error(value_range: tuple,
+                             motif: NeuralMotif,
+                             gradient_bound: float) \
+        -> float:
+    """
+    Calculate the bound of the rounding errors of the raw outputs (before the rescaling) in float32,
+    which is proportional to the magnitudes of the intermediate values and the rounded input signals.
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param motif: 3-node network motif with two inputs (collider, coherent loop, or incoherent loop).
+    :type motif: effect.networks.NeuralMotif
+
+    :param gradient_bound: upper bound of the gradient norm of the raw outputs.
+    :type gradient_bound: float
+
+    :return: rounding error bound of the raw outputs.
+    :rtype: float
+    """
+    w, b = [abs(weight.value()) for weight in motif.w], [abs(bias.value()) for bias in motif.b]
+    signal = float(max(abs(array(value_range))))
+
+    if motif.t == "collider":
+        magnitude = signal * (w[0] + w[1]) + b[0]
+    else:  # the hidden node is activated by tanh, sigmoid (at most 1), or relu.
+        hidden = signal * (w[0] + 1.0) + b[0]
+        magnitude = max([hidden, signal * w[1] + w[2] * max([1.0, hidden]) + b[1]])
+
+    return rounding_precision * (1.0 + magnitude + gradient_bound * signal)
+
+
+def prepare_grid(value_range: tuple,
+                 points: int) \
+        -> Tuple[ndarray, ndarray]:
+    """
+    Prepare the grid of two input signals, in the same order as "effect.operations.prepare_data".
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: sampling points.
+    :type points: int
+
+    :return: values of two input signals with shape (points, points).
+    :rtype: numpy.ndarray, numpy.ndarray
+    """
+    if len(value_range) == 2:
+        value_range_x, value_range_y = value_range, value_range
+    elif len(value_range) == 4:
+        value_range_x, value_range_y = value_range[:2], value_range[2:]
+    else:
+        raise ValueError("Input value range must be 2 or 4.")
+
+    return meshgrid(linspace(value_range_x[0], value_range_x[1], points),
+                    linspace(value_range_y[0], value_range_y[1], points), indexing="ij")
+
+
+def calculate_scale(outputs: ndarray) \
+        -> float:
+    """
+    Calculate the scale of the min-max rescaling in "effect.networks.NeuralMotif.forward".
+
+    :param outputs: raw outputs of the sampled landscape.
+    :type outputs: numpy.ndarray
+
+    :return: scale of the rescaling, which is zero for a flat landscape.
+    :rtype: float
+    """
+    output_range = max(outputs) - min(outputs)
+
+    return 2.0 / output_range if output_range >= 1e-12 else 0.0
+
+
+def differentiate(motif: NeuralMotif,
+                  x: ndarray,
+                  y: ndarray) \
+        -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Calculate the raw outputs (before the rescaling) of the motif and their partial derivatives.
+
+    :param motif: 3-node network motif with two inputs (collider, coherent loop, or incoherent loop).
+    :type motif: effect.networks.NeuralMotif
+
+    :param x: values of the first input signal.
+    :type x: numpy.ndarray
+
+    :param y: values of the second input signal.
+    :type y: numpy.ndarray
+
+    :return: raw outputs, partial derivatives of the first and the second input signal.
+    :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray
+    """
+    w, b = [weight.value() for weight in motif.w], [bias.value() for bias in motif.b]
+
+    if motif.t == "collider":
+        values, derivative_a, derivative_b = aggregate(w[0] * x, w[1] * y, motif.g[0])
+        outputs, derivatives = activate(values + b[0], motif.a[0])
+        return outputs, derivatives * derivative_a * w[0], derivatives * derivative_b * w[1]
+
+    elif motif.t in ["coherent-loop", "incoherent-loop"]:
+        values, derivative_a, derivative_b = aggregate(w[0] * x, y, motif.g[0])
+        hidden, derivatives = activate(values + b[0], motif.a[0])
+        hidden_x, hidden_y = derivatives * derivative_a * w[0], derivatives * derivative_b
+
+        values, derivative_a, derivative_b = aggregate(w[1] * x, w[2] * hidden, motif.g[1])
+        outputs, derivatives = activate(values + b[1], motif.a[1])
+        return outputs, derivatives * (derivative_a * w[1] + derivative_b * w[2] * hidden_x), \
+            derivatives * derivative_b * w[2] * hidden_y
+
+    else:
+        raise ValueError("Only the motifs with two input signals are supported!")
+
+
+def bound_gradients(motif: NeuralMotif,
+                    x_bounds: tuple,
+                    y_bounds: tuple) \
+        -> Tuple[tuple, tuple]:
+    """
+    Bound the partial derivatives of the raw outputs of the motif in the given cells by interval arithmetic.
+
+    :param motif: 3-node network motif with two inputs (collider, coherent loop, or incoherent loop).
+    :type motif: effect.networks.NeuralMotif
+
+    :param x_bounds: lower and upper bounds of the first input signal in each cell.
+    :type x_bounds: tuple
+
+    :param y_bounds: lower and upper bounds of the second input signal in each cell.
+    :type y_bounds: tuple
+
+    :return: intervals of the partial derivatives of the first and the second input signal.
+    :rtype: tuple, tuple
+    """
+    w, b = [weight.value() for weight in motif.w], [bias.value() for bias in motif.b]
+
+    if motif.t == "collider":
+        values, derivative_a, derivative_b = aggregate_interval(scale_interval(x_bounds, w[0]),
+                                                                scale_interval(y_bounds, w[1]), motif.g[0])
+        _, derivatives = activate_interval(shift_interval(values, b[0]), motif.a[0])
+        return multiply_intervals(derivatives, scale_interval(derivative_a, w[0])), \
+            multiply_intervals(derivatives, scale_interval(derivative_b, w[1]))
+
+    elif motif.t in ["coherent-loop", "incoherent-loop"]:
+        values, derivative_a, derivative_b = aggregate_interval(scale_interval(x_bounds, w[0]), y_bounds, motif.g[0])
+        hidden, derivatives = activate_interval(shift_interval(values, b[0]), motif.a[0])
+        hidden_x = multiply_intervals(derivatives, scale_interval(derivative_a, w[0]))
+        hidden_y = multiply_intervals(derivatives, derivative_b)
+
+        values, derivative_a, derivative_b = aggregate_interval(scale_interval(x_bounds, w[1]),
+                                                                scale_interval(hidden, w[2]), motif.g[1])
+        _, derivatives = activate_interval(shift_interval(values, b[1]), motif.a[1])
+        inner_x = add_intervals(scale_interval(derivative_a, w[1]),
+                                multiply_intervals(scale_interval(derivative_b, w[2]), hidden_x))
+        inner_y = multiply_intervals(scale_interval(derivative_b, w[2]), hidden_y)
+        return multiply_intervals(derivatives, inner_x), multiply_intervals(derivatives, inner_y)
+
+    else:
+        raise ValueError("Only the motifs with two input signals are supported!")
+
+
+def activate(values: ndarray,
+             activation: str) \
+        -> Tuple[ndarray, ndarray]:
+    """
+    Calculate the activated values and their derivatives.
+
+    :param values: input values.
+    :type values: numpy.ndarray
+
+    :param activation: activation function, i.e. "tanh", "sigmoid", or "relu".
+    :type activation: str
+
+    :return: activated values and derivatives.
+    :rtype: numpy.ndarray, numpy.ndarray
+    """
+    if activation == "tanh":
+        outputs = tanh(values)
+        return outputs, 1.0 - outputs ** 2
+    elif activation == "sigmoid":
+        outputs = 1.0 / (1.0 + exp(-values))
+        return outputs, outputs * (1.0 - outputs)
+    elif activation == "relu":
+        return maximum(values, 0.0), where(values > 0.0, 1.0, 0.0)
+    else:
+        raise ValueError("No such activation function type!")
+
+
+def aggregate(values_a: ndarray,
+              values_b: ndarray,
+              aggregation: str) \
+        -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Calculate the aggregated values and their partial derivatives.
+
+    :param values_a: values from the first source.
+    :type values_a: numpy.ndarray
+
+    :param values_b: values from the second source.
+    :type values_b: numpy.ndarray
+
+    :param aggregation: aggregation function, i.e. "sum" or "max".
+    :type aggregation: str
+
+    :return: aggregated values, partial derivatives of the first and the second source.
+    :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray
+    """
+    if aggregation == "sum":
+        return values_a + values_b, ones_like(values_a), ones_like(values_b)
+    elif aggregation == "max":  # the first source is selected in ties, same as "torch.max".
+        flags = values_a >= values_b
+        return where(flags, values_a, values_b), where(flags, 1.0, 0.0), where(flags, 0.0, 1.0)
+    else:
+        raise ValueError("No such aggregation function type!")
+
+
+def activate_interval(interval: tuple,
+                      activation: str) \
+        -> Tuple[tuple, tuple]:
+    """
+    Bound the activated values and their derivatives in the given intervals.
+
+    :param interval: lower and upper bounds of the input values.
+    :type interval: tuple
+
+    :param activation: activation function, i.e. "tanh", "sigmoid", or "relu".
+    :type activation: str
+
+    :return: intervals of the activated values and the derivatives.
+    :rtype: tuple, tuple
+    """
+    lower, upper = interval
+    if activation in ["tanh", "sigmoid"]:  # monotone values, and derivatives decrease with the distance to zero.
+        lower_outputs, lower_derivatives = activate(lower, activation)
+        upper_outputs, upper_derivatives = activate(upper, activation)
+        _, peak_derivatives = activate(clip(0.0, lower, upper), activation)
+        return (lower_outputs, upper_outputs), (minimum(lower_derivatives, upper_derivatives), peak_derivatives)
+    elif activation == "relu":
+        return (maximum(lower, 0.0), maximum(upper, 0.0)), (where(lower > 0.0, 1.0, 0.0), where(upper > 0.0, 1.0, 0.0))
+    else:
+        raise ValueError("No such activation function type!")
+
+
+def aggregate_interval(interval_a: tuple,
+                       interval_b: tuple,
+                       aggregation: str) \
+        -> Tuple[tuple, tuple, tuple]:
+    """
+    Bound the aggregated values and their partial derivatives in the given intervals.
+
+    :param interval_a: lower and upper bounds of the values from the first source.
+    :type interval_a: tuple
+
+    :param interval_b: lower and upper bounds of the values from the second source.
+    :type interval_b: tuple
+
+    :param aggregation: aggregation function, i.e. "sum" or "max".
+    :type aggregation: str
+
+    :return: intervals of the aggregated values, the partial derivatives of the first and the second source.
+    :rtype: tuple, tuple, tuple
+    """
+    if aggregation == "sum":
+        units = (ones_like(interval_a[0]), ones_like(interval_a[0]))
+        return add_intervals(interval_a, interval_b), units, units
+    elif aggregation == "max":
+        always_a, always_b = interval_a[0] >= interval_b[1], interval_a[1] < interval_b[0]
+        derivative_a = (where(always_a, 1.0, 0.0), where(always_b, 0.0, 1.0))
+        derivative_b = (1.0 - derivative_a[1], 1.0 - derivative_a[0])
+        return (maximum(interval_a[0], interval_b[0]), maximum(interval_a[1], interval_b[1])), \
+            derivative_a, derivative_b
+    else:
+        raise ValueError("No such aggregation function type!")
+
+
+def add_intervals(interval_1: tuple,
+                  interval_2: tuple) \
+        -> tuple:
+    """
+    Add two intervals.
+
+    :param interval_1: lower and upper bounds of the first interval.
+    :type interval_1: tuple
+
+    :param interval_2: lower and upper bounds of the second interval.
+    :type interval_2: tuple
+
+    :return: lower and upper bounds of the sum.
+    :rtype: tuple
+    """
+    return interval_1[0] + interval_2[0], interval_1[1] + interval_2[1]
+
+
+def multiply_intervals(interval_1: tuple,
+                       interval_2: tuple) \
+        -> tuple:
+    """
+    Multiply two intervals.
+
+    :param interval_1: lower and upper bounds of the first interval.
+    :type interval_1: tuple
+
+    :param interval_2: lower and upper bounds of the second interval.
+    :type interval_2: tuple
+
+    :return: lower and upper bounds of the product.
+    :rtype: tuple
+    """
+    products = array([interval_1[0] * interval_2[0], interval_1[0] * interval_2[1],
+                      interval_1[1] * interval_2[0], interval_1[1] * interval_2[1]])
+
+    return min(products, axis=0), max(products, axis=0)
+
+
+def scale_interval(interval: tuple,
+                   value: float) \
+        -> tuple:
+    """
+    Multiply an interval by a constant.
+
+    :param interval: lower and upper bounds of the interval.
+    :type interval: tuple
+
+    :param value: constant.
+    :type value: float
+
+    :return: lower and upper bounds of the product.
+    :rtype: tuple
+    """
+    if value >= 0:
+        return interval[0] * value, interval[1] * value
+
+    return interval[1] * value, interval[0] * value
+
+
+def shift_interval(interval: tuple,
+                   value: float) \
+        -> tuple:
+    """
+    Add a constant to an interval.
+
+    :param interval: lower and upper bounds of the interval.
+    :type interval: tuple
+
+    :param value: constant.
+    :type value: float
+
+    :return: lower and upper bounds of the sum.
+    :rtype: tuple
+    """
+    return interval[0] + value, interval[1] + value
@@ -0,0 +1,518 @@
+"""
+@Author      : Haoling Zhang
+@Description : Nearest-landscape index for the screening of motif landscapes
+"""
+from numpy import ndarray, memmap, array, zeros, full, arange, argmin, argsort, lexsort, concatenate, split, unique
+from numpy import expand_dims, inf, load, linalg, matmul, maximum, mean, abs, sum, sqrt, power, where, searchsorted
+from typing import Tuple, Union
+
+from effect import Monitor
+
+
+class LandscapeIndex(object):
+
+    def __init__(self,
+                 landscapes: ndarray,
+                 norm_type: str = "L-2",
+                 dimension: int = 32,
+                 block_size: int = 2048):
+        """
+        Initialize the landscape index, which prunes the candidates through the principal component projection.
+
+        Since the projection onto orthonormal principal components never enlarges the Euclidean distance,
+        the projected distance is a lower bound of both the "L-1" and the "L-2" differences between landscapes.
+        For the "L-1" difference, the bound also uses the normalized value range [-1, 1] of the landscapes.
+        Only the candidates whose lower bound can still satisfy the query are re-ranked by the exact difference,
+        so the query results are the same as the exhaustive ones.
+
+        :param landscapes: indexed landscapes with shape (number, points ** 2), which can be memory-mapped.
+        :type landscapes: numpy.ndarray
+
+        :param norm_type: norm type, including "L-1" and "L-2" (same as "effect.operations.calculate_differences").
+        :type norm_type: str
+
+        :param dimension: number of principal components used for pruning.
+        :type dimension: int
+
+        :param block_size: number of landscapes processed in one block.
+        :type block_size: int
+        """
+        if norm_type not in ["L-1", "L-2"]:
+            raise ValueError("No such norm type!")
+
+        self.landscapes, self.norm_type, self.block_size = landscapes, norm_type, block_size
+        self.center, self.components, self.projections = None, None, None
+        self.build(dimension=dimension)
+
+    def build(self,
+              dimension: int):
+        """
+        Build the principal component projection of the indexed landscapes.
+
+        :param dimension: number of principal components used for pruning.
+        :type dimension: int
+        """
+        total, features = self.landscapes.shape
+
+        self.center = zeros(shape=(features,))
+        for start in range(0, total, self.block_size):
+            self.center += sum(array(self.landscapes[start: start + self.block_size], dtype=float), axis=0)
+        self.center /= total
+
+        covariance = zeros(shape=(features, features))
+        for start in range(0, total, self.block_size):
+            rows = array(self.landscapes[start: start + self.block_size], dtype=float) - self.center
+            covariance += matmul(rows.T, rows)
+
+        _, eigenvectors = linalg.eigh(covariance)
+        self.components = eigenvectors[:, ::-1][:, :min(dimension, features)].copy()
+
+        self.projections = zeros(shape=(total, self.components.shape[1]))
+        for start in range(0, total, self.block_size):
+            stop = start + self.block_size
+            self.projections[start: stop] = self.project(self.landscapes[start: stop])
+
+    def project(self,
+                landscapes: ndarray) \
+            -> ndarray:
+        """
+        Project the landscapes onto the principal components.
+
+        :param landscapes: landscapes with shape (number, points ** 2).
+        :type landscapes: numpy.ndarray
+
+        :return: projected landscapes with shape (number, dimension).
+        :rtype: numpy.ndarray
+        """
+        return matmul(array(landscapes, dtype=float) - self.center, self.components)
+
+    def minimum_differences(self,
+                            landscapes: Union[ndarray, None] = None,
+                            verbose: bool = False) \
+            -> ndarray:
+        """
+        Find the minimum difference between each queried landscape and the indexed landscapes.
+
+        :param landscapes: queried landscapes, the indexed landscapes (excluding themselves) are queried if None.
+        :type landscapes: numpy.ndarray or None
+
+        :param verbose: need to show process log.
+        :type verbose: bool
+
+        :return: minimum differences.
+        :rtype: numpy.ndarray
+        """
+        return self.nearest_neighbors(landscapes=landscapes, verbose=verbose)[1]
+
+    def nearest_neighbors(self,
+                          landscapes: Union[ndarray, None] = None,
+                          verbose: bool = False) \
+            -> Tuple[ndarray, ndarray]:
+        """
+        Find the nearest indexed landscape of each queried landscape.
+        If several indexed landscapes are equally near, the one with the smallest index is chosen.
+
+        :param landscapes: queried landscapes, the indexed landscapes (excluding themselves) are queried if None.
+        :type landscapes: numpy.ndarray or None
+
+        :param verbose: need to show process log.
+        :type verbose: bool
+
+        :return: indices of the nearest indexed landscapes and their differences to the queried landscapes.
+        :rtype: numpy.ndarray, numpy.ndarray
+        """
+        is_self, monitor = landscapes is None, Monitor()
+        if is_self:
+            landscapes = self.landscapes
+
+        indices, differences = zeros(shape=(len(landscapes),), dtype=int), zeros(shape=(len(landscapes),))
+        for query_start in range(0, len(landscapes), self.block_size):
+            queries = array(landscapes[query_start: query_start + self.block_size], dtype=float)
+            query_projections = self.project(queries)
+            minimum_values = full(shape=(len(queries),), fill_value=inf)
+            minimum_indices = full(shape=(len(queries),), fill_value=-1)
+
+            for item_start in range(0, len(self.landscapes), self.block_size):
+                bounds = self.lower_bounds(query_projections, item_start, query_start if is_self else None)
+
+                # tighten the current minimum through the most promising item, and then re-rank the rest.
+                query_indices = where(bounds.min(axis=1) < minimum_values)[0]
+                if len(query_indices) > 0:
+                    item_indices = item_start + argmin(bounds[query_indices], axis=1)
+                    values = self.exact_differences(queries, query_indices, item_indices)
+                    self.tighten(minimum_values, minimum_indices, query_indices, item_indices, values)
+
+                query_indices, item_indices = where(bounds < expand_dims(minimum_values, axis=1))
+                if len(query_indices) > 0:
+                    values = self.exact_differences(queries, query_indices, item_start + item_indices)
+                    self.tighten(minimum_values, minimum_indices, query_indices, item_start + item_indices, values)
+
+            indices[query_start: query_start + len(queries)] = minimum_indices
+            differences[query_start: query_start + len(queries)] = minimum_values
+
+            if verbose:
+                monitor(query_start + len(queries), len(landscapes))
+
+        return indices, differences
+
+    def radius_neighbors(self,
+                         radius: float,
+                         landscapes: Union[ndarray, None] = None,
+                         verbose: bool = False) \
+            -> list:
+        """
+        Find the indexed landscapes within the given radius of each queried landscape.
+
+        :param radius: maximum difference between the queried landscape and its neighbors.
+        :type radius: float
+
+        :param landscapes: queried landscapes, the indexed landscapes (excluding themselves) are queried if None.
+        :type landscapes: numpy.ndarray or None
+
+        :param verbose: need to show process log.
+        :type verbose: bool
+
+        :return: indices of the neighbors for each queried landscape.
+        :rtype: list
+        """
+        is_self, monitor, neighbors = landscapes is None, Monitor(), []
+        if is_self:
+            landscapes = self.landscapes
+
+        for query_start in range(0, len(landscapes), self.block_size):
+            queries = array(landscapes[query_start: query_start + self.block_size], dtype=float)
+            query_projections = self.project(queries)
+
+            query_records, item_records = [], []
+            for item_start in range(0, len(self.landscapes), self.block_size):
+                bounds = self.lower_bounds(query_projections, item_start, query_start if is_self else None)
+                query_indices, item_indices = where(bounds <= radius)
+                if len(query_indices) > 0:
+                    values = self.exact_differences(queries, query_indices, item_start + item_indices)
+                    query_records.append(query_indices[values <= radius])
+                    item_records.append(item_start + item_indices[values <= radius])
+
+            if len(query_records) > 0:
+                query_records, item_records = concatenate(query_records), concatenate(item_records)
+                order = argsort(query_records, kind="stable")
+                query_records, item_records = query_records[order], item_records[order]
+                neighbors += split(item_records, searchsorted(query_records, arange(1, len(queries))))
+            else:
+                neighbors += [array([], dtype=int) for _ in range(len(queries))]
+
+            if verbose:
+                monitor(query_start + len(queries), len(landscapes))
+
+        return neighbors
+
+    def lower_bounds(self,
+                     query_projections: ndarray,
+                     item_start: int,
+                     query_start: Union[int, None] = None) \
+            -> ndarray:
+        """
+        Calculate the lower bounds of the differences between the queried landscapes and a block of indexed landscapes.
+
+        :param query_projections: projected queried landscapes.
+        :type query_projections: numpy.ndarray
+
+        :param item_start: start index of the block of indexed landscapes.
+        :type item_start: int
+
+        :param query_start: start index of the queried landscapes if they are the indexed landscapes themselves.
+        :type query_start: int or None
+
+        :return: lower bounds with shape (query number, block size).
+        :rtype: numpy.ndarray
+        """
+        item_projections = self.projections[item_start: item_start + self.block_size]
+        bounds = expand_dims(sum(power(query_projections, 2), axis=1), axis=1) \
+            + expand_dims(sum(power(item_projections, 2), axis=1), axis=0) \
+            - 2.0 * matmul(query_projections, item_projections.T)
+        # leave a margin for the rounding errors of the expansion, so that no qualified candidate is pruned.
+        bounds = maximum(bounds - 1e-9, 0.0)
+
+        if self.norm_type == "L-1":
+            # the normalized landscapes are within [-1, 1], so each absolute error |d| <= 2 satisfies |d| >= d ** 2 / 2.
+            # the mean absolute error is then no less than the squared Euclidean distance / (2 * features),
+            # and also no less than the Euclidean distance / features (a small margin is left for the float32 values).
+            bounds = maximum(bounds / (2.0 + 1e-6), sqrt(bounds)) / self.landscapes.shape[1]
+        else:  # the mean squared error is the squared Euclidean distance / features.
+            bounds = bounds / self.landscapes.shape[1]
+
+        if query_start is not None:  # exclude the landscape itself.
+            locations = arange(max([query_start, item_start]),
+                               min([query_start + len(query_projections), item_start + len(item_projections)]))
+            bounds[locations - query_start, locations - item_start] = inf
+
+        return bounds
+
+    def tighten(self,
+                minimum_values: ndarray,
+                minimum_indices: ndarray,
+                query_indices: ndarray,
+                item_indices: ndarray,
+                values: ndarray):
+        """
+        Update the current nearest indexed landscapes of the queried landscapes through the compared pairs.
+
+        :param minimum_values: current minimum differences of the queried landscapes, which are updated in place.
+        :type minimum_values: numpy.ndarray
+
+        :param minimum_indices: current nearest indices of the queried landscapes, which are updated in place.
+        :type minimum_indices: numpy.ndarray
+
+        :param query_indices: indices of the queried landscapes in pairs.
+        :type query_indices: numpy.ndarray
+
+        :param item_indices: indices of the indexed landscapes in pairs.
+        :type item_indices: numpy.ndarray
+
+        :param values: differences of pairs.
+        :type values: numpy.ndarray
+        """
+        # the first pair of each queried landscape has the minimum difference and the smallest index among ties.
+        order = lexsort((item_indices, values, query_indices))
+        query_indices, locations = unique(query_indices[order], return_index=True)
+        item_indices, values = item_indices[order][locations], values[order][locations]
+        flags = (values < minimum_values[query_indices]) \
+            | ((values == minimum_values[query_indices]) & (item_indices < minimum_indices[query_indices]))
+        minimum_values[query_indices[flags]] = values[flags]
+        minimum_indices[query_indices[flags]] = item_indices[flags]
+
+    def exact_differences(self,
+                          queries: ndarray,
+                          query_indices: ndarray,
+                          item_indices: ndarray) \
+            -> ndarray:
+        """
+        Calculate the exact differences between pairs of queried landscapes and indexed landscapes.
+
+        :param queries: queried landscapes.
+        :type queries: numpy.ndarray
+
+        :param query_indices: indices of the queried landscapes in pairs.
+        :type query_indices: numpy.ndarray
+
+        :param item_indices: indices of the indexed landscapes in pairs.
+        :type item_indices: numpy.ndarray
+
+        :return: differences of pairs.
+        :rtype: numpy.ndarray
+        """
+        values = zeros(shape=(len(query_indices),))
+        for start in range(0, len(query_indices), self.block_size):
+            stop = start + self.block_size
+            # read each indexed landscape once in ascending order, which is friendly for the memory-mapped file.
+            locations, inverse = unique(item_indices[start: stop], return_inverse=True)
+            items = array(self.landscapes[locations], dtype=float)[inverse]
+            if self.norm_type == "L-1":
+                values[start: stop] = mean(abs(queries[query_indices[start: stop]] - items), axis=1)
+            else:
+                values[start: stop] = mean(power(queries[query_indices[start: stop]] - items, 2), axis=1)
+
+        return values
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if isinstance(self.landscapes, memmap) and self.landscapes.filename is not None:
+            # keep the path rather than the content of the memory-mapped landscapes.
+            state["landscapes"] = str(self.landscapes.filename)
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state["landscapes"], str):
+            state["landscapes"] = load(state["landscapes"], mmap_mode="r")
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.projections)
+
+
+class LandscapeLibrary(object):
+
+    def __init__(self,
+                 minimum_difference: Union[float, None],
+                 norm_type: str = "L-1",
+                 pivot_number: int = 16,
+                 capacity: int = 1024,
+                 block_size: int = 2048):
+        """
+        Initialize the landscape library, which only accepts the landscapes different enough from the accepted ones.
+
+        The first accepted landscapes are used as pivots.
+        Since the "L-1" difference and the square root of the "L-2" difference are metrics,
+        the triangle inequality gives a lower bound of the difference between a candidate and each accepted landscape
+        through their differences to the pivots.
+        Only the accepted landscapes whose lower bound can still reject the candidate are compared exactly,
+        so the accepted landscapes are the same as the exhaustive comparison.
+
+        :param minimum_difference: minimum difference between accepted landscapes, all landscapes are accepted if None.
+        :type minimum_difference: float or None
+
+        :param norm_type: norm type, including "L-1" and "L-2" (same as "effect.operations.calculate_differences").
+        :type norm_type: str
+
+        :param pivot_number: number of pivots.
+        :type pivot_number: int
+
+        :param capacity: initial number of landscapes can be stored, which is doubled when the library is full.
+        :type capacity: int
+
+        :param block_size: number of accepted landscapes exactly compared in one block.
+        :type block_size: int
+        """
+        if norm_type not in ["L-1", "L-2"]:
+            raise ValueError("No such norm type!")
+
+        self.minimum_difference, self.norm_type = minimum_difference, norm_type
+        self.pivot_number, self.capacity, self.block_size = pivot_number, capacity, block_size
+        self.landscapes, self.pivot_differences, self.size = None, None, 0
+
+    def add(self,
+            landscapes: ndarray) \
+            -> ndarray:
+        """
+        Add the candidate landscapes into the library one by one.
+
+        :param landscapes: candidate landscapes with shape (number, points ** 2).
+        :type landscapes: numpy.ndarray
+
+        :return: acceptance flags of the candidate landscapes.
+        :rtype: numpy.ndarray
+        """
+        flags = zeros(shape=(len(landscapes),), dtype=bool)
+        for index, landscape in enumerate(landscapes):
+            if self.size == 0:
+                self.landscapes = zeros(shape=(self.capacity, landscape.shape[0]), dtype=landscape.dtype)
+                self.pivot_differences = zeros(shape=(self.capacity, self.pivot_number))
+
+            pivot_differences = self.distances(landscape, arange(min([self.size, self.pivot_number])))
+            if self.minimum_difference is None or self.check(landscape, pivot_differences):
+                self.append(landscape, pivot_differences)
+                flags[index] = True
+
+        return flags
+
+    def check(self,
+              landscape: ndarray,
+              pivot_differences: ndarray) \
+            -> bool:
+        """
+        Check whether the candidate landscape is different enough from all the accepted landscapes.
+
+        :param landscape: candidate landscape with shape (points ** 2,).
+        :type landscape: numpy.ndarray
+
+        :param pivot_differences: metric differences between the candidate landscape and the pivots.
+        :type pivot_differences: numpy.ndarray
+
+        :return: acceptance flag.
+        :rtype: bool
+        """
+        if self.size == 0:
+            return True
+
+        # the pivots are accepted landscapes, which are compared exactly.
+        pivot_count = len(pivot_differences)
+        if self.differences(landscape, arange(pivot_count)).min() <= self.minimum_difference:
+            return False
+
+        if self.norm_type == "L-1":
+            threshold = self.minimum_difference
+        else:
+            threshold = sqrt(self.minimum_difference)
+
+        bounds = abs(self.pivot_differences[pivot_count: self.size, :pivot_count] - pivot_differences).max(axis=1)
+        # leave a margin for the rounding errors of the landscapes, so that no rejectable candidate is accepted.
+        indices = pivot_count + where(bounds - 1e-5 <= threshold)[0]
+        indices = indices[argsort(bounds[indices - pivot_count], kind="stable")]
+        for start in range(0, len(indices), self.block_size):
+            if self.differences(landscape, indices[start: start + self.block_size]).min() <= self.minimum_difference:
+                return False
+
+        return True
+
+    def append(self,
+               landscape: ndarray,
+               pivot_differences: ndarray):
+        """
+        Append the accepted landscape into the library.
+
+        :param landscape: accepted landscape with shape (points ** 2,).
+        :type landscape: numpy.ndarray
+
+        :param pivot_differences: metric differences between the accepted landscape and the pivots.
+        :type pivot_differences: numpy.ndarray
+        """
+        if self.size == self.capacity:  # double the capacity rather than reallocating for each landscape.
+            landscapes = zeros(shape=(self.capacity * 2, self.landscapes.shape[1]), dtype=self.landscapes.dtype)
+            differences = zeros(shape=(self.capacity * 2, self.pivot_number))
+            landscapes[:self.size], differences[:self.size] = self.landscapes, self.pivot_differences
+            self.landscapes, self.pivot_differences, self.capacity = landscapes, differences, self.capacity * 2
+
+        self.landscapes[self.size] = landscape
+        self.pivot_differences[self.size, :len(pivot_differences)] = pivot_differences
+        if self.size < self.pivot_number:  # the accepted landscape becomes a new pivot.
+            self.pivot_differences[:self.size, self.size] = pivot_differences
+        self.size += 1
+
+    def differences(self,
+                    landscape: ndarray,
+                    indices: ndarray) \
+            -> ndarray:
+        """
+        Calculate the differences between the landscape and the accepted landscapes.
+
+        :param landscape: landscape with shape (points ** 2,).
+        :type landscape: numpy.ndarray
+
+        :param indices: indices of the accepted landscapes.
+        :type indices: numpy.ndarray
+
+        :return: differences.
+        :rtype: numpy.ndarray
+        """
+        if self.norm_type == "L-1":
+            return mean(abs(self.landscapes[indices] - landscape), axis=1)
+        else:
+            return mean(power(self.landscapes[indices] - landscape, 2), axis=1)
+
+    def distances(self,
+                  landscape: ndarray,
+                  indices: ndarray) \
+            -> ndarray:
+        """
+        Calculate the metric differences between the landscape and the accepted landscapes,
+        i.e. the "L-1" differences or the square roots of the "L-2" differences.
+
+        :param landscape: landscape with shape (points ** 2,).
+        :type landscape: numpy.ndarray
+
+        :param indices: indices of the accepted landscapes.
+        :type indices: numpy.ndarray
+
+        :return: metric differences.
+        :rtype: numpy.ndarray
+        """
+        differences = array(self.landscapes[indices], dtype=float) - array(landscape, dtype=float)
+        if self.norm_type == "L-1":
+            return mean(abs(differences), axis=1)
+        else:
+            return sqrt(mean(power(differences, 2), axis=1))
+
+    def values(self) \
+            -> ndarray:
+        """
+        Obtain the accepted landscapes.
+
+        :return: accepted landscapes with shape (size, points ** 2).
+        :rtype: numpy.ndarray
+        """
+        if self.size == 0:
+            return array([])
+
+        return self.landscapes[:self.size].copy()
+
+    def __len__(self):
+        return self.size
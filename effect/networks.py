@@ -2,9 +2,10 @@
 @Author      : Haoling Zhang
 @Description : Definition of neural motif
 """
-from numpy import ndarray
+from numpy import ndarray, full, nan
 from torch import Tensor, tensor, nn, unsqueeze, sum, min, max, mean, relu, tanh, sigmoid, cat, rand
-from typing import Union
+from torch import as_tensor, float32, stack, where, ones_like, amax, amin, maximum, any, no_grad
+from typing import Tuple, Union
 
 
 class RestrictedWeight(nn.Module):
@@ -168,6 +169,82 @@ class RestrictedBias(nn.Module):
         self.bias = nn.Parameter(data=value, requires_grad=True)
 
 
+def check_motif_definition(motif_type: str,
+                           motif_index: int,
+                           activations: Union[tuple, list],
+                           aggregations: Union[tuple, list]):
+    """
+    Check whether the definition of the neural network motif is legal.
+
+    :param motif_type: motif type ("collider", "fork", "chain", "coherent-loop", or "incoherent-loop").
+    :type motif_type: str
+
+    :param motif_index: index of network motif (1 ~ 4).
+    :type motif_index: int
+
+    :param activations: activation function list.
+    :type activations: tuple or list
+
+    :param aggregations: aggregation function list.
+    :type aggregations: tuple or list
+    """
+    if motif_index not in [1, 2, 3, 4]:
+        raise ValueError("index of motif needs to belong to [1, 2, 3, 4], got " + str(motif_index) + ".")
+
+    if motif_type == "collider":
+        request_a, request_g = 1, 1
+    elif motif_type == "fork":
+        request_a, request_g = 2, 0
+    elif motif_type == "chain":
+        request_a, request_g = 2, 0
+    elif motif_type in ["coherent-loop", "incoherent-loop"]:
+        request_a, request_g = 2, 2
+    else:
+        raise ValueError("no such motif type, expect one in "
+                         "[\"collider\", \"fork\", \"chain\", \"coherent-loop\", \"incoherent-loop\"].")
+
+    if len(activations) != request_a:
+        raise ValueError("wrong number of activation functions, "
+                         "expect " + str(request_a) + ", got " + str(len(activations)))
+    if len(aggregations) != request_g:
+        raise ValueError("wrong number of aggregation functions, "
+                         "expect " + str(request_g) + ", got " + str(len(aggregations)))
+
+    for activation in activations:
+        if activation not in ["tanh", "sigmoid", "relu"]:
+            raise ValueError("no such activation type, expect one in [\"tanh\", \"sigmoid\", \"relu\"].")
+    for aggregation in aggregations:
+        if aggregation not in ["sum", "max"]:
+            raise ValueError("no such aggregation type, expect one in [\"sum\", \"max\"].")
+
+
+def obtain_motif_structure(motif_type: str,
+                           motif_index: int) \
+        -> Tuple[list, int]:
+    """
+    Obtain the weight signs and the bias number of the neural network motif.
+
+    :param motif_type: motif type ("collider", "fork", "chain", "coherent-loop", or "incoherent-loop").
+    :type motif_type: str
+
+    :param motif_index: index of network motif (1 ~ 4).
+    :type motif_index: int
+
+    :return: positive flags of weights and number of biases.
+    :rtype: list, int
+    """
+    if motif_type == "collider":
+        weight_flags, bias_size = [motif_index <= 2, motif_index in [1, 3]], 1
+    elif motif_type in ["fork", "chain"]:
+        weight_flags, bias_size = [motif_index <= 2, motif_index in [1, 3]], 2
+    elif motif_type == "coherent-loop":
+        weight_flags, bias_size = [motif_index in [1, 4], motif_index <= 2, motif_index in [1, 3]], 2
+    else:  # motif_type == "incoherent-loop"
+        weight_flags, bias_size = [motif_index in [2, 3], motif_index <= 2, motif_index in [1, 3]], 2
+
+    return weight_flags, bias_size
+
+
 class NeuralMotif(nn.Module):
 
     def __init__(self,
@@ -211,34 +288,7 @@ class NeuralMotif(nn.Module):
         if aggregations is None:
             aggregations = []
 
-        if motif_index not in [1, 2, 3, 4]:
-            raise ValueError("index of motif needs to belong to [1, 2, 3, 4], got " + str(motif_index) + ".")
-
-        if motif_type == "collider":
-            request_a, request_g = 1, 1
-        elif motif_type == "fork":
-            request_a, request_g = 2, 0
-        elif motif_type == "chain":
-            request_a, request_g = 2, 0
-        elif motif_type in ["coherent-loop", "incoherent-loop"]:
-            request_a, request_g = 2, 2
-        else:
-            raise ValueError("no such motif type, expect one in "
-                             "[\"collider\", \"fork\", \"chain\", \"coherent-loop\", \"incoherent-loop\"].")
-
-        if len(activations) != request_a:
-            raise ValueError("wrong number of activation functions, "
-                             "expect " + str(request_a) + ", got " + str(len(activations)))
-        if len(aggregations) != request_g:
-            raise ValueError("wrong number of aggregation functions, "
-                             "expect " + str(request_g) + ", got " + str(len(aggregations)))
-
-        for activation in activations:
-            if activation not in ["tanh", "sigmoid", "relu"]:
-                raise ValueError("no such activation type, expect one in [\"tanh\", \"sigmoid\", \"relu\"].")
-        for aggregation in aggregations:
-            if aggregation not in ["sum", "max"]:
-                raise ValueError("no such aggregation type, expect one in [\"sum\", \"max\"].")
+        check_motif_definition(motif_type, motif_index, activations, aggregations)
 
         self.t, self.i, self.a, self.g, self.w, self.b = motif_type, motif_index, activations, aggregations, [], []
         self.weight_bound, self.bias_bound = weight_bound, bias_bound
@@ -410,14 +460,7 @@ class NeuralMotif(nn.Module):
         :param biases: established bias values.
         :type biases: list or None
         """
-        if self.t == "collider":
-            weight_flags, bias_size = [self.i <= 2, self.i in [1, 3]], 1
-        elif self.t in ["fork", "chain"]:
-            weight_flags, bias_size = [self.i <= 2, self.i in [1, 3]], 2
-        elif self.t == "coherent-loop":
-            weight_flags, bias_size = [self.i in [1, 4], self.i <= 2, self.i in [1, 3]], 2
-        else:  # self.t == "incoherent-loop"
-            weight_flags, bias_size = [self.i in [2, 3], self.i <= 2, self.i in [1, 3]], 2
+        weight_flags, bias_size = obtain_motif_structure(self.t, self.i)
 
         if weights is not None:
             if len(weights) != len(weight_flags):
@@ -479,3 +522,433 @@ class NeuralMotif(nn.Module):
             info += "\t" + "bias         |      (1) >> " + bs[0] + " >> (2)" + "\n"
             info += "\t" + "bias         |  (1),(2) >> " + bs[1] + " >> (3)" + ">"
         return info
+
+
+class BatchedNeuralMotif(nn.Module):
+
+    def __init__(self,
+                 motif_type: str,
+                 motif_index: int,
+                 activations: Union[tuple, list],
+                 aggregations: Union[tuple, list],
+                 weights: Union[Tensor, ndarray, list, None] = None,
+                 biases: Union[Tensor, ndarray, list, None] = None,
+                 batch_size: Union[int, None] = None,
+                 weight_bound: tuple = (+1e-3, +1e0),
+                 bias_bound: tuple = (-1e0, +1e0)):
+        """
+        Initialize a batch of neural network motifs sharing the same structure.
+
+        :param motif_type: motif type ("collider", "fork", "chain", "coherent-loop", or "incoherent-loop").
+        :type motif_type: str
+
+        :param motif_index: index of network motif (1 ~ 4).
+        :type motif_index: int
+
+        :param activations: activation function list.
+        :type activations: tuple or list
+
+        :param aggregations: aggregation function list.
+        :type aggregations: tuple or list
+
+        :param weights: established weights with shape (batch, weight number).
+        :type weights: torch.Tensor, numpy.ndarray, list, or None
+
+        :param biases: established biases with shape (batch, bias number).
+        :type biases: torch.Tensor, numpy.ndarray, list, or None
+
+        :param batch_size: number of motifs, only required if neither weights nor biases are established.
+        :type batch_size: int or None
+
+        :param weight_bound: bound of weight.
+        :type weight_bound: tuple
+
+        :param bias_bound: bound of bias.
+        :type bias_bound: tuple
+        """
+        super(BatchedNeuralMotif, self).__init__()
+
+        if aggregations is None:
+            aggregations = []
+
+        check_motif_definition(motif_type, motif_index, activations, aggregations)
+
+        self.t, self.i, self.a, self.g = motif_type, motif_index, activations, aggregations
+        self.weight_bound, self.bias_bound = weight_bound, bias_bound
+
+        weight_flags, self.bias_size = obtain_motif_structure(motif_type, motif_index)
+        weight_flags = tensor(weight_flags)
+        self.register_buffer("lower_weights", where(weight_flags, +weight_bound[0], -weight_bound[1]).float())
+        self.register_buffer("upper_weights", where(weight_flags, +weight_bound[1], -weight_bound[0]).float())
+
+        self.weights, self.biases = None, None
+        self.reset(weights, biases, batch_size)
+
+    def forward(self,
+                input_signals: Tensor) \
+            -> Tensor:
+        """
+        Forward propagate through all the neural network motifs in the batch.
+
+        :param input_signals: input signals shared by all motifs with shape (sample, input number),
+            or input signals of each motif with shape (batch, sample, input number).
+        :type input_signals: torch.Tensor
+
+        :return: output normalized signals with shape (batch, sample, output number).
+        :rtype: torch.Tensor
+        """
+        return self.propagate(input_signals, self.weights, self.biases)
+
+    def propagate(self,
+                  input_signals: Tensor,
+                  weights: Tensor,
+                  biases: Tensor) \
+            -> Tensor:
+        """
+        Forward propagate through the neural network motifs with the given weights and biases.
+
+        :param input_signals: input signals with shape (sample, input number) or (batch, sample, input number).
+        :type input_signals: torch.Tensor
+
+        :param weights: weights with shape (batch, weight number).
+        :type weights: torch.Tensor
+
+        :param biases: biases with shape (batch, bias number).
+        :type biases: torch.Tensor
+
+        :return: output normalized signals with shape (batch, sample, output number).
+        :rtype: torch.Tensor
+        """
+        w, b = unsqueeze(weights, dim=2), unsqueeze(biases, dim=2)
+
+        if self.t == "collider":
+            assert input_signals.size()[-1] == 2
+            values = self.aggregate(w[:, 0] * input_signals[..., 0], w[:, 1] * input_signals[..., 1], 0)
+            output_signals = unsqueeze(self.activate(values + b[:, 0], 0), dim=2)
+        elif self.t == "fork":
+            assert input_signals.size()[-1] == 1
+            output_signals = stack(tensors=(self.activate(w[:, 0] * input_signals[..., 0] + b[:, 0], 0),
+                                            self.activate(w[:, 1] * input_signals[..., 0] + b[:, 1], 1)),
+                                   dim=2)
+        elif self.t == "chain":
+            assert input_signals.size()[-1] == 1
+            signals = self.activate(w[:, 0] * input_signals[..., 0] + b[:, 0], 0)
+            output_signals = unsqueeze(self.activate(w[:, 1] * signals + b[:, 1], 1), dim=2)
+        else:  # self.t in ["coherent-loop", "incoherent-loop"]:
+            assert input_signals.size()[-1] == 2
+            signals = self.activate(self.aggregate(w[:, 0] * input_signals[..., 0],
+                                                   input_signals[..., 1].expand(len(w), -1), 0) + b[:, 0], 0)
+            values = self.aggregate(w[:, 1] * input_signals[..., 0], w[:, 2] * signals, 1)
+            output_signals = unsqueeze(self.activate(values + b[:, 1], 1), dim=2)
+
+        # normalize each landscape independently, in the same way as "NeuralMotif.forward".
+        maximum_values = amax(output_signals, dim=1, keepdim=True)
+        minimum_values = amin(output_signals, dim=1, keepdim=True)
+        ranges = maximum_values - minimum_values
+        if self.t != "fork":
+            flat_flags = ranges < 1e-12
+            flat_signals = output_signals - maximum_values
+        else:
+            flat_flags = ranges < 1e-10
+            flat_signals = output_signals - mean(output_signals, dim=1, keepdim=True)
+
+        # the safe denominator avoids the invalid gradients from the discarded branch.
+        ranges = where(flat_flags, ones_like(ranges), ranges)
+        normalized_signals = ((output_signals - minimum_values) / ranges - 0.5) * 2.0
+
+        return where(flat_flags, flat_signals, normalized_signals)
+
+    def activate(self,
+                 values: Tensor,
+                 activate_index: int) \
+            -> Tensor:
+        """
+        Forward propagate through activating.
+
+        :param values: input values.
+        :type values: torch.Tensor
+
+        :param activate_index: index of activations.
+        :type activate_index: int
+
+        :return: output values.
+        :rtype: torch.Tensor
+        """
+        if self.a[activate_index] == "tanh":
+            return tanh(values)
+        elif self.a[activate_index] == "sigmoid":
+            return sigmoid(values)
+        elif self.a[activate_index] == "relu":
+            return relu(values)
+        else:
+            raise ValueError("No such activation function type!")
+
+    def aggregate(self,
+                  values_1: Tensor,
+                  values_2: Tensor,
+                  aggregate_index: int) \
+            -> Tensor:
+        """
+        Forward propagate through aggregating two groups of values.
+
+        :param values_1: input values from the first source.
+        :type values_1: torch.Tensor
+
+        :param values_2: input values from the second source.
+        :type values_2: torch.Tensor
+
+        :param aggregate_index: index of aggregations.
+        :type aggregate_index: int
+
+        :return: output values.
+        :rtype: torch.Tensor
+        """
+        if self.g[aggregate_index] == "sum":
+            return values_1 + values_2
+        elif self.g[aggregate_index] == "max":
+            return maximum(values_1, values_2)
+        else:
+            raise ValueError("No such aggregation function type!")
+
+    def values(self) \
+            -> ndarray:
+        """
+        Obtain the weight and bias values of all motifs in the batch.
+
+        :return: parameter matrix with shape (batch, weight number + bias number).
+        :rtype: numpy.ndarray
+        """
+        return cat((self.weights, self.biases), dim=1).detach().numpy()
+
+    def motif(self,
+              index: int) \
+            -> NeuralMotif:
+        """
+        Obtain the selected motif in the batch as an independent neural network motif.
+
+        :param index: index of the selected motif.
+        :type index: int
+
+        :return: selected motif.
+        :rtype: effect.networks.NeuralMotif
+        """
+        return NeuralMotif(motif_type=self.t, motif_index=self.i, activations=self.a, aggregations=self.g,
+                           weights=self.weights[index].tolist(), biases=self.biases[index].tolist(),
+                           weight_bound=self.weight_bound, bias_bound=self.bias_bound)
+
+    def restrict(self):
+        """
+        Restrict the weights and biases of all motifs into their bounds.
+        """
+        with no_grad():
+            self.weights.copy_(max(min(self.weights, self.upper_weights), self.lower_weights))
+            self.biases.clamp_(self.bias_bound[0], self.bias_bound[1])
+
+    def reset(self,
+              weights: Union[Tensor, ndarray, list, None] = None,
+              biases: Union[Tensor, ndarray, list, None] = None,
+              batch_size: Union[int, None] = None):
+        """
+        Reset the weight and bias values.
+
+        :param weights: established weight values with shape (batch, weight number).
+        :type weights: torch.Tensor, numpy.ndarray, list, or None
+
+        :param biases: established bias values with shape (batch, bias number).
+        :type biases: torch.Tensor, numpy.ndarray, list, or None
+
+        :param batch_size: number of motifs, only required if neither weights nor biases are established.
+        :type batch_size: int or None
+        """
+        if weights is not None:
+            weights = as_tensor(weights, dtype=float32).reshape(len(weights), -1)
+            batch_size = len(weights)
+        if biases is not None:
+            biases = as_tensor(biases, dtype=float32).reshape(len(biases), -1)
+            batch_size = len(biases)
+        if batch_size is None:
+            raise ValueError("the batch size is required if neither weights nor biases are established.")
+
+        if weights is not None:
+            if len(weights) != batch_size or weights.size()[1] != len(self.lower_weights):
+                raise ValueError("the shape of weights should be "
+                                 + str((batch_size, len(self.lower_weights))) + " got " + str(tuple(weights.size())))
+            if any(weights < self.lower_weights) or any(weights > self.upper_weights):
+                raise ValueError("the inputted weights are wrong, they need to meet the established constraints!")
+        else:
+            weights = self.lower_weights + (self.upper_weights - self.lower_weights) * rand(batch_size,
+                                                                                            len(self.lower_weights))
+
+        if biases is not None:
+            if len(biases) != batch_size or biases.size()[1] != self.bias_size:
+                raise ValueError("the shape of biases should be "
+                                 + str((batch_size, self.bias_size)) + " got " + str(tuple(biases.size())))
+        else:
+            biases = self.bias_bound[0] + (self.bias_bound[1] - self.bias_bound[0]) * rand(batch_size, self.bias_size)
+
+        self.weights = nn.Parameter(data=weights.clone(), requires_grad=True)
+        self.biases = nn.Parameter(data=biases.clone(), requires_grad=True)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __str__(self):
+        return "<BatchedNeuralMotif " + self.t.replace("-", " ") + " " + str(self.i) + " with " + str(len(self)) + \
+            " motifs, activations " + str(list(self.a)) + " and aggregations " + str(list(self.g)) + ">"
+
+
+class MotifTrajectory(object):
+
+    def __init__(self,
+                 length: int,
+                 slot_number: int = 1):
+        """
+        Initialize the trajectory of neural network motifs during training.
+
+        Only the weight and bias values of the recorded motifs are stored in a preallocated array,
+        and the motifs are rebuilt on demand.
+
+        :param length: maximum number of records.
+        :type length: int
+
+        :param slot_number: number of motifs in each record, e.g. 2 for the pairs of escape motif and catch motif.
+        :type slot_number: int
+        """
+        self.length, self.slot_number, self.size = length, slot_number, 0
+        self.structures, self.structure_indices, self.values = [], None, None
+
+    def record(self,
+               *motifs: NeuralMotif):
+        """
+        Record the current weight and bias values of the motifs.
+
+        :param motifs: recorded motifs, the number of which is the slot number.
+        :type motifs: effect.networks.NeuralMotif
+        """
+        if len(motifs) != self.slot_number:
+            raise ValueError("the number of motifs should be "
+                             + str(self.slot_number) + " got " + str(len(motifs)) + ".")
+        if self.size == self.length:
+            raise ValueError("the trajectory is full!")
+
+        parameters = [[weight.value() for weight in motif.w] + [bias.value() for bias in motif.b] for motif in motifs]
+        if self.values is None:
+            self.allocate(width=sorted([len(values) for values in parameters])[-1])
+
+        for slot, (motif, values) in enumerate(zip(motifs, parameters)):
+            self.store(self.size, slot, motif, values)
+
+        self.size += 1
+
+    def extend(self,
+               motif: NeuralMotif,
+               values: ndarray):
+        """
+        Record the weight and bias values of a motif structure for several steps at once.
+
+        :param motif: motif providing the structure of the recorded values.
+        :type motif: effect.networks.NeuralMotif
+
+        :param values: weight and bias values with shape (step number, weight number + bias number).
+        :type values: numpy.ndarray
+        """
+        if self.slot_number != 1:
+            raise ValueError("only the trajectory with one slot can be extended!")
+        if self.size + len(values) > self.length:
+            raise ValueError("the trajectory is full!")
+
+        if self.values is None:
+            self.allocate(width=values.shape[1])
+
+        for parameters in values:
+            self.store(self.size, 0, motif, parameters)
+            self.size += 1
+
+    def allocate(self,
+                 width: int):
+        """
+        Allocate the arrays of the records.
+
+        :param width: maximum number of parameters in each motif.
+        :type width: int
+        """
+        self.values = full(shape=(self.length, self.slot_number, width), fill_value=nan)
+        self.structure_indices = full(shape=(self.length, self.slot_number), fill_value=-1)
+
+    def store(self,
+              index: int,
+              slot: int,
+              motif: NeuralMotif,
+              values: Union[list, ndarray]):
+        """
+        Store the weight and bias values of a motif.
+
+        :param index: index of the record.
+        :type index: int
+
+        :param slot: slot of the motif in the record.
+        :type slot: int
+
+        :param motif: motif providing the structure of the recorded values.
+        :type motif: effect.networks.NeuralMotif
+
+        :param values: weight and bias values.
+        :type values: list or numpy.ndarray
+        """
+        if len(values) > self.values.shape[2]:
+            raise ValueError("the number of parameters should be at most "
+                             + str(self.values.shape[2]) + " got " + str(len(values)) + ".")
+
+        structure = (motif.t, motif.i, tuple(motif.a), tuple(motif.g), len(motif.w),
+                     tuple(motif.weight_bound), tuple(motif.bias_bound))
+        if structure not in self.structures:
+            self.structures.append(structure)
+        self.structure_indices[index, slot] = self.structures.index(structure)
+        self.values[index, slot, :len(values)] = values
+
+    def motif(self,
+              index: int,
+              slot: int = 0) \
+            -> NeuralMotif:
+        """
+        Rebuild the recorded motif.
+
+        :param index: index of the record.
+        :type index: int
+
+        :param slot: slot of the motif in the record.
+        :type slot: int
+
+        :return: recorded motif.
+        :rtype: effect.networks.NeuralMotif
+        """
+        motif_type, motif_index, activations, aggregations, weight_number, weight_bound, bias_bound = \
+            self.structures[self.structure_indices[index, slot]]
+        _, bias_size = obtain_motif_structure(motif_type, motif_index)
+        values = self.values[index, slot]
+        return NeuralMotif(motif_type=motif_type, motif_index=motif_index,
+                           activations=list(activations), aggregations=list(aggregations),
+                           weights=values[:weight_number].tolist(),
+                           biases=values[weight_number: weight_number + bias_size].tolist(),
+                           weight_bound=weight_bound, bias_bound=bias_bound)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[location] for location in range(*index.indices(self.size))]
+
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("trajectory index out of range.")
+
+        if self.slot_number == 1:
+            return self.motif(index)
+
+        return tuple([self.motif(index, slot) for slot in range(self.slot_number)])
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield self[index]
+
+    def __len__(self):
+        return self.size
@@ -3,13 +3,17 @@
 @Description : Data processing related to neural motif
 """
 from itertools import product
-from numpy import ndarray, array, zeros, ones, expand_dims, vstack, all
-from numpy import min, mean, max, abs, sum, sqrt, power, cumproduct, gradient, linalg
-from torch import Tensor, cat, linspace, meshgrid, unsqueeze, squeeze
+from os import path
+from numpy import ndarray, array, zeros, ones, expand_dims, arange, unravel_index, where, isnan, nan
+from numpy import full, inf, matmul, minimum, maximum, stack
+from numpy.lib.format import open_memmap
+from numpy import min, mean, max, abs, sum, sqrt, power, cumproduct, gradient
+from torch import Tensor, tensor, cat, linspace, meshgrid, unsqueeze, no_grad
 from typing import Tuple, Union
 
 from effect import Monitor
-from effect.networks import NeuralMotif
+from effect.networks import NeuralMotif, BatchedNeuralMotif
+from effect.neighbors import LandscapeLibrary
 
 
 def prepare_data(value_range: tuple,
@@ -171,6 +175,55 @@ def calculate_landscape(value_range: tuple,
     return motif(input_data).reshape(points, points).detach().numpy()
 
 
+def calculate_landscapes(value_range: tuple,
+                         points: int,
+                         motifs: BatchedNeuralMotif) \
+        -> ndarray:
+    """
+    Calculate the output landscapes of a batch of motifs in one forward propagation.
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: number of equidistant sampling in the definition field.
+    :type points: int
+
+    :param motifs: batch of 3-node network motifs in the artificial neural network.
+    :type motifs: effect.networks.BatchedNeuralMotif
+
+    :return: output landscapes with shape (batch, points, points).
+    :rtype: numpy.ndarray
+    """
+    if len(value_range) == 2:
+        input_data = prepare_data(value_range=value_range, points=points)
+    elif len(value_range) == 4:
+        input_data = prepare_data_flexible(value_range_x=value_range[:2], value_range_y=value_range[2:], points=points)
+    else:
+        raise ValueError("Input value range must be 2 or 4.")
+
+    with no_grad():
+        return motifs(input_data).reshape(len(motifs), points, points).numpy()
+
+
+def obtain_parameters(parameter_groups: Union[tuple, list],
+                      locations: ndarray) \
+        -> ndarray:
+    """
+    Obtain the parameter combinations at the given locations of the Cartesian product of the parameter groups.
+
+    :param parameter_groups: used parameter value groups (weight groups followed by bias groups).
+    :type parameter_groups: tuple or list
+
+    :param locations: locations of the combinations, in the order of "itertools.product".
+    :type locations: numpy.ndarray
+
+    :return: parameter combinations with shape (location number, group number).
+    :rtype: numpy.ndarray
+    """
+    indices = unravel_index(locations, tuple([len(group) for group in parameter_groups]))
+    return array([array(group)[index] for group, index in zip(parameter_groups, indices)]).T
+
+
 def calculate_values(value_range: tuple,
                      points: int,
                      motif: NeuralMotif) \
@@ -204,10 +257,14 @@ def calculate_values(value_range: tuple,
 
 def calculate_gradients(value_range: tuple,
                         points: int,
-                        motif: NeuralMotif) \
+                        motif: Union[NeuralMotif, BatchedNeuralMotif]) \
         -> ndarray:
     """
-    Calculate the gradient matrix of the selected motif.
+    Calculate the gradient matrix of the selected motif (or the gradient matrices of a batch of motifs).
+
+    Each normalized output depends on its own input and the extreme outputs used for normalization,
+    so all the gradients are obtained from one backward propagation of the output sum.
+    The extreme outputs are fixed at the normalized boundary, so their gradients are zero.
 
     :param value_range: definition field of two input signals.
     :type value_range: tuple
@@ -215,24 +272,28 @@ def calculate_gradients(value_range: tuple,
     :param points: number of equidistant sampling in the definition field.
     :type points: int
 
-    :param motif: 3-node network motif in the artificial neural network.
-    :type motif: effect.networks.NeuralMotif
+    :param motif: 3-node network motif or batch of 3-node network motifs in the artificial neural network.
+    :type motif: effect.networks.NeuralMotif or effect.networks.BatchedNeuralMotif
 
-    :return: gradient matrix.
+    :return: gradient matrix with shape (points, points) or gradient matrices with shape (batch, points, points).
     :rtype: numpy.ndarray
     """
     sources = prepare_data(value_range=value_range, points=points)
+    if isinstance(motif, BatchedNeuralMotif):  # each motif owns its inputs, so the gradients are not mixed.
+        sources = sources.expand(len(motif), -1, -1).clone()
     sources.requires_grad = True
     targets = motif(sources)
-    gradients = zeros(shape=(points ** 2,))
+    targets.sum().backward()
 
-    for index in range(points ** 2):
-        # noinspection PyArgumentList
-        squeeze(targets[index]).backward(retain_graph=True)
-        values = sources.grad[index].detach().numpy()
-        gradients[index] = sqrt(sum(values ** 2))
+    gradients = sqrt(sum(sources.grad.detach().numpy() ** 2, axis=-1))
+    outputs = targets.detach().numpy()[..., 0]
+    upper_values, lower_values = max(outputs, axis=-1, keepdims=True), min(outputs, axis=-1, keepdims=True)
+    # the cross gradients through the normalization only reach the extreme outputs, where the gradients are zero.
+    extreme_flags = outputs == upper_values
+    extreme_flags |= (outputs == lower_values) & (upper_values - lower_values >= 1e-12)
+    gradients[extreme_flags] = 0.0
 
-    return gradients.reshape(points, points)
+    return gradients.reshape(gradients.shape[:-1] + (points, points))
 
 
 def detect_curvature_feature(landscape: ndarray,
@@ -241,36 +302,56 @@ def detect_curvature_feature(landscape: ndarray,
     """
     Detect the curvature feature of a given landscape.
 
-    :param landscape: output signal landscape.
+    :param landscape: output signal landscape, or landscapes with shape (number, points, points).
     :type landscape: numpy.ndarray
 
     :param interval: interval between each cell in landscape.
     :type interval: float
 
-    :return: concavity information.
+    :return: concavity information (+1 for convex, -1 for concave, and 0 for saddle).
     :rtype: numpy.ndarray
     """
+    convex_flags, concave_flags, _, _ = classify_curvature_features(landscape, interval)
+    return convex_flags.astype(float) - concave_flags.astype(float)
+
+
+def classify_curvature_features(landscapes: ndarray,
+                                interval: float) \
+        -> Tuple[ndarray, ndarray, ndarray, ndarray]:
+    """
+    Classify the curvature feature of each cell in the given landscapes.
+
+    The Hessian matrix of each cell is a symmetric 2x2 matrix,
+    so the signs of its eigenvalues are obtained from the trace and the determinant in the closed form.
+
+    :param landscapes: output signal landscape, or landscapes with shape (number, points, points).
+    :type landscapes: numpy.ndarray
+
+    :param interval: interval between each cell in landscape.
+    :type interval: float
+
+    :return: convex flags, concave flags, saddle flags, and counts of (convex, concave, saddle) cells.
+    :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray
+    """
     # calculate hessian matrix.
-    gradient_x, gradient_y = gradient(landscape, interval)
-    gradient_xx, gradient_xy = gradient(gradient_x, interval)
-    gradient_yx, gradient_yy = gradient(gradient_y, interval)
+    gradient_x, gradient_y = gradient(landscapes, interval, axis=(-2, -1))
+    gradient_xx, gradient_xy = gradient(gradient_x, interval, axis=(-2, -1))
+    gradient_yx, gradient_yy = gradient(gradient_y, interval, axis=(-2, -1))
     hessian_xx = gradient_xx
     hessian_xy = 0.5 * (gradient_xy + gradient_yx)
     hessian_yy = gradient_yy
 
-    # detect concavity of the landscape.
-    concavity_matrix = zeros(shape=landscape.shape)
-    for index_1 in range(landscape.shape[0]):
-        for index_2 in range(landscape.shape[1]):
-            hessian_matrix = array([[hessian_xx[index_1, index_2], hessian_xy[index_1, index_2]],
-                                    [hessian_xy[index_1, index_2], hessian_yy[index_1, index_2]]])
-            eigenvalues = linalg.eigvals(hessian_matrix)
-            if all(eigenvalues <= 0):
-                concavity_matrix[index_1, index_2] = +1  # convex
-            elif all(eigenvalues >= 0):
-                concavity_matrix[index_1, index_2] = -1  # concave
+    # the eigenvalues of the symmetric matrix share the sign if the determinant is non-negative,
+    # and the sign is the one of the trace.
+    traces = hessian_xx + hessian_yy
+    determinants = hessian_xx * hessian_yy - power(hessian_xy, 2)
+    convex_flags = (determinants >= 0) & (traces <= 0)  # all the eigenvalues are non-positive.
+    concave_flags = (determinants >= 0) & (traces >= 0) & ~convex_flags  # all the eigenvalues are non-negative.
+    saddle_flags = ~(convex_flags | concave_flags)
+
+    counts = stack([sum(flags, axis=(-2, -1)) for flags in [convex_flags, concave_flags, saddle_flags]], axis=-1)
 
-    return concavity_matrix
+    return convex_flags, concave_flags, saddle_flags, counts
 
 
 def generate_motifs(motif_type: str,
@@ -281,11 +362,15 @@ def generate_motifs(motif_type: str,
                     bias_groups: Union[tuple, list],
                     value_range: tuple,
                     points: int,
-                    minimum_difference=None) \
+                    minimum_difference=None,
+                    batch_size: int = 1024) \
         -> Tuple[list, ndarray]:
     """
     Generate qualified motif with specific requirements.
 
+    The candidate landscapes are calculated batch by batch through "effect.networks.BatchedNeuralMotif",
+    and deduplicated one by one through "effect.neighbors.LandscapeLibrary".
+
     :param motif_type: type of motif, i.e. "incoherent-loop", "coherent-loop", or "collider".
     :type motif_type: str
 
@@ -313,33 +398,30 @@ def generate_motifs(motif_type: str,
     :param minimum_difference: minimum difference (L1 loss) between qualified motifs.
     :type minimum_difference: float
 
+    :param batch_size: number of candidate motifs evaluated in one forward propagation.
+    :type batch_size: int
+
     :return: qualified motifs and their corresponding output landscapes.
     :rtype: list, numpy.ndarray
     """
-    signal_groups, saved_motifs, monitor = None, [], Monitor()
-    count, total = 0, int(cumproduct([len(v) for v in weight_groups] + [len(v) for v in bias_groups])[-1])
-    for weights in product(*weight_groups):
-        for biases in product(*bias_groups):
-            count += 1
-            motif = NeuralMotif(motif_type=motif_type, motif_index=motif_index,
-                                activations=activations, aggregations=aggregations,
-                                weights=weights, biases=biases)
-            signals = calculate_landscape(value_range=value_range, points=points, motif=motif)
-            signals = expand_dims(signals.reshape(-1), axis=0)
-            if signal_groups is not None:
-                if minimum_difference is not None:
-                    if min(mean(abs(signal_groups - signals), axis=1)) > minimum_difference:
-                        saved_motifs.append(motif)
-                        signal_groups = vstack((signal_groups, signals))
-                else:
-                    saved_motifs.append(motif)
-                    signal_groups = vstack((signal_groups, signals))
-            else:
-                saved_motifs.append(motif)
-                signal_groups = signals
-            monitor(count, total, extra={"saved": len(saved_motifs)})
-
-    return saved_motifs, signal_groups
+    library, saved_motifs, monitor = LandscapeLibrary(minimum_difference=minimum_difference), [], Monitor()
+    parameter_groups = list(weight_groups) + list(bias_groups)
+    total = int(cumproduct([len(v) for v in parameter_groups])[-1])
+    for start in range(0, total, batch_size):
+        stop = min([start + batch_size, total])
+        values = obtain_parameters(parameter_groups, arange(start, stop))
+        motifs = BatchedNeuralMotif(motif_type=motif_type, motif_index=motif_index,
+                                    activations=activations, aggregations=aggregations,
+                                    weights=values[:, :len(weight_groups)], biases=values[:, len(weight_groups):])
+        signals = calculate_landscapes(value_range=value_range, points=points, motifs=motifs).reshape(stop - start, -1)
+        for parameters in values[library.add(signals)]:
+            saved_motifs.append(NeuralMotif(motif_type=motif_type, motif_index=motif_index,
+                                            activations=activations, aggregations=aggregations,
+                                            weights=tuple(parameters[:len(weight_groups)]),
+                                            biases=tuple(parameters[len(weight_groups):])))
+        monitor(stop, total, extra={"saved": len(saved_motifs)})
+
+    return saved_motifs, library.values()
 
 
 def generate_outputs(motif_type: str,
@@ -350,10 +432,18 @@ def generate_outputs(motif_type: str,
                      bias_groups: Union[tuple, list],
                      value_range: tuple,
                      points: int,
+                     batch_size: int = 10000,
+                     save_paths: Union[tuple, None] = None,
                      verbose: bool = False) \
         -> Tuple[ndarray, ndarray]:
     """
     Generate all output landscapes and the corresponding parameters based on the given parameter domain.
+    The parameter combinations are evaluated batch by batch through "effect.networks.BatchedNeuralMotif".
+
+    If the save paths are given, the parameters and landscapes are streamed batch by batch into two memory-mapped
+    ".npy" files, so that the memory usage is bounded by the batch size. The parameters of a batch are written
+    only after its landscapes have been flushed, therefore the unwritten (NaN) parameters mark where a partly
+    written file resumes.
 
     :param motif_type: type of motif, i.e. "incoherent-loop", "coherent-loop", or "collider".
     :type motif_type: str
@@ -379,37 +469,73 @@ def generate_outputs(motif_type: str,
     :param points: number of equidistant sampling in the definition field.
     :type points: int
 
+    :param batch_size: number of parameter combinations evaluated in one forward propagation.
+    :type batch_size: int
+
+    :param save_paths: paths of ".npy" files to save the parameters and the landscapes if required.
+    :type save_paths: tuple or None
+
     :param verbose: need to show process log.
     :type verbose: bool
 
     :return: parameter list and output signal landscape list.
     :rtype: numpy.ndarray, numpy.ndarray
     """
-    monitor, parameters, landscapes = Monitor(), [], []
-    count, total = 0, int(cumproduct([len(v) for v in weight_groups] + [len(v) for v in bias_groups])[-1])
-    for weights in product(*weight_groups):
-        for biases in product(*bias_groups):
-            count += 1
-            motif = NeuralMotif(motif_type=motif_type, motif_index=motif_index,
-                                activations=activations, aggregations=aggregations,
-                                weights=weights, biases=biases)
-            signals = calculate_landscape(value_range=value_range, points=points, motif=motif)
-            signals = expand_dims(signals.reshape(-1), axis=0)
-            parameters.append([weight.value() for weight in motif.w] + [bias.value() for bias in motif.b])
-            landscapes.append(signals.reshape(-1).tolist())
-            if verbose:
-                monitor(count, total)
+    # the parameters are saved as the values held by the motifs, e.g. the float32 values of the Python floats.
+    monitor = Monitor()
+    parameter_groups = [tensor(group).double().numpy() for group in list(weight_groups) + list(bias_groups)]
+    total = int(cumproduct([len(v) for v in parameter_groups])[-1])
+    shapes = ((total, len(parameter_groups)), (total, points ** 2))
+
+    if save_paths is not None:
+        if path.exists(save_paths[0]) and path.exists(save_paths[1]):
+            parameters, landscapes = open_memmap(save_paths[0], mode="r+"), open_memmap(save_paths[1], mode="r+")
+            if parameters.shape != shapes[0] or landscapes.shape != shapes[1]:
+                raise ValueError("the existing files do not match the given parameter domain!")
+        else:
+            parameters = open_memmap(save_paths[0], mode="w+", dtype=float, shape=shapes[0])
+            landscapes = open_memmap(save_paths[1], mode="w+", dtype=float, shape=shapes[1])
+            parameters[:] = nan
+            parameters.flush()
+
+        unfinished_indices = where(isnan(parameters[:, 0]))[0]
+        begin = int(unfinished_indices[0]) if len(unfinished_indices) > 0 else total
+    else:
+        parameters, landscapes, begin = zeros(shape=shapes[0]), zeros(shape=shapes[1]), 0
+
+    for start in range(begin, total, batch_size):
+        stop = min([start + batch_size, total])
+        values = obtain_parameters(parameter_groups, arange(start, stop))
+        motifs = BatchedNeuralMotif(motif_type=motif_type, motif_index=motif_index,
+                                    activations=activations, aggregations=aggregations,
+                                    weights=values[:, :len(weight_groups)], biases=values[:, len(weight_groups):])
+        landscapes[start: stop] = calculate_landscapes(value_range=value_range, points=points,
+                                                       motifs=motifs).reshape(stop - start, -1)
+        if save_paths is not None:
+            landscapes.flush()
+        parameters[start: stop] = values
+        if save_paths is not None:
+            parameters.flush()
+
+        if verbose:
+            monitor(stop, total)
 
-    return array(parameters), array(landscapes)
+    if save_paths is not None:
+        del parameters, landscapes
+        return open_memmap(save_paths[0], mode="r"), open_memmap(save_paths[1], mode="r")
+
+    return parameters, landscapes
 
 
 def calculate_differences(landscapes_1: ndarray,
                           landscapes_2: Union[ndarray, None] = None,
                           norm_type: str = "L-2",
+                          block_sizes: tuple = (2048, 2048),
                           verbose: bool = False) \
         -> ndarray:
     """
     Calculate norm differences between motif landscapes.
+    The "L-2" differences are calculated by the blocked matrix multiplication in "calculate_squared_differences".
 
     :param landscapes_1: landscapes of given motifs.
     :type landscapes_1: numpy.ndarray
@@ -420,12 +546,19 @@ def calculate_differences(landscapes_1: ndarray,
     :param norm_type: norm type, including "L-1" and "L-2".
     :type norm_type: str
 
+    :param block_sizes: row and column sizes of the blocks for the "L-2" differences.
+    :type block_sizes: tuple
+
     :param verbose: need to show process log.
     :type verbose: bool
 
     :return: differences.
     :rtype: numpy.ndarray
     """
+    if norm_type == "L-2":
+        return calculate_squared_differences(landscapes_1=landscapes_1, landscapes_2=landscapes_2,
+                                             block_sizes=block_sizes, verbose=verbose)
+
     differences, terminal, monitor = -ones(shape=len(landscapes_1)), len(landscapes_1), Monitor()
 
     if landscapes_2 is None:
@@ -438,15 +571,6 @@ def calculate_differences(landscapes_1: ndarray,
                 if verbose:
                     monitor(current + 1, terminal)
 
-        elif norm_type == "L-2":
-            for current, landscape in enumerate(landscapes_1):
-                result = mean(power(landscapes_1 - expand_dims(landscape, axis=0), 2), axis=1)
-                result[current] = max(result) + 1
-                differences[current] = min(result)
-
-                if verbose:
-                    monitor(current + 1, terminal)
-
         else:
             raise ValueError("No such norm type!")
 
@@ -459,15 +583,72 @@ def calculate_differences(landscapes_1: ndarray,
                 if verbose:
                     monitor(current + 1, terminal)
 
-        elif norm_type == "L-2":
-            for current, landscape in enumerate(landscapes_1):
-                result = mean(power(landscapes_2 - expand_dims(landscape, axis=0), 2), axis=1)
-                differences[current] = min(result)
-
-                if verbose:
-                    monitor(current + 1, terminal)
-
         else:
             raise ValueError("No such norm type!")
 
     return differences
+
+
+def calculate_squared_differences(landscapes_1: ndarray,
+                                  landscapes_2: Union[ndarray, None] = None,
+                                  block_sizes: tuple = (2048, 2048),
+                                  verbose: bool = False) \
+        -> ndarray:
+    """
+    Calculate the minimum "L-2" differences (mean squared errors) between motif landscapes.
+
+    The squared error is expanded as ||a - b||^2 = |a|^2 + |b|^2 - 2 a b, so that each pair of blocks is compared
+    through one matrix multiplication, and only the running minimum of each landscape in "landscapes_1" is kept.
+
+    :param landscapes_1: landscapes of given motifs.
+    :type landscapes_1: numpy.ndarray
+
+    :param landscapes_2: other landscapes of given motifs, the landscape itself is excluded if it is None.
+    :type landscapes_2: numpy.ndarray or None
+
+    :param block_sizes: row and column sizes of the blocks.
+    :type block_sizes: tuple
+
+    :param verbose: need to show process log.
+    :type verbose: bool
+
+    :return: differences.
+    :rtype: numpy.ndarray
+    """
+    is_self = landscapes_2 is None
+    if is_self:
+        landscapes_2 = landscapes_1
+
+    (row_size, column_size), monitor = block_sizes, Monitor()
+    row_total, column_total = len(landscapes_1), len(landscapes_2)
+
+    column_norms = zeros(shape=(column_total,))
+    for column_start in range(0, column_total, column_size):
+        columns = array(landscapes_2[column_start: column_start + column_size], dtype=float)
+        column_norms[column_start: column_start + column_size] = sum(power(columns, 2), axis=1)
+
+    differences = zeros(shape=(row_total,))
+    for row_start in range(0, row_total, row_size):
+        row_stop = min([row_start + row_size, row_total])
+        rows = array(landscapes_1[row_start: row_stop], dtype=float)
+        row_norms, minimum_values = sum(power(rows, 2), axis=1), full(shape=(row_stop - row_start,), fill_value=inf)
+
+        for column_start in range(0, column_total, column_size):
+            column_stop = min([column_start + column_size, column_total])
+            columns = array(landscapes_2[column_start: column_stop], dtype=float)
+            block = expand_dims(row_norms, axis=1) + expand_dims(column_norms[column_start: column_stop], axis=0)
+            block -= 2.0 * matmul(rows, columns.T)
+
+            if is_self and row_start < column_stop and column_start < row_stop:  # exclude the landscape itself.
+                locations = arange(max([row_start, column_start]), min([row_stop, column_stop]))
+                block[locations - row_start, locations - column_start] = inf
+
+            minimum_values = minimum(minimum_values, min(block, axis=1))
+
+        # the rounding errors of the expansion may lead to tiny negative values.
+        differences[row_start: row_stop] = maximum(minimum_values, 0.0) / landscapes_1.shape[1]
+
+        if verbose:
+            monitor(row_stop, row_total)
+
+    return differences
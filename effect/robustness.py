@@ -2,8 +2,15 @@
 @Author      : Haoling Zhang
 @Description : Definition of robustness
 """
-from numpy import ndarray, zeros, abs, min, mean, median, max, sqrt, vstack
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from numpy import ndarray, array, zeros, abs, min, median, max, sqrt, vstack, expand_dims, arange, argsort
+from numpy import concatenate, cumsum, bincount, stack, where, add, maximum, minimum, memmap, dtype, load, inf
+from numpy import byte_bounds
+from typing import Tuple
 
+from effect import Monitor
+from effect.gradients import estimate_lipschitz_bound
 from effect.networks import NeuralMotif
 from effect.operations import calculate_landscape
 
@@ -32,28 +39,95 @@ def evaluate_propagation(value_range: tuple,
     :rtype: numpy.ndarray
     """
     output = calculate_landscape(value_range=value_range, points=points, motif=motif)
-    propagation = zeros(shape=(points, points))
 
-    if max(output) - min(output) > 0.0:
-        for index_1 in range(points):
-            for index_2 in range(points):
-                values = ((output[index_1:, index_2:] - output[:points - index_1, :points - index_2]).reshape(-1),
-                          (output[index_1:, :points - index_2] - output[:points - index_1, index_2:]).reshape(-1),
-                          (output[:points - index_1, index_2:] - output[index_1:, :points - index_2]).reshape(-1),
-                          (output[:points - index_1, :points - index_2] - output[index_1:, index_2:]).reshape(-1))
+    return evaluate_propagations(landscapes=expand_dims(output, axis=0), compute_type=compute_type)[0]
+
+
+def evaluate_propagations(landscapes: ndarray,
+                          compute_type: str = "max",
+                          batch_size: int = 64) \
+        -> ndarray:
+    """
+    Evaluate the error propagation of a stack of output landscapes.
+
+    For a row shift "index_1", all the differences between the shifted landscapes are collected in one tensor
+    D[r, x, y] = |output[r + index_1, y] - output[r, x]|, where the shifted differences of the column shift "index_2"
+    are exactly the diagonals of D with the offset +index_2 or -index_2. Hence, the statistics of all column shifts are
+    reduced from D in one pass, instead of stacking four shifted-difference arrays for every pair of shifts.
+
+    :param landscapes: output landscapes with shape (number, points, points).
+    :type landscapes: numpy.ndarray
+
+    :param compute_type: type to evaluating the error propagation, including "max", "mean", "median", and "min".
+    :type compute_type: str
+
+    :param batch_size: number of landscapes evaluated together.
+    :type batch_size: int
+
+    :return: propagation matrices with shape (number, points, points).
+    :rtype: numpy.ndarray
+    """
+    if compute_type not in ["max", "mean", "median", "min"]:
+        raise ValueError("No such computing type!")
+
+    total, points = len(landscapes), landscapes.shape[1]
+
+    propagations = zeros(shape=(total, points, points))
+    for batch_start in range(0, total, batch_size):
+        outputs = array(landscapes[batch_start: batch_start + batch_size], dtype=float)
+        ranges = max(outputs, axis=(1, 2)) - min(outputs, axis=(1, 2))
+
+        # the propagation of a flat landscape is zero.
+        scales = where(ranges > 0.0, 1.0 / where(ranges > 0.0, ranges, 1.0), 0.0)
+        propagations[batch_start: batch_start + len(outputs)] = calculate_shift_statistics(outputs, compute_type) \
+            * expand_dims(scales, axis=(1, 2))
+
+    return propagations
+
+
+def calculate_shift_statistics(outputs: ndarray,
+                               compute_type: str = "max") \
+        -> ndarray:
+    """
+    Calculate the statistics of the absolute differences between the shifted landscapes for all the shifts.
+
+    :param outputs: output landscapes with shape (number, points, points).
+    :type outputs: numpy.ndarray
+
+    :param compute_type: type of statistic, including "max", "mean", "median", and "min".
+    :type compute_type: str
+
+    :return: statistic matrices with shape (number, points, points), indexed by the shifts (index_1, index_2).
+    :rtype: numpy.ndarray
+    """
+    points = outputs.shape[1]
+
+    # group the positions of (x, y) by the column shift |y - x|, the group "index_2" starts from "starts[index_2]".
+    offsets = abs(arange(points).reshape(1, -1) - arange(points).reshape(-1, 1)).reshape(-1)
+    order = argsort(offsets, kind="stable")
+    starts = concatenate(([0], cumsum(bincount(offsets, minlength=points))[:-1]))
+    stops = concatenate((starts[1:], [points ** 2]))
 
-                if compute_type == "max":
-                    propagation[index_1, index_2] = max(abs(vstack(values))) / (max(output) - min(output))
-                elif compute_type == "mean":
-                    propagation[index_1, index_2] = mean(abs(vstack(values))) / (max(output) - min(output))
-                elif compute_type == "median":
-                    propagation[index_1, index_2] = median(abs(vstack(values))) / (max(output) - min(output))
-                elif compute_type == "min":
-                    propagation[index_1, index_2] = min(abs(vstack(values))) / (max(output) - min(output))
-                else:
-                    raise ValueError("No such computing type!")
+    statistics = zeros(shape=(len(outputs), points, points))
+    for index_1 in range(points):
+        rows = points - index_1
+        values = abs(expand_dims(outputs[:, index_1:], axis=2) - expand_dims(outputs[:, :rows], axis=3))
+        values = values.reshape(len(outputs), rows, points ** 2)[:, :, order].transpose(0, 2, 1)
+        values = values.reshape(len(outputs), -1)  # each group occupies a contiguous segment now.
 
-    return propagation
+        if compute_type == "max":
+            statistics[:, index_1] = maximum.reduceat(values, starts * rows, axis=1)
+        elif compute_type == "mean":
+            statistics[:, index_1] = add.reduceat(values, starts * rows, axis=1) / ((stops - starts) * rows)
+        elif compute_type == "median":
+            statistics[:, index_1] = stack([median(values[:, start * rows: stop * rows], axis=1)
+                                            for start, stop in zip(starts, stops)], axis=1)
+        elif compute_type == "min":
+            statistics[:, index_1] = minimum.reduceat(values, starts * rows, axis=1)
+        else:
+            raise ValueError("No such computing type!")
+
+    return statistics
 
 
 def estimate_lipschitz(value_range: tuple,
@@ -109,10 +183,13 @@ def estimate_lipschitz(value_range: tuple,
 def estimate_lipschitz_by_motif(value_range: tuple,
                                 points: int,
                                 motif: NeuralMotif,
-                                norm_type: str = "L-2") \
+                                norm_type: str = "L-2",
+                                method: str = "sampling") \
         -> float:
     """
     Estimate the Lipschitz constant of the selected motif.
+    The "bound" method skips the landscape sampling and returns the upper bound from the closed-form gradients,
+    which includes the rounding margin of the sampled landscape (see "effect.gradients.estimate_lipschitz_bound").
 
     :param value_range: definition field of two input signals.
     :type value_range: tuple
@@ -126,9 +203,217 @@ def estimate_lipschitz_by_motif(value_range: tuple,
     :param norm_type: norm type, including "L-1", "L-2", and "L-inf".
     :type norm_type: str
 
+    :param method: estimating method, including "sampling" and "bound" (see "effect.gradients").
+    :type method: str
+
     :return: estimated Lipschitz constant.
     :rtype: float
     """
+    if method == "bound":
+        return estimate_lipschitz_bound(value_range=value_range, points=points, motif=motif, norm_type=norm_type)
+    elif method != "sampling":
+        raise ValueError("No such estimating method!")
+
     output = calculate_landscape(value_range=value_range, points=points, motif=motif)
 
     return estimate_lipschitz(value_range=value_range, points=points, output=output, norm_type=norm_type)
+
+
+def estimate_lipschitz_batch(value_range: tuple,
+                             points: int,
+                             landscapes: ndarray,
+                             norm_type: str = "L-2",
+                             batch_size: int = 64,
+                             workers: int = 1,
+                             verbose: bool = False) \
+        -> ndarray:
+    """
+    Estimate the Lipschitz constants of a stack of output landscapes, same as "estimate_lipschitz" for each landscape.
+
+    The input differences of all shifts only depend on the value range, the points and the norm type,
+    so they are calculated once, and the output differences of all shifts are reduced batch by batch.
+    If more than one worker is required, the batches are dispatched to a process pool, where the landscapes are
+    read from their memory-mapped file or from a shared memory block rather than being copied to each task.
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: number of equidistant sampling in the definition field.
+    :type points: int
+
+    :param landscapes: output landscapes with shape (number, points, points) or (number, points ** 2).
+    :type landscapes: numpy.ndarray
+
+    :param norm_type: norm type, including "L-1", "L-2", and "L-inf".
+    :type norm_type: str
+
+    :param batch_size: number of landscapes estimated together.
+    :type batch_size: int
+
+    :param workers: number of worker processes.
+    :type workers: int
+
+    :param verbose: need to show process log.
+    :type verbose: bool
+
+    :return: estimated Lipschitz constants.
+    :rtype: numpy.ndarray
+    """
+    input_differences = calculate_input_differences(value_range=value_range, points=points, norm_type=norm_type)
+    landscapes, monitor = landscapes.reshape(len(landscapes), points, points), Monitor()
+    batch_starts, constants = list(range(0, len(landscapes), batch_size)), zeros(shape=(len(landscapes),))
+
+    if workers <= 1:
+        for batch_start in batch_starts:
+            outputs = array(landscapes[batch_start: batch_start + batch_size], dtype=float)
+            constants[batch_start: batch_start + len(outputs)] = estimate_lipschitz_constants(outputs,
+                                                                                              input_differences)
+            if verbose:
+                monitor(batch_start + len(outputs), len(landscapes))
+
+        return constants
+
+    shared_memory = None
+    if is_whole_file(landscapes=landscapes):
+        source = ("file", str(landscapes.filename), landscapes.shape)
+    else:
+        shared_memory = SharedMemory(create=True, size=landscapes.size * dtype(float).itemsize)
+        shared_landscapes = ndarray(shape=landscapes.shape, dtype=float, buffer=shared_memory.buf)
+        for batch_start in batch_starts:
+            shared_landscapes[batch_start: batch_start + batch_size] = landscapes[batch_start: batch_start + batch_size]
+        del shared_landscapes
+        source = ("memory", shared_memory.name, landscapes.shape)
+
+    try:
+        with Pool(processes=workers, initializer=attach_landscapes, initargs=(source,)) as pool:
+            tasks = [(batch_start, batch_size, input_differences) for batch_start in batch_starts]
+            for batch_start, values in pool.imap(estimate_lipschitz_task, tasks):
+                constants[batch_start: batch_start + len(values)] = values
+                if verbose:
+                    monitor(batch_start + len(values), len(landscapes))
+    finally:
+        if shared_memory is not None:
+            shared_memory.close()
+            shared_memory.unlink()
+
+    return constants
+
+
+def calculate_input_differences(value_range: tuple,
+                                points: int,
+                                norm_type: str = "L-2") \
+        -> ndarray:
+    """
+    Calculate the input differences of all the shifts (index_1, index_2) in the definition field.
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: number of equidistant sampling in the definition field.
+    :type points: int
+
+    :param norm_type: norm type, including "L-1", "L-2", and "L-inf".
+    :type norm_type: str
+
+    :return: input differences with shape (points, points), where the zero shift is infinite.
+    :rtype: numpy.ndarray
+    """
+    value_interval = (value_range[1] - value_range[0]) / (points - 1)
+    value_1 = expand_dims(arange(points) * value_interval, axis=1)
+    value_2 = expand_dims(arange(points) * value_interval, axis=0)
+
+    if norm_type == "L-1":
+        input_differences = value_1 + value_2
+    elif norm_type == "L-2":
+        input_differences = sqrt(value_1 ** 2 + value_2 ** 2)
+    elif norm_type == "L-inf":
+        input_differences = maximum(value_1, value_2)
+    else:
+        raise ValueError("No such norm type!")
+
+    input_differences[0, 0] = inf  # the zero shift is ignored.
+
+    return input_differences
+
+
+def estimate_lipschitz_constants(outputs: ndarray,
+                                 input_differences: ndarray) \
+        -> ndarray:
+    """
+    Estimate the Lipschitz constants of a batch of output landscapes through the precomputed input differences.
+
+    :param outputs: output landscapes with shape (number, points, points).
+    :type outputs: numpy.ndarray
+
+    :param input_differences: input differences of all the shifts, see "calculate_input_differences".
+    :type input_differences: numpy.ndarray
+
+    :return: estimated Lipschitz constants.
+    :rtype: numpy.ndarray
+    """
+    constants = max(calculate_shift_statistics(outputs, "max") / input_differences, axis=(1, 2))
+
+    # the Lipschitz constant of a flat landscape is zero.
+    return where(max(outputs, axis=(1, 2)) - min(outputs, axis=(1, 2)) > 0.0, constants, 0.0)
+
+
+worker_landscapes = {}
+
+
+def is_whole_file(landscapes: ndarray) \
+        -> bool:
+    """
+    Check whether the landscapes are the whole memory-mapped array of their file, so the workers can reload the file.
+
+    A view (such as a slice or a reversed array) of the memory-mapped file shares its file name but not its layout,
+    so only the C-contiguous array starting at the same data offset with the same type and size is accepted.
+
+    :param landscapes: landscapes.
+    :type landscapes: numpy.ndarray
+
+    :return: landscapes are the whole array of their file.
+    :rtype: bool
+    """
+    if not isinstance(landscapes, memmap) or landscapes.filename is None or not landscapes.flags.c_contiguous:
+        return False
+
+    root = landscapes
+    while isinstance(root.base, ndarray):
+        root = root.base
+
+    loaded = load(landscapes.filename, mmap_mode="r")
+    return root.offset == loaded.offset and root.dtype == loaded.dtype and root.size == loaded.size \
+        and landscapes.dtype == loaded.dtype and landscapes.size == loaded.size \
+        and byte_bounds(landscapes)[0] == byte_bounds(root)[0]
+
+
+def attach_landscapes(source: tuple):
+    """
+    Attach the landscapes in the worker process.
+
+    :param source: source type ("file" or "memory"), file path or shared memory name, and shape of the landscapes.
+    :type source: tuple
+    """
+    source_type, location, shape = source
+    if source_type == "file":
+        worker_landscapes["data"] = load(location, mmap_mode="r").reshape(shape)
+    else:
+        worker_landscapes["memory"] = SharedMemory(name=location)
+        worker_landscapes["data"] = ndarray(shape=shape, dtype=float, buffer=worker_landscapes["memory"].buf)
+
+
+def estimate_lipschitz_task(task: tuple) \
+        -> Tuple[int, ndarray]:
+    """
+    Estimate the Lipschitz constants of a batch of the attached landscapes in the worker process.
+
+    :param task: start of the batch, size of the batch, and input differences of all the shifts.
+    :type task: tuple
+
+    :return: start of the batch and the estimated Lipschitz constants.
+    :rtype: int, numpy.ndarray
+    """
+    batch_start, batch_size, input_differences = task
+    outputs = array(worker_landscapes["data"][batch_start: batch_start + batch_size], dtype=float)
+
+    return batch_start, estimate_lipschitz_constants(outputs, input_differences)
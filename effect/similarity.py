@@ -3,15 +3,18 @@
 @Description : Definition of similarity
 """
 from copy import deepcopy
-
-from numpy import array, argmin
-from torch import optim, nn
-from typing import Tuple
+from multiprocessing import Pool
+from numpy import ndarray, array, argmin, zeros, full, nan, arange
+from time import perf_counter
+from torch import Tensor, optim, nn, stack, cat, where, eye, clamp, diagonal, diag_embed, linalg, full_like, \
+    zeros_like, int8, float64, no_grad, manual_seed, set_num_threads
+from torch.autograd.functional import jvp
+from typing import Tuple, Union
 from warnings import filterwarnings
 
-from effect import Monitor
-from effect.networks import NeuralMotif
-from effect.operations import prepare_data
+from effect import Monitor, Checkpoint
+from effect.networks import NeuralMotif, BatchedNeuralMotif, MotifTrajectory
+from effect.operations import prepare_data, calculate_landscape
 
 filterwarnings(action="ignore", category=UserWarning)
 
@@ -21,11 +24,20 @@ def execute_escape_processes(motif_pairs: list,
                              points: int,
                              learn_rate: float,
                              thresholds: tuple,
+                             workers: int = 1,
+                             chunk_size: int = 1,
+                             seed: Union[int, None] = None,
+                             checkpoint_path: Union[str, None] = None,
                              verbose: bool = False) \
         -> list:
     """
     Execute the escape process for multiple pairs of an escape motif and several catch motifs.
 
+    Each pair trains its own copies of the motifs, so the independent pairs can be dispatched to a process pool,
+    where each worker uses one thread and the records are collected in the order of the pairs.
+    If a checkpoint is required, the record of each finished pair is appended into the checkpoint file,
+    and the pairs recorded in the file are skipped when the processes are restarted.
+
     :param motif_pairs: list of pairs of source and target motifs.
     :type motif_pairs: list
 
@@ -41,22 +53,37 @@ def execute_escape_processes(motif_pairs: list,
     :param thresholds: maximum iteration of training source motif and target motif.
     :type thresholds: tuple
 
+    :param workers: number of worker processes.
+    :type workers: int
+
+    :param chunk_size: number of pairs dispatched to a worker together.
+    :type chunk_size: int
+
+    :param seed: random seed of the first pair (the seed of each pair is the seed plus its index) if required.
+    :type seed: int or None
+
+    :param checkpoint_path: path of the checkpoint file if required.
+    :type checkpoint_path: str or None
+
     :param verbose: need to show process log.
     :type verbose: bool
 
     :return: records of the escape processes.
     :rtype: list
     """
-    records, monitor = [], Monitor()
-    for sample_index, (escaper, catchers) in enumerate(motif_pairs):
-        record = maximum_minimum_loss_search(value_range=value_range, points=points, learn_rate=learn_rate,
-                                             escaper=escaper, catchers=catchers, thresholds=thresholds)
-        records.append(record)
+    checkpoint = Checkpoint(file_path=checkpoint_path) if checkpoint_path is not None else {}
+    records, monitor = {index: checkpoint[index] for index in range(len(motif_pairs)) if index in checkpoint}, Monitor()
+    tasks = [(sample_index, escaper, catchers, value_range, points, learn_rate, thresholds, seed)
+             for sample_index, (escaper, catchers) in enumerate(motif_pairs) if sample_index not in records]
+    for sample_index, record in dispatch_tasks(execute_escape_task, tasks, workers, chunk_size):
+        records[sample_index] = record
+        if checkpoint_path is not None:
+            checkpoint.append({sample_index: record})
 
         if verbose:
-            monitor(sample_index + 1, len(motif_pairs))
+            monitor(len(records), len(motif_pairs))
 
-    return records
+    return [records[sample_index] for sample_index in range(len(motif_pairs))]
 
 
 def execute_catch_processes(references: list,
@@ -65,10 +92,27 @@ def execute_catch_processes(references: list,
                             points: int,
                             learn_rate: float,
                             threshold: int,
+                            batch_size: int = 64,
+                            window: Union[int, None] = None,
+                            tolerance: float = 1e-4,
+                            target_loss: Union[float, None] = None,
+                            libraries: Union[list, None] = None,
+                            workers: int = 1,
+                            seed: Union[int, None] = None,
+                            checkpoint_path: Union[str, None] = None,
                             verbose: bool = False) \
         -> list:
     """
     Execute the catching process for referenced motifs and several catch motifs.
+    The catch motifs of a batch of referenced motifs are trained as populations,
+    through "population_minimum_loss_search".
+    If the libraries are given, the catch motifs start from the library members closest to each referenced motif
+    (see "seed_catchers"), rather than from their own parameters.
+
+    The batches are independent, so they can be dispatched to a process pool,
+    where each worker uses one thread and the records are collected in the order of the referenced motifs.
+    If a checkpoint is required, the records of each finished batch are appended into the checkpoint file,
+    and the referenced motifs recorded in the file are skipped when the processes are restarted.
 
     :param value_range: definition field of two input signals.
     :type value_range: tuple
@@ -88,30 +132,203 @@ def execute_catch_processes(references: list,
     :param threshold: maximum iteration of training the target motif.
     :type threshold: int
 
+    :param batch_size: number of referenced motifs processed together.
+    :type batch_size: int
+
+    :param window: number of recent iterations to evaluate the relative improvement of loss if required.
+    :type window: int or None
+
+    :param tolerance: minimum relative improvement of loss in the window.
+    :type tolerance: float
+
+    :param target_loss: loss to stop training if required.
+    :type target_loss: float or None
+
+    :param libraries: parameters and landscape index of the landscape library for each catch motif if required.
+    :type libraries: list or None
+
+    :param workers: number of worker processes.
+    :type workers: int
+
+    :param seed: random seed of the first referenced motif (the seed of each is the seed plus its index) if required.
+    :type seed: int or None
+
+    :param checkpoint_path: path of the checkpoint file if required.
+    :type checkpoint_path: str or None
+
     :param verbose: need to show process log.
     :type verbose: bool
 
     :return: records of the catching processes.
     :rtype: list
     """
-    records, monitor = [], Monitor()
-    for sample_index, reference in enumerate(references):
+    checkpoint = Checkpoint(file_path=checkpoint_path) if checkpoint_path is not None else {}
+    records, monitor = {index: checkpoint[index] for index in range(len(references)) if index in checkpoint}, Monitor()
+    indices = [index for index in range(len(references)) if index not in records]
+    tasks = []
+    for start in range(0, len(indices), batch_size):
+        samples = indices[start: start + batch_size]
+        tasks.append((samples, [references[index] for index in samples], catchers, value_range, points,
+                      learn_rate, threshold, (window, tolerance, target_loss), libraries, seed))
+
+    for samples, batch_records in dispatch_tasks(execute_catch_task, tasks, workers, 1):
+        records.update(zip(samples, batch_records))
+        if checkpoint_path is not None:
+            checkpoint.append(dict(zip(samples, batch_records)))
+
+        if verbose:
+            monitor(len(records), len(references))
+
+    return [records[index] for index in range(len(references))]
+
+
+def dispatch_tasks(function,
+                   tasks: list,
+                   workers: int,
+                   chunk_size: int):
+    """
+    Execute the tasks in the current process or in a process pool, and yield their results in order.
+
+    :param function: task function.
+    :type function: callable
+
+    :param tasks: parameters of the tasks.
+    :type tasks: list
+
+    :param workers: number of worker processes.
+    :type workers: int
+
+    :param chunk_size: number of tasks dispatched to a worker together.
+    :type chunk_size: int
+
+    :return: results of the tasks.
+    :rtype: generator
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield function(task)
+    else:
+        with Pool(processes=workers, initializer=set_num_threads, initargs=(1,)) as pool:
+            for result in pool.imap(function, tasks, chunksize=chunk_size):
+                yield result
+
+
+def execute_escape_task(task: tuple) \
+        -> Tuple[int, tuple]:
+    """
+    Execute the escape process of one pair.
+
+    :param task: index of the pair, escape motif, catch motifs, value range, points, learn rate, thresholds, and seed.
+    :type task: tuple
+
+    :return: index of the pair and the record of its escape process.
+    :rtype: int, tuple
+    """
+    sample_index, escaper, catchers, value_range, points, learn_rate, thresholds, seed = task
+    if seed is not None:
+        manual_seed(seed + sample_index)
+
+    # the motifs are trained in place and may be shared by the pairs, so each pair starts from its own copies.
+    escaper, catchers = deepcopy(escaper), [deepcopy(catcher) for catcher in catchers]
+    record = maximum_minimum_loss_search(value_range=value_range, points=points, learn_rate=learn_rate,
+                                         escaper=escaper, catchers=catchers, thresholds=thresholds)
+
+    return sample_index, record
+
+
+def execute_catch_task(task: tuple) \
+        -> Tuple[list, list]:
+    """
+    Execute the catching processes of one batch of referenced motifs.
+
+    :param task: indices of the referenced motifs, referenced motifs, catch motifs, value range, points, learn rate,
+        threshold, convergence criterion (window, tolerance, and target loss), libraries of catch motifs, and seed.
+    :type task: tuple
+
+    :return: indices of the referenced motifs and the records of their catching processes.
+    :rtype: list, list
+    """
+    samples, references, catchers, value_range, points, learn_rate, threshold, criterion, libraries, seed = task
+    escapers = [reference for reference in references for _ in catchers]
+    if libraries is not None:
+        seeded_catchers = seed_catchers(value_range=value_range, points=points, references=references,
+                                        catchers=catchers, libraries=libraries)
+    else:
+        seeded_catchers = [catchers for _ in references]
+
+    # each referenced motif is seeded by its own index, so the records do not depend on the batches.
+    trained_catchers = []
+    for sample_index, reference_catchers in zip(samples, seeded_catchers):
+        if seed is not None:
+            manual_seed(seed + sample_index)
+        trained_catchers += [deepcopy(catcher) for catcher in reference_catchers]
+    trajectories, losses = population_minimum_loss_search(value_range=value_range, points=points,
+                                                          escapers=escapers, catchers=trained_catchers,
+                                                          learn_rate=learn_rate, threshold=threshold,
+                                                          window=criterion[0], tolerance=criterion[1],
+                                                          target_loss=criterion[2])
+    records = []
+    for sample_index in range(len(references)):
         saved_motif, saved_loss = None, None
-        for catcher in catchers:
-            motifs, losses = minimum_loss_search(value_range=value_range, points=points, learn_rate=learn_rate,
-                                                 escaper=reference, catcher=deepcopy(catcher), threshold=threshold)
-            losses = array(losses)
-            location = argmin(losses)
-            motif, loss = motifs[location], losses[location]
-            if saved_loss is None or loss < saved_loss:
-                saved_motif, saved_loss = motif, loss
+        for member in range(sample_index * len(catchers), (sample_index + 1) * len(catchers)):
+            location = argmin(losses[member])
+            if saved_loss is None or losses[member][location] < saved_loss:
+                saved_motif, saved_loss = trajectories[member][location], losses[member][location]
 
         records.append((saved_motif, saved_loss))
 
-        if verbose:
-            monitor(sample_index + 1, len(references))
+    return samples, records
 
-    return records
+
+def seed_catchers(value_range: tuple,
+                  points: int,
+                  references: list,
+                  catchers: list,
+                  libraries: list) \
+        -> list:
+    """
+    Seed the catch motifs of each referenced motif at the library members closest to the referenced landscape.
+
+    The library of a catch motif is the sweep of its structure from "effect.operations.generate_outputs",
+    i.e. the parameters and a "effect.neighbors.LandscapeIndex" of the landscapes,
+    which is sampled in the same value range and points.
+    Starting from the nearest library member, the training spends fewer iterations on finding the right basin.
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: number of equidistant sampling in the definition field.
+    :type points: int
+
+    :param references: source motifs (incoherent loop or coherent loop in this work).
+    :type references: list
+
+    :param catchers: target motifs (collider in this work).
+    :type catchers: list
+
+    :param libraries: parameters and landscape index of the landscape library for each catch motif.
+    :type libraries: list
+
+    :return: seeded catch motifs of each referenced motif with shape (reference number, catcher number).
+    :rtype: list
+    """
+    if len(libraries) != len(catchers):
+        raise ValueError("the number of libraries should be "
+                         + str(len(catchers)) + " got " + str(len(libraries)) + ".")
+
+    landscapes = array([calculate_landscape(value_range=value_range, points=points, motif=reference).reshape(-1)
+                        for reference in references])
+
+    seeded_catchers = [[] for _ in references]
+    for catcher, (parameters, landscape_index) in zip(catchers, libraries):
+        indices, _ = landscape_index.nearest_neighbors(landscapes=landscapes)
+        for reference_catchers, index in zip(seeded_catchers, indices):
+            seeded_catcher = deepcopy(catcher)
+            seeded_catcher.reset(weights=parameters[index, :len(catcher.w)].tolist(),
+                                 biases=parameters[index, len(catcher.w):].tolist())
+            reference_catchers.append(seeded_catcher)
+
+    return seeded_catchers
 
 
 def maximum_minimum_loss_search(value_range: tuple,
@@ -120,10 +337,13 @@ def maximum_minimum_loss_search(value_range: tuple,
                                 catchers: list,
                                 learn_rate: float,
                                 thresholds: tuple,
+                                optimizer_type: str = "Adam",
                                 verbose: bool = False) \
-        -> Tuple[list, list]:
+        -> Tuple[MotifTrajectory, list]:
     """
     Find the maximum-minimum L2 loss (as the representation capacity bound) between source motif and target motifs.
+    The source motif is always trained by the Adam optimizer,
+    and the optimizer of the target motifs is selectable (see "train_population").
 
     :param value_range: definition field of two input signals.
     :type value_range: tuple
@@ -143,16 +363,19 @@ def maximum_minimum_loss_search(value_range: tuple,
     :param thresholds: maximum iteration of training source motif and target motif.
     :type thresholds: tuple
 
+    :param optimizer_type: type of optimizer to train the target motifs, including "Adam", "L-BFGS", and "LM".
+    :type optimizer_type: str
+
     :param verbose: need to show process log.
     :type verbose: bool
 
-    :return: training results (motif sets and their losses during training).
-    :rtype: list, list
+    :return: training results (trajectory of motif pairs and their losses during training).
+    :rtype: effect.networks.MotifTrajectory, list
     """
-    record = {"motifs": [], "losses": []}
+    source_iterations, target_iterations = thresholds
+    record = {"motifs": MotifTrajectory(length=source_iterations, slot_number=2), "losses": []}
     input_signals = prepare_data(value_range=value_range, points=points)
     optimizer, criterion = optim.Adam(escaper.parameters(), lr=learn_rate), nn.MSELoss()
-    source_iterations, target_iterations = thresholds
 
     for iteration in range(source_iterations):
         if verbose:
@@ -161,13 +384,12 @@ def maximum_minimum_loss_search(value_range: tuple,
             print("-" * 80)
             print("We train the target motifs (to approach the source motif) using the gradient descent.")
 
-        target_motifs, target_loss_record = [], []
-        for target_index in range(len(catchers)):
-            motifs, losses = minimum_loss_search(value_range=value_range, points=points, learn_rate=learn_rate,
-                                                 escaper=escaper, catcher=catchers[target_index],
-                                                 threshold=target_iterations)
-            target_motifs.append(motifs[-1])
-            target_loss_record.append(losses[-1])
+        trajectories, losses = population_minimum_loss_search(value_range=value_range, points=points,
+                                                              escapers=[escaper] * len(catchers), catchers=catchers,
+                                                              learn_rate=learn_rate, threshold=target_iterations,
+                                                              optimizer_type=optimizer_type)
+        target_motifs = [trajectory[-1] for trajectory in trajectories]
+        target_loss_record = [float(member_losses[-1]) for member_losses in losses]
 
         choice = argmin(target_loss_record)  # choose the most similar target motif.
         target_motif, target_loss = target_motifs[choice], target_loss_record[choice]
@@ -187,7 +409,7 @@ def maximum_minimum_loss_search(value_range: tuple,
         optimizer.step()
         escaper.restrict()
 
-        record["motifs"].append((deepcopy(escaper), deepcopy(target_motif)))
+        record["motifs"].record(escaper, target_motif)
         record["losses"].append(float(criterion(escaper(input_signals), target_motif(input_signals))))
 
         if verbose:
@@ -203,10 +425,17 @@ def minimum_loss_search(value_range: tuple,
                         escaper: NeuralMotif,
                         catcher: NeuralMotif,
                         learn_rate: float,
-                        threshold: int) \
-        -> Tuple[list, list]:
+                        threshold: int,
+                        window: Union[int, None] = None,
+                        tolerance: float = 1e-4,
+                        target_loss: Union[float, None] = None,
+                        optimizer_type: str = "Adam") \
+        -> Tuple[MotifTrajectory, list]:
     """
     Train the target motif to achieve the source motif and find the minimum L2 loss between the two motifs.
+    The training stops early once it converges (see "detect_convergence"),
+    so the number of recorded losses is the stop iteration.
+    The optimizers other than Adam are provided through "population_minimum_loss_search" with only one member.
 
     :param value_range: definition field of two input signals.
     :type value_range: tuple
@@ -226,10 +455,30 @@ def minimum_loss_search(value_range: tuple,
     :param threshold: maximum iteration of training the target motif.
     :type threshold: int
 
-    :return: training motif_collection (trained motifs and losses during training).
-    :rtype: list, list
+    :param window: number of recent iterations to evaluate the relative improvement of loss if required.
+    :type window: int or None
+
+    :param tolerance: minimum relative improvement of loss in the window.
+    :type tolerance: float
+
+    :param target_loss: loss to stop training if required.
+    :type target_loss: float or None
+
+    :param optimizer_type: type of optimizer to train the target motif, including "Adam", "L-BFGS", and "LM".
+    :type optimizer_type: str
+
+    :return: training motif_collection (trajectory of trained motifs and losses during training).
+    :rtype: effect.networks.MotifTrajectory, list
     """
-    record = {"motifs": [], "losses": []}
+    if optimizer_type != "Adam":
+        trajectories, losses = population_minimum_loss_search(value_range=value_range, points=points,
+                                                              escapers=[escaper], catchers=[catcher],
+                                                              learn_rate=learn_rate, threshold=threshold,
+                                                              window=window, tolerance=tolerance,
+                                                              target_loss=target_loss, optimizer_type=optimizer_type)
+        return trajectories[0], losses[0].tolist()
+
+    record = {"motifs": MotifTrajectory(length=threshold), "losses": []}
     optimizer, criterion = optim.Adam(catcher.parameters(), lr=learn_rate), nn.MSELoss()
 
     input_signals = prepare_data(value_range=value_range, points=points)
@@ -243,7 +492,461 @@ def minimum_loss_search(value_range: tuple,
         optimizer.step()
         catcher.restrict()
 
-        record["motifs"].append(deepcopy(catcher))
+        record["motifs"].record(catcher)
         record["losses"].append(float(loss))
 
+        if detect_convergence(array([record["losses"]]), window, tolerance, target_loss)[0]:
+            break
+
     return record["motifs"], record["losses"]
+
+
+def population_minimum_loss_search(value_range: tuple,
+                                   points: int,
+                                   escapers: list,
+                                   catchers: list,
+                                   learn_rate: float,
+                                   threshold: int,
+                                   window: Union[int, None] = None,
+                                   tolerance: float = 1e-4,
+                                   target_loss: Union[float, None] = None,
+                                   optimizer_type: str = "Adam") \
+        -> Tuple[list, list]:
+    """
+    Train each target motif to achieve its source motif simultaneously,
+    and find the minimum L2 loss between each pair of motifs.
+
+    The target motifs sharing the same structure are trained as one population in "effect.networks.BatchedNeuralMotif",
+    with the summed loss of the members, so that each member obtains the same gradient as in "minimum_loss_search".
+    A parameter reaching its bound stays there until the end of training, in the same way as "minimum_loss_search".
+    Each member drops out of its population once it converges (see "detect_convergence").
+    The available optimizers are described in "train_population".
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: number of equidistant sampling in the definition field.
+    :type points: int
+
+    :param escapers: source motifs as the references (incoherent/coherent loop in this work).
+    :type escapers: list
+
+    :param catchers: target motifs should be trained (collider in this work), which are updated after training.
+    :type catchers: list
+
+    :param learn_rate: learning rate to train each target motif as the source motif.
+    :type learn_rate: float
+
+    :param threshold: maximum iteration of training the target motif.
+    :type threshold: int
+
+    :param window: number of recent iterations to evaluate the relative improvement of loss if required.
+    :type window: int or None
+
+    :param tolerance: minimum relative improvement of loss in the window.
+    :type tolerance: float
+
+    :param target_loss: loss to stop training if required.
+    :type target_loss: float or None
+
+    :param optimizer_type: type of optimizer to train the target motifs, including "Adam", "L-BFGS", and "LM".
+    :type optimizer_type: str
+
+    :return: trajectories of the trained motifs and losses of each catcher during training,
+        where the length of each trajectory (and its losses) is the stop iteration of the catcher.
+    :rtype: list, list
+    """
+    if len(escapers) != len(catchers):
+        raise ValueError("the number of escapers should be " + str(len(catchers)) + " got " + str(len(escapers)) + ".")
+
+    input_signals = prepare_data(value_range=value_range, points=points)
+    source_cache, source_output_signals = {}, []
+    for escaper in escapers:
+        if id(escaper) not in source_cache:
+            source_cache[id(escaper)] = escaper(input_signals).detach()
+        source_output_signals.append(source_cache[id(escaper)])
+
+    groups = {}
+    for index, catcher in enumerate(catchers):
+        structure = (catcher.t, catcher.i, tuple(catcher.a), tuple(catcher.g),
+                     tuple(catcher.weight_bound), tuple(catcher.bias_bound))
+        groups.setdefault(structure, []).append(index)
+
+    trajectories, losses = [None] * len(catchers), [None] * len(catchers)
+    for indices in groups.values():
+        template = catchers[indices[0]]
+        population = BatchedNeuralMotif(motif_type=template.t, motif_index=template.i,
+                                        activations=template.a, aggregations=template.g,
+                                        weights=[[weight.value() for weight in catchers[index].w] for index in indices],
+                                        biases=[[bias.value() for bias in catchers[index].b] for index in indices],
+                                        weight_bound=template.weight_bound, bias_bound=template.bias_bound)
+        targets = stack([source_output_signals[index] for index in indices])
+        values, member_losses, stops = train_population(population, input_signals, targets, learn_rate, threshold,
+                                                        window, tolerance, target_loss, optimizer_type)
+
+        for location, index in enumerate(indices):
+            stop, weight_number = stops[location], len(catchers[index].w)
+            trajectories[index] = MotifTrajectory(length=stop)
+            trajectories[index].extend(catchers[index], values[:stop, location])
+            losses[index] = member_losses[location, :stop]
+            catchers[index].reset(weights=values[stop - 1, location, :weight_number].tolist(),
+                                  biases=values[stop - 1, location, weight_number:].tolist())
+
+    return trajectories, losses
+
+
+def train_population(population: BatchedNeuralMotif,
+                     input_signals: Tensor,
+                     targets: Tensor,
+                     learn_rate: float,
+                     threshold: int,
+                     window: Union[int, None] = None,
+                     tolerance: float = 1e-4,
+                     target_loss: Union[float, None] = None,
+                     optimizer_type: str = "Adam") \
+        -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Train the population of target motifs to achieve their targets,
+    where the converged members drop out of the population.
+
+    The available optimizers are:
+    (1) "Adam", the first-order optimizer with the learning rate, the same as "minimum_loss_search";
+    (2) "L-BFGS", the quasi-Newton optimizer with the strong Wolfe line search on the summed loss of the members;
+    (3) "LM", the bounded Levenberg-Marquardt optimizer of each member (see "levenberg_marquardt_step").
+    The learning rate is only used by the Adam optimizer.
+
+    :param population: population of target motifs.
+    :type population: effect.networks.BatchedNeuralMotif
+
+    :param input_signals: input signals shared by all members.
+    :type input_signals: torch.Tensor
+
+    :param targets: output signals of the source motifs with shape (member number, sample, 1).
+    :type targets: torch.Tensor
+
+    :param learn_rate: learning rate to train each target motif as the source motif.
+    :type learn_rate: float
+
+    :param threshold: maximum iteration of training the target motif.
+    :type threshold: int
+
+    :param window: number of recent iterations to evaluate the relative improvement of loss if required.
+    :type window: int or None
+
+    :param tolerance: minimum relative improvement of loss in the window.
+    :type tolerance: float
+
+    :param target_loss: loss to stop training if required.
+    :type target_loss: float or None
+
+    :param optimizer_type: type of optimizer, including "Adam", "L-BFGS", and "LM".
+    :type optimizer_type: str
+
+    :return: parameter values with shape (threshold, member number, parameter number),
+        losses with shape (member number, threshold) during training, and stop iterations of the members.
+    :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray
+    """
+    if optimizer_type == "Adam":
+        optimizer = optim.Adam([population.weights, population.biases], lr=learn_rate)
+    elif optimizer_type == "L-BFGS":
+        optimizer = optim.LBFGS([population.weights, population.biases], lr=1, max_iter=1,
+                                line_search_fn="strong_wolfe")
+    elif optimizer_type == "LM":
+        optimizer = full_like(population.weights[:, 0], 1e-3, dtype=float64)  # damping factors of the members.
+    else:
+        raise ValueError("No such optimizer type!")
+
+    values = full(shape=(threshold, len(population), population.weights.size()[1] + population.biases.size()[1]),
+                  fill_value=nan)
+    losses = full(shape=(len(population), threshold), fill_value=nan)
+    stops = full(shape=(len(population),), fill_value=threshold)
+    members = arange(len(population))  # original locations of the training members.
+
+    # the parameters reaching their bounds are frozen, like the replaced parameters in "NeuralMotif.restrict".
+    weight_states, bias_states = restrict_population(population)
+
+    for iteration in range(threshold):
+        if optimizer_type == "Adam":
+            member_losses = ((population(input_signals) - targets) ** 2).mean(dim=(1, 2))
+            optimizer.zero_grad()
+            member_losses.sum().backward()
+            optimizer.step()
+            weight_states, bias_states = restrict_population(population, weight_states, bias_states)
+        elif optimizer_type == "L-BFGS":
+            def closure():
+                optimizer.zero_grad()
+                loss = ((population(input_signals) - targets) ** 2).mean(dim=(1, 2)).sum()
+                loss.backward()
+                return loss
+
+            with no_grad():
+                member_losses = ((population(input_signals) - targets) ** 2).mean(dim=(1, 2))
+            optimizer.step(closure)
+            weight_states, bias_states = restrict_population(population, weight_states, bias_states)
+        else:
+            member_losses, optimizer = levenberg_marquardt_step(population, input_signals, targets, optimizer)
+
+        values[iteration, members] = population.values()
+        losses[members, iteration] = member_losses.detach().numpy()
+
+        flags = detect_convergence(losses[members, :iteration + 1], window, tolerance, target_loss)
+        if flags.any():
+            stops[members[flags]] = iteration + 1
+            locations = (~flags).nonzero()[0]
+            if len(locations) == 0:
+                break
+
+            population, optimizer = select_population(population, optimizer, locations)
+            weight_states, bias_states, targets = weight_states[locations], bias_states[locations], targets[locations]
+            members = members[locations]
+
+    return values, losses, stops
+
+
+def levenberg_marquardt_step(population: BatchedNeuralMotif,
+                             input_signals: Tensor,
+                             targets: Tensor,
+                             dampings: Tensor) \
+        -> Tuple[Tensor, Tensor]:
+    """
+    Update each member of the population with one bounded Levenberg-Marquardt step.
+
+    The Jacobian matrix of the residuals is obtained column by column through the Jacobian-vector product,
+    and the damped Gauss-Newton step of each member is projected into the bounds of its parameters.
+    The step is accepted (and the damping factor decreases) only if it reduces the loss of the member,
+    otherwise the parameters are kept and the damping factor increases.
+
+    :param population: population of target motifs.
+    :type population: effect.networks.BatchedNeuralMotif
+
+    :param input_signals: input signals shared by all members.
+    :type input_signals: torch.Tensor
+
+    :param targets: output signals of the source motifs with shape (member number, sample, 1).
+    :type targets: torch.Tensor
+
+    :param dampings: damping factors of the members.
+    :type dampings: torch.Tensor
+
+    :return: losses of the members before the update and the updated damping factors.
+    :rtype: torch.Tensor, torch.Tensor
+    """
+    weights, biases = population.weights.detach(), population.biases.detach()
+    weight_number, parameter_number = weights.size()[1], weights.size()[1] + biases.size()[1]
+
+    def calculate_residuals(candidate_weights, candidate_biases):
+        output_signals = population.propagate(input_signals, candidate_weights, candidate_biases)
+        return (output_signals - targets).flatten(start_dim=1)
+
+    columns, directions = [], eye(parameter_number, dtype=weights.dtype)
+    for index in range(parameter_number):
+        tangent = directions[index].expand(len(weights), -1)
+        residuals, column = jvp(calculate_residuals, (weights, biases),
+                                (tangent[:, :weight_number].contiguous(), tangent[:, weight_number:].contiguous()))
+        columns.append(column)
+
+    jacobians, losses = stack(columns, dim=2).to(float64), (residuals ** 2).mean(dim=1)
+    normals = jacobians.transpose(1, 2) @ jacobians
+    gradients = jacobians.transpose(1, 2) @ residuals.to(float64).unsqueeze(2)
+    scales = diag_embed(diagonal(normals, dim1=1, dim2=2) + 1e-9)  # scaled damping of Marquardt.
+    steps = linalg.solve(normals + dampings[:, None, None] * scales, -gradients)[:, :, 0].to(weights.dtype)
+
+    lower_bounds = cat((population.lower_weights.expand_as(weights),
+                        full_like(biases, population.bias_bound[0])), dim=1)
+    upper_bounds = cat((population.upper_weights.expand_as(weights),
+                        full_like(biases, population.bias_bound[1])), dim=1)
+    candidates = clamp(cat((weights, biases), dim=1) + steps, lower_bounds, upper_bounds)
+
+    with no_grad():
+        candidate_weights, candidate_biases = candidates[:, :weight_number], candidates[:, weight_number:]
+        accepted = (calculate_residuals(candidate_weights, candidate_biases) ** 2).mean(dim=1) < losses
+        population.weights.copy_(where(accepted[:, None], candidate_weights, weights))
+        population.biases.copy_(where(accepted[:, None], candidate_biases, biases))
+
+    dampings = clamp(where(accepted, dampings / 10, dampings * 10), 1e-9, 1e9)
+
+    return losses, dampings
+
+
+def select_population(population: BatchedNeuralMotif,
+                      optimizer: Union[optim.Adam, optim.LBFGS, Tensor],
+                      locations: ndarray) \
+        -> Tuple[BatchedNeuralMotif, Union[optim.Adam, optim.LBFGS, Tensor]]:
+    """
+    Select the members of the population, together with their states in the optimizer.
+
+    :param population: population of target motifs.
+    :type population: effect.networks.BatchedNeuralMotif
+
+    :param optimizer: Adam optimizer, L-BFGS optimizer, or damping factors of the Levenberg-Marquardt optimizer.
+    :type optimizer: torch.optim.Adam or torch.optim.LBFGS or torch.Tensor
+
+    :param locations: locations of the selected members.
+    :type locations: numpy.ndarray
+
+    :return: selected population and its optimizer.
+    :rtype: effect.networks.BatchedNeuralMotif, torch.optim.Adam or torch.optim.LBFGS or torch.Tensor
+    """
+    selected_population = BatchedNeuralMotif(motif_type=population.t, motif_index=population.i,
+                                             activations=population.a, aggregations=population.g,
+                                             weights=population.weights.detach()[locations],
+                                             biases=population.biases.detach()[locations],
+                                             weight_bound=population.weight_bound, bias_bound=population.bias_bound)
+    if isinstance(optimizer, Tensor):
+        return selected_population, optimizer[locations]
+
+    if isinstance(optimizer, optim.LBFGS):
+        # the curvature history belongs to the summed loss of the previous members, so it restarts.
+        selected_optimizer = optim.LBFGS([selected_population.weights, selected_population.biases],
+                                         lr=optimizer.defaults["lr"], max_iter=optimizer.defaults["max_iter"],
+                                         line_search_fn=optimizer.defaults["line_search_fn"])
+        return selected_population, selected_optimizer
+
+    selected_optimizer = optim.Adam([selected_population.weights, selected_population.biases],
+                                    lr=optimizer.defaults["lr"])
+    for parameter, selected_parameter in zip([population.weights, population.biases],
+                                             [selected_population.weights, selected_population.biases]):
+        # the step counter is shared by the members, and the moment estimates belong to each member.
+        selected_optimizer.state[selected_parameter] = {key: value[locations].clone() if value.dim() > 0
+                                                        else value.clone()
+                                                        for key, value in optimizer.state[parameter].items()}
+
+    return selected_population, selected_optimizer
+
+
+def benchmark_optimizers(value_range: tuple,
+                         points: int,
+                         escapers: list,
+                         catchers: list,
+                         learn_rate: float,
+                         threshold: int,
+                         target_loss: float,
+                         optimizer_types: tuple = ("Adam", "L-BFGS", "LM")) \
+        -> dict:
+    """
+    Compare the optimizers by the time to train the target motifs to the target loss.
+
+    Each optimizer trains its own copies of the target motifs through "population_minimum_loss_search",
+    where the training of each target motif stops once its loss reaches the target loss.
+
+    :param value_range: definition field of two input signals.
+    :type value_range: tuple
+
+    :param points: number of equidistant sampling in the definition field.
+    :type points: int
+
+    :param escapers: source motifs as the references (incoherent/coherent loop in this work).
+    :type escapers: list
+
+    :param catchers: target motifs should be trained (collider in this work), which are not changed.
+    :type catchers: list
+
+    :param learn_rate: learning rate of the Adam optimizer.
+    :type learn_rate: float
+
+    :param threshold: maximum iteration of training the target motif.
+    :type threshold: int
+
+    :param target_loss: loss to stop training.
+    :type target_loss: float
+
+    :param optimizer_types: types of the compared optimizers.
+    :type optimizer_types: tuple
+
+    :return: results of each optimizer, including the elapsed time (second), the ratio of target motifs reaching
+        the target loss, the average stop iteration, and the average minimum loss of the target motifs.
+    :rtype: dict
+    """
+    results = {}
+    for optimizer_type in optimizer_types:
+        trained_catchers = [deepcopy(catcher) for catcher in catchers]
+        start_time = perf_counter()
+        _, losses = population_minimum_loss_search(value_range=value_range, points=points,
+                                                   escapers=escapers, catchers=trained_catchers,
+                                                   learn_rate=learn_rate, threshold=threshold,
+                                                   target_loss=target_loss, optimizer_type=optimizer_type)
+        elapsed_time = perf_counter() - start_time
+        minimum_losses = array([member_losses.min() for member_losses in losses])
+        results[optimizer_type] = {"time": elapsed_time,
+                                   "reached": float((minimum_losses <= target_loss).mean()),
+                                   "iterations": float(array([len(member_losses) for member_losses in losses]).mean()),
+                                   "loss": float(minimum_losses.mean())}
+
+    return results
+
+
+def detect_convergence(losses: ndarray,
+                       window: Union[int, None] = None,
+                       tolerance: float = 1e-4,
+                       target_loss: Union[float, None] = None) \
+        -> ndarray:
+    """
+    Detect whether the training of each motif converges.
+
+    The training converges if the latest loss is no more than the target loss,
+    or the relative improvement of the minimum loss in the latest window is no more than the tolerance.
+
+    :param losses: losses during training with shape (motif number, iteration).
+    :type losses: numpy.ndarray
+
+    :param window: number of recent iterations to evaluate the relative improvement of loss if required.
+    :type window: int or None
+
+    :param tolerance: minimum relative improvement of loss in the window.
+    :type tolerance: float
+
+    :param target_loss: loss to stop training if required.
+    :type target_loss: float or None
+
+    :return: convergence flags of the motifs.
+    :rtype: numpy.ndarray
+    """
+    flags = zeros(shape=(len(losses),), dtype=bool)
+    if target_loss is not None:
+        flags |= losses[:, -1] <= target_loss
+    if window is not None and losses.shape[1] > window:
+        previous_losses, current_losses = losses[:, :-window].min(axis=1), losses.min(axis=1)
+        flags |= previous_losses - current_losses <= tolerance * previous_losses
+
+    return flags
+
+
+def restrict_population(population: BatchedNeuralMotif,
+                        weight_states: Union[Tensor, None] = None,
+                        bias_states: Union[Tensor, None] = None) \
+        -> Tuple[Tensor, Tensor]:
+    """
+    Restrict the population of target motifs, where the parameters reaching their bounds are frozen at the bounds.
+
+    :param population: population of target motifs.
+    :type population: effect.networks.BatchedNeuralMotif
+
+    :param weight_states: states of the weights (-1 / +1 for frozen at the lower / upper bound, 0 for free).
+    :type weight_states: torch.Tensor or None
+
+    :param bias_states: states of the biases (-1 / +1 for frozen at the lower / upper bound, 0 for free).
+    :type bias_states: torch.Tensor or None
+
+    :return: updated states of the weights and the biases.
+    :rtype: torch.Tensor, torch.Tensor
+    """
+    weights, biases = population.weights, population.biases
+    lower_weights = population.lower_weights.expand_as(weights)
+    upper_weights = population.upper_weights.expand_as(weights)
+    lower_biases = full_like(biases, population.bias_bound[0])
+    upper_biases = full_like(biases, population.bias_bound[1])
+
+    if weight_states is None:
+        weight_states, bias_states = zeros_like(weights, dtype=int8), zeros_like(biases, dtype=int8)
+
+    with no_grad():
+        # the same conditions as "RestrictedWeight.restrict" and "RestrictedBias.restrict".
+        weight_states = where((weight_states == 0) & (weights < lower_weights), -1, weight_states)
+        weight_states = where((weight_states == 0) & (weights > upper_weights), +1, weight_states)
+        bias_states = where((bias_states == 0) & (biases <= lower_biases), -1, bias_states)
+        bias_states = where((bias_states == 0) & (biases >= upper_biases), +1, bias_states)
+
+        weights.copy_(where(weight_states < 0, lower_weights, where(weight_states > 0, upper_weights, weights)))
+        biases.copy_(where(bias_states < 0, lower_biases, where(bias_states > 0, upper_biases, biases)))
+
+    return weight_states, bias_states
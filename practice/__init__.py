@@ -1,5 +1,6 @@
 from practice.agent import DefaultAgent, NEATAgent, create_agent_config, train_and_evaluate, train, evaluate
-from practice.task import GymTask, NEATCartPoleTask
+from practice.task import GymTask, BatchCartPoleEnv, NEATCartPoleTask
 from practice.noise import NormNoiseGenerator
 from practice.evolve import AdjustedReproduction, AdjustedGenome, AdjustedGenomeConfig, create_adjacency_matrix
 from practice.motif import acyclic_motifs, collect_motifs, count_motifs_from_adjacency_matrix
+from practice.motif import classify_motif, census_motifs, census_sparse_motifs
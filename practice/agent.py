@@ -7,13 +7,25 @@ from copy import deepcopy
 from neat import Population, reporting, statistics, DefaultGenome
 # noinspection PyPackageRequirements
 from neat import genome, stagnation, reproduction, species, config, nn
-from numpy import ndarray
+# noinspection PyPackageRequirements
+from neat.activations import sigmoid_activation, tanh_activation, relu_activation, identity_activation
+# noinspection PyPackageRequirements
+from neat.aggregations import sum_aggregation
+from math import exp, tanh
+from numpy import ndarray, array, zeros, full, where, clip, argmax, vectorize, frompyfunc
 from typing import Tuple, Union
 
 from practice.evolve import AdjustedGenome, AdjustedReproduction, create_adjacency_matrix
 from practice.motif import count_motifs_from_adjacency_matrix
 from practice.noise import NormNoiseGenerator
 
+# element-wise activations of NEAT, where "math" is still used to keep the same values as the scalar activations.
+math_exp, math_tanh = frompyfunc(exp, 1, 1), frompyfunc(tanh, 1, 1)
+batch_activations = {sigmoid_activation: lambda z: 1.0 / (1.0 + math_exp(-clip(5.0 * z, -60.0, 60.0)).astype(float)),
+                     tanh_activation: lambda z: math_tanh(clip(2.5 * z, -60.0, 60.0)).astype(float),
+                     relu_activation: lambda z: where(z > 0.0, z, 0.0),
+                     identity_activation: lambda z: z}
+
 
 class DefaultAgent(object):
 
@@ -82,6 +94,53 @@ class NEATAgent(DefaultAgent):
 
         return action, outputs
 
+    def work_batch(self,
+                   inputs: ndarray) \
+            -> Tuple[ndarray, ndarray]:
+        """
+        Run the agent through a batch of inputted information, which is the same as "work" for each row.
+
+        The feed-forward network is evaluated node by node over the whole batch,
+        where the activation and aggregation functions of NEAT are applied element-wise to keep the same values.
+        The recurrent network is not supported, since its states depend on the order of the inputted information.
+
+        :param inputs: batch of inputted information.
+        :type inputs: numpy.ndarray
+
+        :return: actions and outputted information of the batch.
+        :rtype: numpy.ndarray, numpy.ndarray
+        """
+        if not isinstance(self.trained_model, nn.FeedForwardNetwork):
+            raise ValueError("No such batch for the recurrent network!")
+
+        # the values of the outputs without evaluation are kept the same as in the network.
+        inputs, values = array(inputs, dtype=float), dict(self.trained_model.values)
+        for index, key in enumerate(self.trained_model.input_nodes):
+            values[key] = inputs[:, index]
+
+        for node, act_func, agg_func, bias, response, links in self.trained_model.node_evals:
+            node_inputs = [values[i] * w for i, w in links]
+            if len(node_inputs) == 0:
+                node_sums = full(shape=(len(inputs),), fill_value=agg_func(node_inputs))
+            elif agg_func is sum_aggregation:  # same order of additions as the built-in "sum" on the scalars.
+                node_sums = sum(node_inputs)
+            else:
+                node_sums = array([agg_func(list(column)) for column in zip(*node_inputs)])
+            if act_func in batch_activations:
+                values[node] = batch_activations[act_func](bias + response * node_sums)
+            else:
+                values[node] = vectorize(act_func, otypes=[float])(bias + response * node_sums)
+
+        outputs = zeros(shape=(len(inputs), len(self.trained_model.output_nodes)))
+        for index, key in enumerate(self.trained_model.output_nodes):
+            outputs[:, index] = values[key]
+        if self.action_handle is argmax:  # the first maximum of each row.
+            actions = argmax(outputs, axis=1)
+        else:
+            actions = array([self.action_handle(output) for output in outputs])
+
+        return actions, outputs
+
     def get_fitness(self) \
             -> float:
         """
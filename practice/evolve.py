@@ -13,18 +13,43 @@ from neat.aggregations import AggregationFunctionSet
 # noinspection PyPackageRequirements
 from neat.genome import DefaultGenomeConfig
 # noinspection PyPackageRequirements
+from neat.graphs import creates_cycle
+# noinspection PyPackageRequirements
 from neat.math_util import mean
 # noinspection PyPackageRequirements
 from neat.six_util import iteritems, itervalues
-from numpy import ndarray, zeros, array, min, max, ceil
+from numpy import ndarray, zeros, array, min, max, ceil, sign
 from random import choice
+from scipy.sparse import csr_matrix
 from typing import Union
 
-from practice.motif import detect_motifs_from_adjacency_matrix
+from practice.motif import canonical_table
+from practice.motif import create_forbidden_table, detect_forbidden_motifs
+
+incoherent_loops = array([[[+0, -1, +1], [+0, +0, +1], [+0, +0, +0]],
+                          [[+0, +1, +1], [+0, +0, -1], [+0, +0, +0]],
+                          [[+0, +1, -1], [+0, +0, +1], [+0, +0, +0]],
+                          [[+0, -1, -1], [+0, +0, -1], [+0, +0, +0]]])
+coherent_loops = array([[[+0, +1, +1], [+0, +0, +1], [+0, +0, +0]],
+                        [[+0, -1, +1], [+0, +0, -1], [+0, +0, +0]],
+                        [[+0, -1, -1], [+0, +0, +1], [+0, +0, +0]],
+                        [[+0, +1, -1], [+0, +0, -1], [+0, +0, +0]]])
+# forbidden flags of the canonical codes for each remove type.
+forbidden_tables = {"i": create_forbidden_table(incoherent_loops),
+                    "c": create_forbidden_table(coherent_loops),
+                    "a": create_forbidden_table(list(incoherent_loops) + list(coherent_loops))}
 
 
 class AdjustedGenome(DefaultGenome):
 
+    def __init__(self,
+                 key: int):
+        # noinspection PyCompatibility
+        super().__init__(key)
+        self.motif_state = None
+        self.avoided_changes = 0  # changes withdrawn by the constructive mutation.
+        self.unmutated_weights = None  # weights before the mutation of the connection genes.
+
     @classmethod
     def parse_config(cls,
                      param_dict: dict):
@@ -32,6 +57,174 @@ class AdjustedGenome(DefaultGenome):
         super().parse_config(param_dict)
         return AdjustedGenomeConfig(param_dict)
 
+    def configure_new(self,
+                      config: DefaultGenomeConfig):
+        # noinspection PyCompatibility
+        super().configure_new(config)
+        self.motif_state = MotifState(config)
+        if self.motif_state.forbidden_table is None:
+            self.motif_state.update(self)
+            return
+
+        # the initial connections creating the selected motifs are not added.
+        for key in sorted(self.connections.keys()):
+            if not self.motif_state.attempt({key: int(sign(self.connections[key].weight))}):
+                del self.connections[key]
+                self.avoided_changes += 1
+
+    def configure_crossover(self,
+                            genome1,
+                            genome2,
+                            config: DefaultGenomeConfig):
+        # noinspection PyCompatibility
+        super().configure_crossover(genome1, genome2, config)
+        # the child inherits the connections of the fitter parent, so only the different connections are updated.
+        parent = genome1 if genome1.fitness > genome2.fitness else genome2
+        if getattr(parent, "motif_state", None) is None:
+            self.motif_state = MotifState(config)
+            self.motif_state.update(self)
+            return
+
+        self.motif_state = parent.motif_state.copy()
+        if self.motif_state.forbidden_table is None:
+            self.motif_state.update(self)
+            return
+
+        # the weights inherited from the other parent keep the signs of the fitter parent if they create the motifs.
+        for key in sorted(self.connections.keys()):
+            if not self.motif_state.attempt({key: int(sign(self.connections[key].weight))}):
+                self.connections[key].weight = parent.connections[key].weight
+                self.avoided_changes += 1
+
+    def mutate(self,
+               config: DefaultGenomeConfig):
+        if self.motif_state is None:
+            self.motif_state = MotifState(config)
+            self.motif_state.update(self)
+
+        if self.motif_state.forbidden_table is None:
+            # noinspection PyCompatibility
+            super().mutate(config)
+            self.motif_state.update(self)
+            return
+
+        # the structural mutations only propose the changes without the selected motifs (see the overrides below),
+        # and the weights flipping to the selected motifs are restored after the mutation of the connection genes.
+        self.unmutated_weights = {key: connect_gene.weight for key, connect_gene in iteritems(self.connections)}
+        # noinspection PyCompatibility
+        super().mutate(config)
+
+        for key in sorted(self.connections.keys()):
+            if not self.motif_state.attempt({key: int(sign(self.connections[key].weight))}):
+                self.connections[key].weight = self.unmutated_weights[key]
+                self.avoided_changes += 1
+        self.unmutated_weights = None
+
+    def mutate_add_node(self,
+                        config: DefaultGenomeConfig):
+        if self.motif_state is None or self.motif_state.forbidden_table is None:
+            # noinspection PyCompatibility
+            return super().mutate_add_node(config)
+
+        if not self.connections:
+            if config.check_structural_mutation_surer():
+                self.mutate_add_connection(config)
+            return
+
+        # Choose a random connection to split, and check the two new connections joining its nodes,
+        # where an unused provisional node is checked first, so that no node key is spent on a withdrawn change.
+        conn_to_split = choice(list(self.connections.values()))
+        i, o = conn_to_split.key
+        provisional_id = max(list(self.nodes.keys()) + list(self.motif_state.neighbors.keys())
+                             + list(self.motif_state.loops)) + 1
+        if not self.motif_state.attempt({(i, provisional_id): 1, (provisional_id, o): int(sign(conn_to_split.weight))}):
+            self.avoided_changes += 1
+            return
+
+        # the new node forms the same motifs as the provisional one, so the changes are moved to it.
+        new_node_id = config.get_new_node_key(self.nodes)
+        self.motif_state.attempt({(i, provisional_id): 0, (provisional_id, o): 0})
+        self.motif_state.attempt({(i, new_node_id): 1, (new_node_id, o): int(sign(conn_to_split.weight))})
+
+        self.nodes[new_node_id] = self.create_node(config, new_node_id)
+        conn_to_split.enabled = False
+        self.add_connection(config, i, new_node_id, 1.0, True)
+        self.add_connection(config, new_node_id, o, conn_to_split.weight, True)
+        if self.unmutated_weights is not None:
+            self.unmutated_weights[(i, new_node_id)] = 1.0
+            self.unmutated_weights[(new_node_id, o)] = conn_to_split.weight
+
+    def mutate_add_connection(self,
+                              config: DefaultGenomeConfig):
+        if self.motif_state is None or self.motif_state.forbidden_table is None:
+            # noinspection PyCompatibility
+            return super().mutate_add_connection(config)
+
+        possible_outputs = list(self.nodes.keys())
+        out_node = choice(possible_outputs)
+        in_node = choice(possible_outputs + config.input_keys)
+
+        # Don't duplicate connections.
+        key = (in_node, out_node)
+        if key in self.connections:
+            if config.check_structural_mutation_surer():
+                self.connections[key].enabled = True
+            return
+
+        # Don't allow connections between two output nodes
+        if in_node in config.output_keys and out_node in config.output_keys:
+            return
+
+        # For feed-forward networks, avoid creating cycles.
+        if config.feed_forward and creates_cycle(list(self.connections.keys()), key):
+            return
+
+        connect_gene = self.create_connection(config, in_node, out_node)
+        if not self.motif_state.attempt({key: int(sign(connect_gene.weight))}):
+            self.avoided_changes += 1
+            return
+
+        self.connections[key] = connect_gene
+        if self.unmutated_weights is not None:
+            self.unmutated_weights[key] = connect_gene.weight
+
+    def mutate_delete_node(self,
+                           config: DefaultGenomeConfig):
+        if self.motif_state is None or self.motif_state.forbidden_table is None:
+            # noinspection PyCompatibility
+            return super().mutate_delete_node(config)
+
+        # Do nothing if there are no non-output nodes.
+        available_nodes = [key for key in self.nodes.keys() if key not in config.output_keys]
+        if not available_nodes:
+            return -1
+
+        del_key = choice(available_nodes)
+        connections_to_delete = [key for key in self.connections.keys() if del_key in key]
+        if not self.motif_state.attempt({key: 0 for key in connections_to_delete}):
+            self.avoided_changes += 1
+            return -1
+
+        for key in connections_to_delete:
+            del self.connections[key]
+
+        del self.nodes[del_key]
+
+        return del_key
+
+    def mutate_delete_connection(self):
+        if self.motif_state is None or self.motif_state.forbidden_table is None:
+            # noinspection PyCompatibility
+            return super().mutate_delete_connection()
+
+        if self.connections:
+            key = choice(list(self.connections.keys()))
+            if not self.motif_state.attempt({key: 0}):
+                self.avoided_changes += 1
+                return
+
+            del self.connections[key]
+
 
 class AdjustedGenomeConfig(DefaultGenomeConfig):
 
@@ -40,6 +233,7 @@ class AdjustedGenomeConfig(DefaultGenomeConfig):
                  params: dict):
         """
         Initialize config by params, add ConfigParameter("remove_type", str)
+        and ConfigParameter("constructive_mutation", bool, "false").
 
         :param params: parameters of adjusted genome.
         :type params: dict
@@ -57,6 +251,7 @@ class AdjustedGenomeConfig(DefaultGenomeConfig):
                         ConfigParameter("num_outputs", int),
                         ConfigParameter("num_hidden", int),
                         ConfigParameter("remove_type", str),
+                        ConfigParameter("constructive_mutation", bool, "false"),
                         ConfigParameter("feed_forward", bool),
                         ConfigParameter("compatibility_disjoint_coefficient", float),
                         ConfigParameter("compatibility_weight_coefficient", float),
@@ -109,8 +304,247 @@ class AdjustedGenomeConfig(DefaultGenomeConfig):
         self.node_indexer = None
 
 
+class MotifState(object):
+
+    def __init__(self,
+                 genome_config: Union[DefaultGenomeConfig, AdjustedGenomeConfig]):
+        """
+        Initialize the motif state of a genome, which tracks the signed adjacency (regardless of "enabled")
+        and the census of rational motifs with 3 nodes, the same as "create_adjacency_matrix" and "census_motifs".
+
+        The state is updated by the changed connections, and only the triads containing both nodes
+        of a changed connection are re-encoded, so an update costs the degree of the nodes rather than a recount.
+
+        If the constructive mutation is required, the forbidden table of the selected motifs is kept,
+        so that the changes creating them can be withdrawn (see "attempt").
+
+        :param genome_config: genome configuration.
+        :type genome_config: neat.genome.DefaultGenomeConfig or practice.evolve.AdjustedGenomeConfig
+        """
+        self.input_keys, self.output_keys = set(genome_config.input_keys), set(genome_config.output_keys)
+        self.signs, self.neighbors, self.loops, self.census = {}, {}, set(), {}
+        self.forbidden_table = None
+        if getattr(genome_config, "constructive_mutation", False):
+            self.forbidden_table = forbidden_tables.get(getattr(genome_config, "remove_type", None))
+
+    def update(self,
+               model_genome: Union[DefaultGenome, AdjustedGenome]) \
+            -> set:
+        """
+        Update the state to the connections of the genome.
+
+        :param model_genome: model of genome.
+        :type model_genome: neat.genome.DefaultGenome or practice.evolve.AdjustedGenome
+
+        :return: keys of the nodes whose connections are changed.
+        :rtype: set
+        """
+        signs = {}
+        for key, connect_gene in iteritems(model_genome.connections):
+            if self.is_retained(key) and connect_gene.weight != 0:
+                signs[key] = int(sign(connect_gene.weight))
+
+        changed_nodes = set()
+        for key in set(signs.keys()) | set(self.signs.keys()):
+            if signs.get(key, 0) != self.signs.get(key, 0):
+                self.apply(key, signs.get(key, 0))
+                changed_nodes.update(key)
+
+        return changed_nodes
+
+    def apply(self,
+              key: tuple,
+              value: int):
+        """
+        Apply the signed value of a connection, and update the census of the affected triads.
+
+        :param key: key of the connection, i.e. (input node key, output node key).
+        :type key: tuple
+
+        :param value: signed value of the connection, where 0 means no connection.
+        :type value: int
+
+        :return: canonical codes of the affected rational triads after the change.
+        :rtype: set
+        """
+        triads = self.obtain_affected_triads(key)
+        for triad in triads:
+            self.count(triad, -1)
+
+        former, latter = key
+        if value != 0:
+            self.signs[key] = value
+            if former == latter:
+                self.loops.add(former)
+            else:
+                self.neighbors.setdefault(former, set()).add(latter)
+                self.neighbors.setdefault(latter, set()).add(former)
+        else:
+            del self.signs[key]
+            if former == latter:
+                self.loops.discard(former)
+            elif (latter, former) not in self.signs:
+                self.neighbors[former].discard(latter)
+                self.neighbors[latter].discard(former)
+
+        codes = set()
+        for triad in (self.obtain_affected_triads(key) | triads):
+            codes.add(self.count(triad, +1))
+        codes.discard(None)
+
+        return codes
+
+    def attempt(self,
+                changes: dict) \
+            -> bool:
+        """
+        Attempt to apply the signed values of the connections,
+        which are withdrawn together if they create any forbidden motif.
+
+        :param changes: signed values of the connections, where 0 means no connection.
+        :type changes: dict
+
+        :return: applied judgement.
+        :rtype: bool
+        """
+        applied, codes = [], set()
+        for key, value in changes.items():
+            if self.is_retained(key) and self.signs.get(key, 0) != value:
+                applied.append((key, self.signs.get(key, 0)))
+                codes.update(self.apply(key, value))
+
+        # the census before the changes is free of the forbidden motifs, so only the affected classes are checked.
+        if self.forbidden_table is not None:
+            for code in codes:
+                if self.forbidden_table[code] and code in self.census:
+                    for key, value in reversed(applied):
+                        self.apply(key, value)
+                    return False
+
+        return True
+
+    def obtain_affected_triads(self,
+                               key: tuple) \
+            -> set:
+        """
+        Obtain the triads containing the nodes of the connection, which can be rational.
+
+        :param key: key of the connection.
+        :type key: tuple
+
+        :return: affected triads, each of which is a sorted tuple of node keys.
+        :rtype: set
+        """
+        former, latter = key
+        if former != latter:
+            # the third node should have a self-loop or an edge to the nodes of the connection.
+            others = self.neighbors.get(former, set()) | self.neighbors.get(latter, set()) | self.loops
+            others = others - {former, latter}
+            return set([tuple(sorted([former, latter, other])) for other in others])
+
+        # the other two nodes of a triad with a self-loop should have edges or self-loops.
+        others = sorted(set([node for node, neighbors in self.neighbors.items() if len(neighbors) > 0]) | self.loops)
+        others = [node for node in others if node != former]
+        return set([tuple(sorted([former, others[index_1], others[index_2]]))
+                    for index_1 in range(len(others)) for index_2 in range(index_1 + 1, len(others))])
+
+    def count(self,
+              triad: tuple,
+              change: int):
+        """
+        Change the count of the class of the triad in the census if it is rational.
+
+        :param triad: node keys of the triad.
+        :type triad: tuple
+
+        :param change: change of the count.
+        :type change: int
+
+        :return: canonical code of the triad if it is rational.
+        :rtype: int or None
+        """
+        values = [self.signs.get((tail_node, head_node), 0) for tail_node in triad for head_node in triad]
+
+        # each node should have a self-loop or an edge to the other nodes (see "compliance_motif_specification").
+        for index in range(3):
+            if values[index * 3: index * 3 + 3] == [0, 0, 0] and values[index::3] == [0, 0, 0]:
+                return None
+
+        code = 0
+        for location, value in enumerate(values):
+            code += (value % 3) * 3 ** location
+        code = int(canonical_table[code])
+        self.census[code] = self.census.get(code, 0) + change
+        if self.census[code] == 0:
+            del self.census[code]
+
+        return code
+
+    def is_retained(self,
+                    key: tuple) \
+            -> bool:
+        """
+        Judge whether the connection is retained in the adjacency matrix (see "create_adjacency_matrix").
+
+        :param key: key of the connection.
+        :type key: tuple
+
+        :return: retained judgement.
+        :rtype: bool
+        """
+        former, latter = key
+        if former in self.input_keys and latter in self.input_keys:  # connection between input nodes.
+            return False
+        if former in self.output_keys and latter not in self.input_keys and latter not in self.output_keys:
+            return False  # connection from output nodes to other nodes.
+
+        return True
+
+    def contains(self,
+                 forbidden_table: ndarray) \
+            -> bool:
+        """
+        Judge whether the census contains any forbidden motif.
+
+        :param forbidden_table: forbidden flags of all the canonical codes (see "create_forbidden_table").
+        :type forbidden_table: numpy.ndarray
+
+        :return: contained judgement.
+        :rtype: bool
+        """
+        for code in self.census.keys():
+            if forbidden_table[code]:
+                return True
+
+        return False
+
+    def copy(self):
+        """
+        Copy the motif state.
+
+        :return: copied motif state.
+        :rtype: practice.evolve.MotifState
+        """
+        state = MotifState.__new__(MotifState)
+        state.input_keys, state.output_keys = self.input_keys, self.output_keys
+        state.forbidden_table = self.forbidden_table
+        state.signs, state.loops, state.census = dict(self.signs), set(self.loops), dict(self.census)
+        state.neighbors = {node: set(neighbors) for node, neighbors in self.neighbors.items()}
+        return state
+
+
 class AdjustedReproduction(DefaultReproduction):
 
+    def __init__(self,
+                 config,
+                 reporters,
+                 stagnation):
+        # noinspection PyCompatibility
+        super().__init__(config, reporters, stagnation)
+        # genomes whose motif-creating changes are withdrawn by the constructive mutation,
+        # each of which would be screened out and generated again at least once without it.
+        self.saved_retries = 0
+
     def create_new(self,
                    genome_type,
                    genome_config: Union[DefaultGenomeConfig, AdjustedGenomeConfig],
@@ -124,6 +558,8 @@ class AdjustedReproduction(DefaultReproduction):
                 if not self.detect(genome, genome_config):  # screen special motifs.
                     break
             new_genomes[key] = genome
+            if getattr(genome, "avoided_changes", 0) > 0:
+                self.saved_retries += 1
             self.ancestors[key] = tuple()
 
         return new_genomes
@@ -218,6 +654,11 @@ class AdjustedReproduction(DefaultReproduction):
 
                 new_population[gid] = child
                 self.ancestors[gid] = (parent1_id, parent2_id)
+                if getattr(child, "avoided_changes", 0) > 0:
+                    self.saved_retries += 1
+
+        if getattr(config.genome_config, "constructive_mutation", False):
+            self.reporters.info("Saved retries: {}".format(self.saved_retries))
 
         return new_population
 
@@ -227,6 +668,9 @@ class AdjustedReproduction(DefaultReproduction):
         """
         Detect selected motifs based on the adjacency matrix of agent.
 
+        The detection looks up the census of the motif state if the genome has one (see "AdjustedGenome"),
+        otherwise it stops at the first selected motif in the adjacency matrix.
+
         :param model_genome: model of genome.
         :type model_genome: neat.genome.DefaultGenome or practice.evolve.AdjustedGenome
 
@@ -236,37 +680,58 @@ class AdjustedReproduction(DefaultReproduction):
         :return: detection result.
         :rtype: bool
         """
+        # noinspection PyUnresolvedReferences
+        if genome_config.remove_type not in forbidden_tables:
+            return False
+
+        # the census of the motif state is updated along with the genome.
+        if getattr(model_genome, "motif_state", None) is not None:
+            # noinspection PyUnresolvedReferences
+            return model_genome.motif_state.contains(forbidden_tables[genome_config.remove_type])
+
         # To more rigorously prohibit the generation of selected motifs,
         # we do not consider the temporary variable "enabled" in connections during the training phase.
         adjacency_matrix = create_adjacency_matrix(model_genome, genome_config, consider_enable=False)
 
         # noinspection PyUnresolvedReferences
-        if genome_config.remove_type in ["i", "a"]:
-            detected_motifs = array([[[+0, -1, +1], [+0, +0, +1], [+0, +0, +0]],
-                                     [[+0, +1, +1], [+0, +0, -1], [+0, +0, +0]],
-                                     [[+0, +1, -1], [+0, +0, +1], [+0, +0, +0]],
-                                     [[+0, -1, -1], [+0, +0, -1], [+0, +0, +0]]])
-            if detect_motifs_from_adjacency_matrix(adjacency_matrix, 3, detected_motifs):
-                return True
+        return detect_forbidden_motifs(adjacency_matrix, forbidden_tables[genome_config.remove_type])
 
-        # noinspection PyUnresolvedReferences
-        if genome_config.remove_type in ["c", "a"]:
-            detected_motifs = array([[[+0, +1, +1], [+0, +0, +1], [+0, +0, +0]],
-                                     [[+0, -1, +1], [+0, +0, -1], [+0, +0, +0]],
-                                     [[+0, -1, -1], [+0, +0, +1], [+0, +0, +0]],
-                                     [[+0, +1, -1], [+0, +0, -1], [+0, +0, +0]]])
-            if detect_motifs_from_adjacency_matrix(adjacency_matrix, 3, detected_motifs):
-                return True
 
-        return False
+def create_node_mapping(model_genome: Union[DefaultGenome, AdjustedGenome],
+                        genome_config: Union[DefaultGenomeConfig, AdjustedGenomeConfig]) \
+        -> dict:
+    """
+    Create the mapping from the node keys to the indices in the adjacency matrix.
+
+    :param model_genome: model of genome.
+    :type model_genome: neat.genome.DefaultGenome or practice.evolve.AdjustedGenome
+
+    :param genome_config: genome configuration.
+    :type genome_config: neat.genome.DefaultGenomeConfig or practice.evolve.AdjustedGenomeConfig
+
+    :return: node mapping.
+    :rtype: dict
+    """
+    mapping = {}
+    for index in range(genome_config.num_inputs):
+        mapping[index - genome_config.num_inputs] = index
+
+    index = genome_config.num_inputs
+    for node_key in model_genome.nodes.keys():
+        mapping[node_key] = index
+        index += 1
+
+    return mapping
 
 
 def create_adjacency_matrix(model_genome: Union[DefaultGenome, AdjustedGenome],
                             genome_config: Union[DefaultGenomeConfig, AdjustedGenomeConfig],
-                            consider_enable: bool = True) \
-        -> ndarray:
+                            consider_enable: bool = True,
+                            sparse_format: bool = False) \
+        -> Union[ndarray, csr_matrix]:
     """
     Create adjacency matrix based on the genome and its corresponding configuration.
+    The sparse format only stores the connections, which is suitable for the large networks.
 
     :param model_genome: model of genome.
     :type model_genome: neat.genome.DefaultGenome or practice.evolve.AdjustedGenome
@@ -277,23 +742,35 @@ def create_adjacency_matrix(model_genome: Union[DefaultGenome, AdjustedGenome],
     :param consider_enable: only consider the weight of connection if it is enabled.
     :type consider_enable: bool
 
+    :param sparse_format: create the adjacency matrix in the compressed sparse row format.
+    :type sparse_format: bool
+
     :return: corresponding adjacency matrix.
-    :rtype: numpy.ndarray
+    :rtype: numpy.ndarray or scipy.sparse.csr_matrix
     """
     input_number, output_number = genome_config.num_inputs, genome_config.num_outputs
     scale = input_number + output_number + len(model_genome.nodes)
 
-    mapping, reverse_mapping, adjacency_matrix = {}, {}, zeros(shape=(scale, scale))
-    for index in range(genome_config.num_inputs):
-        mapping[index - genome_config.num_inputs] = index
-        reverse_mapping[index] = index - genome_config.num_inputs
+    mapping = create_node_mapping(model_genome, genome_config)
 
-    index = genome_config.num_inputs
-    for node_key, node_gene in iteritems(model_genome.nodes):
-        mapping[node_key] = index
-        reverse_mapping[index] = node_key
-        index += 1
+    if sparse_format:
+        rows, cols, weights = [], [], []
+        for connect_gene in itervalues(model_genome.connections):
+            if connect_gene.enabled or not consider_enable:
+                rows.append(mapping[connect_gene.key[0]])
+                cols.append(mapping[connect_gene.key[1]])
+                weights.append(connect_gene.weight)
+        rows, cols, weights = array(rows, dtype=int), array(cols, dtype=int), array(weights, dtype=float)
+
+        # remove connection between input nodes, and connection from output nodes to other nodes.
+        input_flags = (rows < input_number) & (cols < input_number)
+        output_flags = (rows >= input_number) & (rows < input_number + output_number)
+        output_flags &= cols >= input_number + output_number
+        flags = ~(input_flags | output_flags)
+
+        return csr_matrix((weights[flags], (rows[flags], cols[flags])), shape=(scale, scale))
 
+    adjacency_matrix = zeros(shape=(scale, scale))
     for connect_gene in itervalues(model_genome.connections):
         row, col = mapping[connect_gene.key[0]], mapping[connect_gene.key[1]]
         if consider_enable:
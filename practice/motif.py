@@ -4,8 +4,11 @@
 """
 from itertools import combinations, permutations
 from networkx import DiGraph
-from numpy import ndarray, zeros, array, all, sqrt
-from typing import Union
+from numpy import ndarray, zeros, full, full_like, array, arange, where, unique, argsort, lexsort, bincount, ix_
+from numpy import all, isin, sign, sqrt, minimum, matmul, expand_dims, triu_indices, repeat, diff, cumsum
+from numpy import sort, stack, clip, searchsorted, iinfo, int64
+from scipy.sparse import csr_matrix, issparse
+from typing import Tuple, Union
 
 
 acyclic_motifs = {
@@ -129,6 +132,94 @@ def is_same_motif(motif_1: ndarray,
     return False
 
 
+def create_canonical_table(search_size: int = 3) \
+        -> ndarray:
+    """
+    Create the lookup table from the code of each signed motif to the code of its canonical form,
+    where the canonical form is the isomorphic motif (under the permutations of nodes) with the minimum code.
+
+    :param search_size: size of search.
+    :type search_size: int
+
+    :return: canonical codes of all the signed motifs with the given search size.
+    :rtype: numpy.ndarray
+    """
+    codes, weights = arange(3 ** (search_size ** 2)), 3 ** arange(search_size ** 2)
+    digits = (expand_dims(codes, axis=1) // weights) % 3
+
+    table = codes.copy()
+    for rule in permutations([_ for _ in range(search_size)], search_size):
+        # the same restructuring as "is_same_motif", i.e. the entry (tail, head) moves to (rule[tail], rule[head]).
+        positions = array([rule[tail_index] * search_size + rule[head_index]
+                           for tail_index in range(search_size) for head_index in range(search_size)])
+        table = minimum(table, matmul(digits, weights[positions]))
+
+    return table
+
+
+def encode_motif(motif: ndarray) \
+        -> int:
+    """
+    Encode the signed motif as an integer, where each entry is a ternary digit (0 for 0, 1 for +1, and 2 for -1).
+
+    :param motif: signed motif with entries in {-1, 0, +1}.
+    :type motif: numpy.ndarray
+
+    :return: motif code.
+    :rtype: int
+    """
+    values = array(motif).reshape(-1)
+    if not all(isin(values, [-1, 0, 1])):
+        raise ValueError("the entries of the signed motif should be -1, 0, or +1!")
+
+    return int(matmul(values.astype(int) % 3, 3 ** arange(len(values))))
+
+
+def decode_motif(code: int,
+                 search_size: int = 3) \
+        -> ndarray:
+    """
+    Decode the integer as the signed motif.
+
+    :param code: motif code.
+    :type code: int
+
+    :param search_size: size of search.
+    :type search_size: int
+
+    :return: signed motif.
+    :rtype: numpy.ndarray
+    """
+    digits = (code // 3 ** arange(search_size ** 2)) % 3
+
+    return array([0, 1, -1])[digits].reshape(search_size, search_size)
+
+
+def classify_motif(motif: ndarray) \
+        -> int:
+    """
+    Classify the signed motif by the code of its canonical form, so that two motifs are the same if their codes are.
+    The motifs with 3 nodes are looked up in the precomputed table.
+
+    :param motif: signed motif with entries in {-1, 0, +1}.
+    :type motif: numpy.ndarray
+
+    :return: canonical code.
+    :rtype: int
+    """
+    if len(motif) == 3:
+        return int(canonical_table[encode_motif(motif)])
+
+    search_size, code = len(motif), None
+    for rule in permutations([_ for _ in range(search_size)], search_size):
+        restructured_motif = zeros(shape=motif.shape)
+        restructured_motif[expand_dims(array(rule), axis=1), array(rule)] = motif
+        if code is None or encode_motif(restructured_motif) < code:
+            code = encode_motif(restructured_motif)
+
+    return code
+
+
 def obtain_motif(adjacency_matrix: ndarray,
                  combination: Union[list, tuple],
                  search_size: int) \
@@ -178,14 +269,14 @@ def compliance_motif_specification(motif: ndarray) \
     return True
 
 
-def collect_motifs(adjacency_matrix: ndarray,
+def collect_motifs(adjacency_matrix: Union[ndarray, csr_matrix],
                    search_size=3) \
         -> list:
     """
     Collect all the rational motifs from the adjacency matrix.
 
     :param adjacency_matrix: the adjacency matrix of the method.
-    :type adjacency_matrix: numpy.ndarray
+    :type adjacency_matrix: numpy.ndarray or scipy.sparse.csr_matrix
 
     :param search_size: size of search.
     :type search_size: int
@@ -193,28 +284,285 @@ def collect_motifs(adjacency_matrix: ndarray,
     :return: collected motif set.
     :rtype: list
     """
-    collector, saved_motif_matrices = {}, []
+    if search_size == 3:
+        _, first_codes, counts = census_motifs(adjacency_matrix=adjacency_matrix)
+        return [(array(decode_motif(code), dtype=float), int(count)) for code, count in zip(first_codes, counts)]
+
+    if issparse(adjacency_matrix):
+        adjacency_matrix = adjacency_matrix.toarray()
+
+    collector = {}
     for combination in combinations([node_id for node_id in range(len(adjacency_matrix))], search_size):
         motif = obtain_motif(adjacency_matrix=adjacency_matrix, combination=combination, search_size=search_size)
         if compliance_motif_specification(motif):
-            is_found = False
-            for saved_motif in saved_motif_matrices:
-                if is_same_motif(saved_motif, motif):
-                    is_found = True
-                    collector[motif_matrix_to_fingerprint(saved_motif)] += 1
-                    break
-            if not is_found:
-                saved_motif_matrices.append(motif)
-                collector[motif_matrix_to_fingerprint(motif)] = 1
+            # the first collected motif of each class represents the class.
+            code = classify_motif(motif)
+            if code in collector:
+                collector[code][1] += 1
+            else:
+                collector[code] = [motif, 1]
+
+    return [(motif, count) for motif, count in collector.values()]
+
+
+def census_motifs(adjacency_matrix: Union[ndarray, csr_matrix],
+                  block_size: int = 1000000) \
+        -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Count the rational motifs with 3 nodes from the adjacency matrix by their canonical codes.
+
+    Without self-loops, a node triple is rational if and only if it is connected,
+    so the triples are enumerated from the edges in "census_sparse_motifs".
+    Otherwise, the signed sub-adjacency of each node triple is encoded (see "encode_motif") through the fancy indexing,
+    where the nodes without any edge are skipped, since a triple containing them is never rational.
+    The classes are ordered by their first triples in the combinations, the same as "collect_motifs".
+
+    :param adjacency_matrix: the adjacency matrix of the method.
+    :type adjacency_matrix: numpy.ndarray or scipy.sparse.csr_matrix
+
+    :param block_size: number of triples encoded together.
+    :type block_size: int
+
+    :return: canonical codes of the classes, codes of their first collected motifs, and their counts.
+    :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray
+    """
+    if not adjacency_matrix.diagonal().any():
+        return census_sparse_motifs(adjacency_matrix=csr_matrix(adjacency_matrix), block_size=block_size)
+
+    if issparse(adjacency_matrix):
+        adjacency_matrix = adjacency_matrix.toarray()
+
+    links = array(adjacency_matrix) != 0
+    nodes = where(links.any(axis=0) | links.any(axis=1))[0]
+    digits, links = sign(array(adjacency_matrix)[ix_(nodes, nodes)]).astype(int) % 3, links[ix_(nodes, nodes)]
+
+    counts, orders = zeros(shape=(len(canonical_table),), dtype=int), full(shape=(len(canonical_table),), fill_value=-1)
+    first_codes, offset = zeros(shape=(len(canonical_table),), dtype=int), 0
+    for former in range(len(nodes) - 2):
+        middles, latters = triu_indices(len(nodes) - former - 1, k=1)
+        for start in range(0, len(middles), block_size):
+            middle = middles[start: start + block_size] + former + 1
+            latter = latters[start: start + block_size] + former + 1
+            codes = encode_triples(digits, links, full_like(middle, former), middle, latter)
+
+            classes = canonical_table[codes]
+            counts += bincount(classes, minlength=len(canonical_table))
+            classes, locations = unique(classes, return_index=True)
+            new_flags = orders[classes] < 0
+            orders[classes[new_flags]] = offset + locations[new_flags]
+            first_codes[classes[new_flags]] = codes[locations[new_flags]]
+            offset += len(codes)
+
+    classes = where(counts > 0)[0]
+    classes = classes[argsort(orders[classes])]
+
+    return classes, first_codes[classes], counts[classes]
+
+
+def encode_triples(digits: ndarray,
+                   links: ndarray,
+                   formers: ndarray,
+                   middles: ndarray,
+                   latters: ndarray) \
+        -> ndarray:
+    """
+    Encode the rational triples (see "compliance_motif_specification") among the given node triples.
+
+    :param digits: ternary digits of the adjacency matrix (see "encode_motif").
+    :type digits: numpy.ndarray
+
+    :param links: edge flags of the adjacency matrix.
+    :type links: numpy.ndarray
+
+    :param formers: first nodes of the triples.
+    :type formers: numpy.ndarray
+
+    :param middles: second nodes of the triples.
+    :type middles: numpy.ndarray
+
+    :param latters: third nodes of the triples.
+    :type latters: numpy.ndarray
+
+    :return: codes of the rational triples.
+    :rtype: numpy.ndarray
+    """
+    # each node of a rational motif has a self-loop or an edge to another node in the triple.
+    flags = (links[formers, formers] | links[formers, middles] | links[middles, formers]
+             | links[formers, latters] | links[latters, formers]) \
+        & (links[middles, middles] | links[middles, formers] | links[formers, middles]
+           | links[middles, latters] | links[latters, middles]) \
+        & (links[latters, latters] | links[latters, formers] | links[formers, latters]
+           | links[latters, middles] | links[middles, latters])
 
-    results = []
-    for fingerprint, count in collector.items():
-        results.append((fingerprint_to_motif_matrix(fingerprint), count))
+    members, weights = (formers[flags], middles[flags], latters[flags]), 3 ** arange(9).reshape(3, 3)
+    codes = zeros(shape=(len(members[0]),), dtype=int)
+    for tail_index in range(3):
+        for head_index in range(3):
+            codes += digits[members[tail_index], members[head_index]] * weights[tail_index, head_index]
 
-    return results
+    return codes
 
 
-def count_motifs_from_adjacency_matrix(matrix: ndarray,
+def create_forbidden_table(forbidden_motifs: Union[list, tuple, ndarray]) \
+        -> ndarray:
+    """
+    Create the lookup table of the canonical codes of the forbidden motifs with 3 nodes.
+
+    :param forbidden_motifs: forbidden motifs with 3 nodes.
+    :type forbidden_motifs: list, tuple, or numpy.ndarray
+
+    :return: forbidden flags of all the canonical codes.
+    :rtype: numpy.ndarray
+    """
+    flags = zeros(shape=(len(canonical_table),), dtype=bool)
+    for forbidden_motif in forbidden_motifs:
+        flags[classify_motif(array(forbidden_motif))] = True
+
+    return flags
+
+
+def detect_forbidden_motifs(matrix: ndarray,
+                            forbidden_table: ndarray,
+                            nodes: Union[list, ndarray, None] = None) \
+        -> bool:
+    """
+    Detect whether the adjacency matrix contains any forbidden motif with 3 nodes,
+    which stops at the first node whose triples contain a forbidden motif.
+
+    If the nodes are given, only the triples containing them are detected,
+    which is sufficient if the other triples are known to be free of the forbidden motifs.
+
+    :param matrix: adjacency matrix of the neural network.
+    :type matrix: numpy.ndarray
+
+    :param forbidden_table: forbidden flags of all the canonical codes (see "create_forbidden_table").
+    :type forbidden_table: numpy.ndarray
+
+    :param nodes: nodes contained by the detected triples if required.
+    :type nodes: list, numpy.ndarray, or None
+
+    :return: detection flag.
+    :rtype: bool
+    """
+    digits = sign(array(matrix)).astype(int) % 3
+    links = digits != 0
+    candidates = links.any(axis=0) | links.any(axis=1)  # the nodes without any edge are never in rational motifs.
+    for node in (where(candidates)[0] if nodes is None else nodes):
+        if not candidates[node]:
+            continue
+
+        candidates[node] = False  # the triples containing the detected nodes have been detected.
+        others = where(candidates)[0]
+        middles, latters = triu_indices(len(others), k=1)
+        codes = encode_triples(digits, links, full_like(middles, node), others[middles], others[latters])
+        if forbidden_table[canonical_table[codes]].any():
+            return True
+
+    return False
+
+
+def census_sparse_motifs(adjacency_matrix: csr_matrix,
+                         block_size: int = 1000000) \
+        -> Tuple[ndarray, ndarray, ndarray]:
+    """
+    Count the connected motifs with 3 nodes from the sparse adjacency matrix by their canonical codes.
+
+    Each connected triple is a pair of neighbors around a center node (in the undirected sense),
+    so the triples are enumerated from the neighbor pairs of each node, whose number scales with the edges.
+    An open triple is only visited from its center, and a closed triple is kept at its smallest node.
+    The entries of the triples are looked up from the sorted (row, column) keys of the edges.
+
+    :param adjacency_matrix: the sparse adjacency matrix of the method without self-loops.
+    :type adjacency_matrix: scipy.sparse.csr_matrix
+
+    :param block_size: number of neighbor pairs encoded together.
+    :type block_size: int
+
+    :return: canonical codes of the classes, codes of their first collected motifs, and their counts.
+    :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray
+    """
+    number, weights = adjacency_matrix.shape[0], 3 ** arange(9).reshape(3, 3)
+    matrix = csr_matrix(adjacency_matrix, dtype=float, copy=True)
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    edge_keys = repeat(arange(number, dtype=int64), diff(matrix.indptr)) * number + matrix.indices
+    edge_digits = sign(matrix.data).astype(int) % 3
+
+    matrix.data[:] = 1
+    neighbors = (matrix + matrix.T).tocsr()
+    neighbors.sort_indices()
+    centers, indices = repeat(arange(number, dtype=int64), diff(neighbors.indptr)), neighbors.indices.astype(int64)
+    neighbor_keys = centers * number + indices
+    pair_numbers = neighbors.indptr[centers + 1] - arange(len(centers)) - 1  # pairs with the following neighbors.
+    pair_ends = cumsum(pair_numbers)
+
+    counts = zeros(shape=(len(canonical_table),), dtype=int)
+    orders = full(shape=(len(canonical_table),), fill_value=iinfo(int64).max)
+    first_codes, start = zeros(shape=(len(canonical_table),), dtype=int), 0
+    while start < len(centers):
+        stop = max([int(searchsorted(pair_ends, (pair_ends[start - 1] if start > 0 else 0) + block_size,
+                                     side="right")), start + 1])
+        formers = repeat(arange(start, stop), pair_numbers[start: stop])
+        offsets = arange(len(formers)) - repeat(cumsum(pair_numbers[start: stop]) - pair_numbers[start: stop],
+                                                pair_numbers[start: stop])
+        center, former, latter = centers[formers], indices[formers], indices[formers + 1 + offsets]
+        start = stop
+
+        flags = (search_entries(neighbor_keys, None, former * number + latter) == 0) | (center < former)
+        triples = sort(stack((center[flags], former[flags], latter[flags]), axis=1), axis=1)
+        codes = zeros(shape=(len(triples),), dtype=int)
+        for tail_index in range(3):
+            for head_index in range(3):
+                if tail_index != head_index:
+                    queries = triples[:, tail_index] * number + triples[:, head_index]
+                    codes += search_entries(edge_keys, edge_digits, queries) * weights[tail_index, head_index]
+
+        # the lexicographic order of triples is the order of the combinations.
+        classes, keys = canonical_table[codes], (triples[:, 0] * number + triples[:, 1]) * number + triples[:, 2]
+        counts += bincount(classes, minlength=len(canonical_table))
+        order = lexsort((keys, classes))
+        classes, locations = unique(classes[order], return_index=True)
+        keys, codes = keys[order][locations], codes[order][locations]
+        new_flags = keys < orders[classes]
+        orders[classes[new_flags]], first_codes[classes[new_flags]] = keys[new_flags], codes[new_flags]
+
+    classes = where(counts > 0)[0]
+    classes = classes[argsort(orders[classes])]
+
+    return classes, first_codes[classes], counts[classes]
+
+
+def search_entries(keys: ndarray,
+                   values: Union[ndarray, None],
+                   queries: ndarray) \
+        -> ndarray:
+    """
+    Search the values of the queried keys in the sorted keys.
+
+    :param keys: sorted keys.
+    :type keys: numpy.ndarray
+
+    :param values: values of the keys, where the value of each key is 1 if None.
+    :type values: numpy.ndarray or None
+
+    :param queries: queried keys.
+    :type queries: numpy.ndarray
+
+    :return: values of the queried keys, where the value of each missing key is 0.
+    :rtype: numpy.ndarray
+    """
+    if len(keys) == 0:
+        return zeros(shape=(len(queries),), dtype=int)
+
+    locations = clip(searchsorted(keys, queries), 0, len(keys) - 1)
+    flags = keys[locations] == queries
+    if values is None:
+        return flags.astype(int)
+
+    return where(flags, values[locations], 0)
+
+
+def count_motifs_from_adjacency_matrix(matrix: Union[ndarray, csr_matrix],
                                        search_size: int,
                                        reference_motifs: Union[ndarray, list] = None) \
         -> ndarray:
@@ -222,7 +570,7 @@ def count_motifs_from_adjacency_matrix(matrix: ndarray,
     Count the rational motif frequencies from a given adjacency matrix.
 
     :param matrix: adjacency matrix of the neural network.
-    :type matrix: numpy.ndarray
+    :type matrix: numpy.ndarray or scipy.sparse.csr_matrix
 
     :param search_size: size of search.
     :type search_size: int
@@ -242,16 +590,20 @@ def count_motifs_from_adjacency_matrix(matrix: ndarray,
                     motif[former - 1, latter - 1] = acyclic_motif.get_edge_data(former, latter)["weight"]
                 reference_motifs.append(motif)
 
+    reference_codes = [classify_motif(array(reference_motif))
+                       if array(reference_motif).shape == (search_size, search_size) else None
+                       for reference_motif in reference_motifs]
+
     counts = zeros(shape=(len(reference_motifs),), dtype=int)
-    for observed_motif, count in collect_motifs(adjacency_matrix=matrix, search_size=search_size):
-        for reference_index, reference_motif in enumerate(reference_motifs):
-            if is_same_motif(observed_motif, reference_motif):
+    for observed_code, count in zip(*obtain_motif_classes(matrix=matrix, search_size=search_size)):
+        for reference_index, reference_code in enumerate(reference_codes):
+            if observed_code == reference_code:
                 counts[reference_index] += count
 
     return counts
 
 
-def detect_motifs_from_adjacency_matrix(matrix: ndarray,
+def detect_motifs_from_adjacency_matrix(matrix: Union[ndarray, csr_matrix],
                                         search_size: int,
                                         detected_motifs: Union[list, tuple, ndarray]) \
         -> bool:
@@ -259,7 +611,7 @@ def detect_motifs_from_adjacency_matrix(matrix: ndarray,
     Detect motifs from a given adjacency matrix.
 
     :param matrix: adjacency matrix of the neural network.
-    :type matrix: numpy.ndarray
+    :type matrix: numpy.ndarray or scipy.sparse.csr_matrix
 
     :param search_size: size of search.
     :type search_size: int
@@ -270,9 +622,38 @@ def detect_motifs_from_adjacency_matrix(matrix: ndarray,
     :return: detection flag.
     :rtype: bool
     """
-    for observed_motif, _ in collect_motifs(adjacency_matrix=matrix, search_size=search_size):
-        for detected_motif in detected_motifs:
-            if is_same_motif(observed_motif, detected_motif):
-                return True
+    detected_codes = set([classify_motif(array(detected_motif)) for detected_motif in detected_motifs
+                          if array(detected_motif).shape == (search_size, search_size)])
+
+    for observed_code in obtain_motif_classes(matrix=matrix, search_size=search_size)[0]:
+        if observed_code in detected_codes:
+            return True
 
     return False
+
+
+def obtain_motif_classes(matrix: Union[ndarray, csr_matrix],
+                         search_size: int) \
+        -> Tuple[list, list]:
+    """
+    Obtain the canonical codes of the rational motif classes and their counts from a given adjacency matrix.
+
+    :param matrix: adjacency matrix of the neural network.
+    :type matrix: numpy.ndarray or scipy.sparse.csr_matrix
+
+    :param search_size: size of search.
+    :type search_size: int
+
+    :return: canonical codes and counts of the motif classes.
+    :rtype: list, list
+    """
+    if search_size == 3:
+        classes, _, counts = census_motifs(adjacency_matrix=matrix)
+        return classes.tolist(), counts.tolist()
+
+    records = collect_motifs(adjacency_matrix=matrix, search_size=search_size)
+
+    return [classify_motif(motif) for motif, _ in records], [count for _, count in records]
+
+
+canonical_table = create_canonical_table(search_size=3)
@@ -86,3 +86,56 @@ class NormNoiseGenerator(object):
             noise_samples[:, variable_index] = clip(noise_samples[:, variable_index], minimum_bound, maximum_bound)
 
         return noise_samples if count > 1 else noise_samples[0]
+
+    # noinspection PyArgumentList
+    def get_batch_samples(self,
+                          samples: ndarray,
+                          minimum_bounds: ndarray,
+                          maximum_bounds: ndarray) \
+            -> ndarray:
+        """
+        Get one noise sample for each noise-free sample in the batch,
+        which follows the same distribution as "get_samples" with one noise sample for each row.
+
+        :param samples: noise-free samples.
+        :type samples: numpy.ndarray
+
+        :param minimum_bounds: minimum bounds of observations.
+        :type minimum_bounds: numpy.ndarray
+
+        :param maximum_bounds: maximum bounds of observations.
+        :type maximum_bounds: numpy.ndarray
+
+        :return: noise samples.
+        :rtype: numpy.ndarray
+        """
+        assert len(samples.shape) == 2
+
+        if self.noise_scale == 0.0 or self.noise_level == 0.0:
+            return samples
+
+        if self.norm_type == "L-1":  # using Laplacian distribution.
+            noises = random.laplace(size=samples.shape)
+            minimums, maximums = min(noises, axis=1, keepdims=True), max(noises, axis=1, keepdims=True)
+            normalized_noises = ((noises - minimums) / (maximums - minimums) - 0.5) * 2.0
+        elif self.norm_type == "L-2":  # using Gaussian distribution.
+            noises = random.normal(size=samples.shape)
+            minimums, maximums = min(noises, axis=1, keepdims=True), max(noises, axis=1, keepdims=True)
+            normalized_noises = ((noises - minimums) / (maximums - minimums) - 0.5) * 2.0
+        elif self.norm_type == "L-inf":  # using uniform distribution.
+            # noinspection PyArgumentEqualDefault
+            normalized_noises = random.uniform(low=-1.0, high=1.0, size=samples.shape)
+        else:
+            raise ValueError("No such norm type!")
+
+        actual_noises = normalized_noises * self.noise_scale
+
+        if self.noise_level < 1.0:
+            actual_noises[random.random(size=len(samples)) > self.noise_level] = 0.0
+
+        noise_samples = samples + actual_noises
+
+        for variable_index, (minimum_bound, maximum_bound) in enumerate(zip(minimum_bounds, maximum_bounds)):
+            noise_samples[:, variable_index] = clip(noise_samples[:, variable_index], minimum_bound, maximum_bound)
+
+        return noise_samples
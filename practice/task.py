@@ -2,14 +2,17 @@
 @Author      : Haoling Zhang
 @Description : Definition of OpenAI Gym task.
 """
-from copy import deepcopy
+from copy import copy, deepcopy
 from gym import make, Env
 from itertools import product
+from multiprocessing import Pool
 
 from gym.envs.classic_control import CartPoleEnv
+from gym.utils import seeding
 from matplotlib import pyplot
 from matplotlib.animation import FuncAnimation
-from numpy import ndarray, array, linspace, argmax, abs, max, sum, mean
+from numpy import ndarray, array, linspace, argmax, abs, max, sum, mean, random
+from numpy import zeros, where, stack, cos, sin, float32
 # noinspection PyPackageRequirements
 from neat.config import Config
 from typing import Union, Tuple
@@ -248,11 +251,103 @@ class GymTask(object):
         pyplot.close()
 
 
+class BatchCartPoleEnv(object):
+
+    def __init__(self,
+                 environment: CartPoleEnv):
+        """
+        Initialize the batch of CartPole environments, which advances all the episodes as arrays.
+
+        The dynamics, the termination bounds and the rewards are the same as those of the OpenAI gym environment,
+        whose parameters are used here.
+
+        :param environment: OpenAI gym CartPole environment.
+        :type environment: gym.envs.classic_control.CartPoleEnv
+        """
+        self.environment = environment
+        self.states, self.terminations = None, None
+
+    def reset(self,
+              count: int,
+              random_seeds: Union[ndarray, list, None] = None) \
+            -> ndarray:
+        """
+        Reset the batch of environments.
+
+        :param count: number of the environments.
+        :type count: int
+
+        :param random_seeds: random seeds for initializing each environment.
+        :type random_seeds: numpy.ndarray, list, or None
+
+        :return: observations of the environments.
+        :rtype: numpy.ndarray
+        """
+        if random_seeds is not None:
+            assert count == len(random_seeds)
+            states = [seeding.np_random(int(random_seed))[0].uniform(low=-0.05, high=0.05, size=(4,))
+                      for random_seed in random_seeds]
+            self.states = array(states)
+        else:  # the same as resetting the gym environment for several times.
+            self.states = self.environment.np_random.uniform(low=-0.05, high=0.05, size=(count, 4))
+
+        self.terminations = zeros(shape=(count,), dtype=bool)
+
+        return array(self.states, dtype=float32)
+
+    def step(self,
+             actions: ndarray) \
+            -> Tuple[ndarray, ndarray, ndarray]:
+        """
+        Run the batch of environments in one step.
+
+        :param actions: actions of the environments, which are ignored after termination.
+        :type actions: numpy.ndarray
+
+        :return: observations, rewards and terminations of the environments.
+        :rtype: numpy.ndarray, numpy.ndarray, numpy.ndarray
+        """
+        env = self.environment
+        x, x_dot, theta, theta_dot = self.states[:, 0], self.states[:, 1], self.states[:, 2], self.states[:, 3]
+        force = where(array(actions) == 1, env.force_mag, -env.force_mag)
+        costheta, sintheta = cos(theta), sin(theta)
+
+        # the order of operations is the same as "CartPoleEnv.step" to obtain the same values.
+        temp = (force + env.polemass_length * theta_dot ** 2 * sintheta) / env.total_mass
+        thetaacc = (env.gravity * sintheta - costheta * temp) / (
+            env.length * (4.0 / 3.0 - env.masspole * costheta ** 2 / env.total_mass))
+        xacc = temp - env.polemass_length * thetaacc * costheta / env.total_mass
+
+        if env.kinematics_integrator == "euler":
+            x = x + env.tau * x_dot
+            x_dot = x_dot + env.tau * xacc
+            theta = theta + env.tau * theta_dot
+            theta_dot = theta_dot + env.tau * thetaacc
+        else:  # semi-implicit euler
+            x_dot = x_dot + env.tau * xacc
+            x = x + env.tau * x_dot
+            theta_dot = theta_dot + env.tau * thetaacc
+            theta = theta + env.tau * theta_dot
+
+        # the terminated environments stay in their final states.
+        actives = ~self.terminations
+        self.states[actives] = stack([x, x_dot, theta, theta_dot], axis=1)[actives]
+
+        terminations = (x < -env.x_threshold) | (x > env.x_threshold) \
+            | (theta < -env.theta_threshold_radians) | (theta > env.theta_threshold_radians)
+        rewards = where(actives, 1.0, 0.0)  # the terminating step is still rewarded.
+        self.terminations = self.terminations | (actives & terminations)
+
+        return array(self.states, dtype=float32), rewards, self.terminations.copy()
+
+
 class NEATCartPoleTask(GymTask):
 
     def __init__(self,
                  maximum_generation: int,
-                 need_frames: bool = False):
+                 need_frames: bool = False,
+                 workers: int = 1,
+                 batch: bool = True):
         """
         Initialize the CartPole task for NEAT algorithm.
 
@@ -261,10 +356,17 @@ class NEATCartPoleTask(GymTask):
 
         :param need_frames: need to draw the frame in the environment.
         :type need_frames: bool
+
+        :param workers: number of worker processes to calculate the fitness of genomes.
+        :type workers: int
+
+        :param batch: calculate the fitness through the batch of environments (without frames).
+        :type batch: bool
         """
         # noinspection PyCompatibility
         super().__init__(CartPoleEnv(render_mode="rgb_array"), "CartPole", maximum_generation, 100, 200, need_frames)
         self.set_action_handle(action_handle=argmax)
+        self.workers, self.batch = workers, batch
 
     def genomes_fitness(self,
                         genomes: dict,
@@ -277,14 +379,38 @@ class NEATCartPoleTask(GymTask):
 
         :param neat_config: configure of NEAT algorithm.
         :type neat_config: neat.config.Config
+
+        .. note::
+            If more than one worker is required, the genomes are run in a process pool (like "ParallelEvaluator"),
+            and the agent of the best genome is created again in the current process for the experiences.
+            Each genome is run with its own random seed drawn in the current process,
+            so the fitness does not depend on the workers.
         """
         best_genome, best_agent, situation = None, None, []
-        for genome_id, model_genome in genomes:
-            agent = NEATAgent(model_genome, neat_config, "temp", action_handle=self.action_handle)
-
-            # noinspection PyCompatibility
-            collector = super().run(agent)
-            model_genome.fitness = self.calculate_fitness(collector["rewards"])
+        if self.workers > 1:
+            # the experiences and the record handle stay in the current process.
+            worker_task = copy(self)
+            worker_task.experiences, worker_task.record_handle = [], None
+            random_seeds = random.randint(2 ** 31, size=(len(genomes),))
+            tasks = [(model_genome, int(random_seed)) for (_, model_genome), random_seed in zip(genomes, random_seeds)]
+            with Pool(processes=self.workers, initializer=attach_task, initargs=(worker_task, neat_config)) as pool:
+                fitnesses = pool.map(evaluate_genome_task, tasks)
+
+            for (genome_id, model_genome), fitness in zip(genomes, fitnesses):
+                model_genome.fitness = fitness
+                situation.append(model_genome.fitness)
+                if best_genome is None or model_genome.fitness > best_genome.fitness:
+                    best_genome = model_genome
+
+            agent = NEATAgent(best_genome, neat_config, "temp", action_handle=self.action_handle)
+            best_agent = self.record_handle(agent) if self.record_handle is not None else agent
+            self.experiences.append((best_agent, situation))
+            return
+
+        agents = [NEATAgent(model_genome, neat_config, "temp", action_handle=self.action_handle)
+                  for _, model_genome in genomes]
+        for (genome_id, model_genome), agent, fitness in zip(genomes, agents, self.agents_fitness(agents)):
+            model_genome.fitness = fitness
             situation.append(model_genome.fitness)
 
             if best_genome is None or model_genome.fitness > best_genome.fitness:
@@ -294,10 +420,84 @@ class NEATCartPoleTask(GymTask):
                 else:
                     best_agent = deepcopy(agent)
 
-            del agent, collector
-
         self.experiences.append((best_agent, situation))
 
+    def agents_fitness(self,
+                       agents: list) \
+            -> list:
+        """
+        Calculate the fitness of the agents.
+
+        :param agents: available agents.
+        :type agents: list
+
+        :return: fitness of each agent.
+        :rtype: list
+        """
+        if not self.batch or self.need_frames:
+            return [self.calculate_fitness(self.run(agent)["rewards"]) for agent in agents]
+
+        # the recurrent agents keep their states between the steps, so they are run one by one.
+        fitnesses, batch_indices = [None] * len(agents), []
+        for index, agent in enumerate(agents):
+            if agent.neat_config.genome_config.feed_forward:
+                batch_indices.append(index)
+            else:
+                fitnesses[index] = self.calculate_fitness(self.run(agent)["rewards"])
+
+        if len(batch_indices) > 0:
+            reward_collectors = self.run_batch([agents[index] for index in batch_indices])
+            for index, reward_collector in zip(batch_indices, reward_collectors):
+                fitnesses[index] = self.calculate_fitness(reward_collector)
+
+        return fitnesses
+
+    def run_batch(self,
+                  agents: list,
+                  random_seeds: Union[ndarray, list, None] = None) \
+            -> ndarray:
+        """
+        Run the task for all the iterations of the agents through the batch of environments.
+
+        Without random seeds, the initial states are the same as running the agents one by one with "run".
+        The noises follow the same distribution as in "run_1_step", but they are sampled in a different order.
+
+        :param agents: available agents.
+        :type agents: list
+
+        :param random_seeds: random seeds for initialize the environment in each iteration.
+        :type random_seeds: numpy.ndarray, list, or None
+
+        :return: rewards of each agent in each iteration and step (zero after termination).
+        :rtype: numpy.ndarray
+        """
+        if random_seeds is not None:
+            assert self.iterations == len(random_seeds)
+            random_seeds = list(random_seeds) * len(agents)
+
+        environments, (minimum_bounds, maximum_bounds) = BatchCartPoleEnv(self.environment), self.get_state_range()
+        states = environments.reset(len(agents) * self.iterations, random_seeds)
+        rewards = zeros(shape=(len(agents) * self.iterations, self.total_steps))
+        for one_step in range(self.total_steps):
+            if self.noise_generator is not None:
+                actual_states = self.noise_generator.get_batch_samples(states.copy(), minimum_bounds, maximum_bounds)
+            else:
+                actual_states = states.copy()
+
+            actions, actives = zeros(shape=(len(agents) * self.iterations,), dtype=int), ~environments.terminations
+            for agent_index, agent in enumerate(agents):
+                # only the episodes not terminated are run by the agent.
+                start = agent_index * self.iterations
+                locations = start + where(actives[start: start + self.iterations])[0]
+                if len(locations) > 0:
+                    actions[locations] = agent.work_batch(actual_states[locations])[0]
+
+            states, rewards[:, one_step], terminations = environments.step(actions)
+            if terminations.all():
+                break
+
+        return rewards.reshape(len(agents), self.iterations, self.total_steps)
+
     @staticmethod
     def calculate_fitness(reward_collector: Union[ndarray, list]) \
             -> float:
@@ -351,3 +551,39 @@ class NEATCartPoleTask(GymTask):
                         maximum_palstance = max(maximum_velocity, abs(final_state[3]))
 
         return maximum_velocity, maximum_palstance
+
+
+worker_tasks = {}
+
+
+def attach_task(task: NEATCartPoleTask,
+                neat_config: Config):
+    """
+    Attach the task and the configure of NEAT algorithm in the worker process.
+
+    :param task: task without the experiences and the record handle.
+    :type task: practice.task.NEATCartPoleTask
+
+    :param neat_config: configure of NEAT algorithm.
+    :type neat_config: neat.config.Config
+    """
+    worker_tasks["task"], worker_tasks["config"] = task, neat_config
+
+
+def evaluate_genome_task(task: tuple) \
+        -> float:
+    """
+    Calculate the fitness of one genome in the worker process.
+
+    :param task: genome of NEAT model and its random seed.
+    :type task: tuple
+
+    :return: fitness.
+    :rtype: float
+    """
+    (model_genome, random_seed), (task, neat_config) = task, (worker_tasks["task"], worker_tasks["config"])
+    # the random states of the noise and the environment are seeded by the genome, rather than by the worker.
+    random.seed(random_seed)
+    task.environment.reset(seed=random_seed)
+    agent = NEATAgent(model_genome, neat_config, "temp", action_handle=task.action_handle)
+    return task.agents_fitness([agent])[0]
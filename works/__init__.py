@@ -37,19 +37,23 @@ def save_data(save_path, information):
         raise ValueError("No such type of file path.")
 
 
-def load_data(load_path: str):
+def load_data(load_path: str,
+              mmap_mode: str = None):
     """
     Load data from the file path.
 
     :param load_path: path to load data.
     :type load_path: str
 
+    :param mmap_mode: memory-map mode for the ".npy" file if required, such as "r".
+    :type mmap_mode: str
+
     :return:
     """
     if ".pkl" in load_path:
         with open(load_path, "rb") as file:
             return p_load(file=file)
     elif ".npy" in load_path:
-        return n_load(load_path)
+        return n_load(load_path, mmap_mode=mmap_mode)
     else:
         raise ValueError("No such type of file path.")
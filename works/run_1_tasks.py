@@ -4,11 +4,11 @@
 """
 from hashlib import md5
 from itertools import product
-from numpy import array, linspace, arange, zeros, min, argsort, ceil, where
-from os import path, mkdir, listdir
+from numpy import array, linspace, arange, zeros, argsort, ceil, where
+from os import path, mkdir, listdir, cpu_count, remove
 
-from effect import NeuralMotif, generate_outputs, estimate_lipschitz, estimate_lipschitz_by_motif
-from effect import calculate_differences, execute_catch_processes, execute_escape_processes
+from effect import NeuralMotif, generate_outputs, estimate_lipschitz_batch, estimate_lipschitz_by_motif
+from effect import calculate_differences, execute_catch_processes, execute_escape_processes, LandscapeIndex
 
 from practice import acyclic_motifs, NEATCartPoleTask, NormNoiseGenerator
 from practice import create_agent_config, train_and_evaluate
@@ -62,50 +62,30 @@ def task_1():
 
             structure = motif_type + "." + str(motif_index)
 
-            completed = True
-            if not path.exists(raw_path + "parameters/" + structure + ".npy"):
-                completed = False
-            if not path.exists(raw_path + "landscapes/" + structure + ".npy"):
-                completed = False
-            if not completed:
+            if not path.exists(raw_path + "robustness/" + structure + ".npy"):
+                # the parameters and landscapes are streamed into the files, and a partly written pair is resumed.
                 result = generate_outputs(motif_type=motif_type, motif_index=motif_index,
                                           activations=activations, aggregations=aggregations,
                                           weight_groups=weight_groups, bias_groups=bias_groups,
-                                          value_range=value_range, points=points)
-                collection = []
-                for landscape in result[1]:
-                    landscape = landscape.reshape(points, points)
-                    values = estimate_lipschitz(value_range=value_range, points=points,
-                                                output=landscape, norm_type=norm_type)
-                    collection.append(values)
-                save_data(save_path=raw_path + "parameters/" + structure + ".npy", information=result[0])
-                save_data(save_path=raw_path + "landscapes/" + structure + ".npy", information=result[1])
-                save_data(save_path=raw_path + "robustness/" + structure + ".npy", information=array(collection))
+                                          value_range=value_range, points=points,
+                                          save_paths=(raw_path + "parameters/" + structure + ".npy",
+                                                      raw_path + "landscapes/" + structure + ".npy"))
+                collection = estimate_lipschitz_batch(value_range=value_range, points=points, landscapes=result[1],
+                                                      norm_type=norm_type, workers=cpu_count())
+                save_data(save_path=raw_path + "robustness/" + structure + ".npy", information=collection)
 
     if not path.exists(raw_path + "difference/"):
         mkdir(raw_path + "difference/")
 
-    for motif_type_1 in motif_types:
-        for motif_index_1 in motif_indices:
-            for motif_type_2 in motif_types:
-                for motif_index_2 in motif_indices:
-                    source = motif_type_1 + "." + str(motif_index_1)
-                    target = motif_type_2 + "." + str(motif_index_2)
-                    save_feature = source + " for " + target
-                    if not path.exists(raw_path + "difference/" + save_feature + ".npy"):
-                        load_feature_1 = motif_type_1 + "." + str(motif_index_1)
-                        load_feature_2 = motif_type_2 + "." + str(motif_index_2)
-
-                        if load_feature_1 == load_feature_2:
-                            landscapes = load_data(load_path=raw_path + "landscapes/" + load_feature_1 + ".npy")
-                            result = calculate_differences(landscapes_1=landscapes, norm_type=norm_type)
-                            save_data(save_path=raw_path + "difference/" + save_feature + ".npy", information=result)
-                        else:
-                            landscapes_1 = load_data(load_path=raw_path + "landscapes/" + load_feature_1 + ".npy")
-                            landscapes_2 = load_data(load_path=raw_path + "landscapes/" + load_feature_2 + ".npy")
-                            result = calculate_differences(landscapes_1=landscapes_1, landscapes_2=landscapes_2,
-                                                           norm_type=norm_type)
-                            save_data(save_path=raw_path + "difference/" + save_feature + ".npy", information=result)
+    # only the self differences are analyzed (in task 2), the cross differences are not calculated.
+    for motif_type in motif_types:
+        for motif_index in motif_indices:
+            feature = motif_type + "." + str(motif_index)
+            save_feature = feature + " for " + feature
+            if not path.exists(raw_path + "difference/" + save_feature + ".npy"):
+                landscapes = load_data(load_path=raw_path + "landscapes/" + feature + ".npy")
+                result = calculate_differences(landscapes_1=landscapes, norm_type=norm_type)
+                save_data(save_path=raw_path + "difference/" + save_feature + ".npy", information=result)
 
     target_motifs = []
     for motif_index in motif_indices:
@@ -137,12 +117,16 @@ def task_1():
 
                 record = execute_catch_processes(references=references, catchers=target_motifs,
                                                  value_range=value_range, points=points,
-                                                 learn_rate=learn_rate, threshold=iteration_thresholds[1])
+                                                 learn_rate=learn_rate, threshold=iteration_thresholds[1],
+                                                 workers=cpu_count(),
+                                                 checkpoint_path=raw_path + "trade-offs/" + feature + ".checkpoint.pkl")
                 results = []
                 for target, loss in record:
                     robust_target = estimate_lipschitz_by_motif(value_range=value_range, points=points, motif=target)
                     results.append([robust_target, loss])
                 save_data(save_path=raw_path + "trade-offs/" + feature + ".npy", information=array(results))
+                if path.exists(raw_path + "trade-offs/" + feature + ".checkpoint.pkl"):
+                    remove(raw_path + "trade-offs/" + feature + ".checkpoint.pkl")
 
 
 def task_2():
@@ -173,11 +157,21 @@ def task_2():
         for motif_index in motif_indices:
             source_feature = motif_type + "." + str(motif_index)
             if not path.exists(raw_path + "particular/" + source_feature + ".initialization.pkl"):
-                differences = []
+                landscapes = load_data(load_path=raw_path + "landscapes/" + source_feature + ".npy", mmap_mode="r")
+                available_flags = zeros(shape=(len(landscapes),), dtype=bool)
                 for another_index in motif_indices:
-                    mixed_feature = source_feature + " for " + motif_types[-1] + "." + str(another_index)
-                    differences.append(load_data(load_path=raw_path + "difference/" + mixed_feature + ".npy").tolist())
-                available_indices = where(min(array(differences), axis=0) <= 0.03)[0]
+                    target_feature = motif_types[-1] + "." + str(another_index)
+                    # the index is saved next to the landscapes, and reused by the repeated analyses.
+                    if path.exists(raw_path + "landscapes/" + target_feature + ".index.pkl"):
+                        landscape_index = load_data(load_path=raw_path + "landscapes/" + target_feature + ".index.pkl")
+                    else:
+                        target_landscapes = load_data(load_path=raw_path + "landscapes/" + target_feature + ".npy",
+                                                      mmap_mode="r")
+                        landscape_index = LandscapeIndex(landscapes=target_landscapes, norm_type=norm_type)
+                        save_data(save_path=raw_path + "landscapes/" + target_feature + ".index.pkl",
+                                  information=landscape_index)
+                    available_flags |= landscape_index.minimum_differences(landscapes=landscapes) <= 0.03
+                available_indices = where(available_flags)[0]
 
                 self_feature = source_feature + " for " + source_feature
                 self_difference = load_data(load_path=raw_path + "difference/" + self_feature + ".npy")
@@ -201,10 +195,15 @@ def task_2():
             if not path.exists(raw_path + "particular/" + source_feature + ".escape-process.pkl"):
                 motif_data = load_data(load_path=raw_path + "sacrifices/" + source_feature + ".initialization.pkl")
                 records = execute_escape_processes(motif_pairs=motif_data, value_range=value_range, points=points,
-                                                   learn_rate=learn_rate, thresholds=iteration_thresholds)
+                                                   learn_rate=learn_rate, thresholds=iteration_thresholds,
+                                                   workers=cpu_count(),
+                                                   checkpoint_path=raw_path + "particular/" + source_feature
+                                                   + ".checkpoint.pkl")
 
                 save_data(save_path=raw_path + "particular/" + source_feature + ".escape-process.pkl",
                           information=records)
+                if path.exists(raw_path + "particular/" + source_feature + ".checkpoint.pkl"):
+                    remove(raw_path + "particular/" + source_feature + ".checkpoint.pkl")
 
 
 def task_3():
@@ -226,7 +225,8 @@ def task_3():
         for agent_name, agent_config in zip(agent_names, agent_configs):
             record[agent_name] = {}
             for train_radio in radios:
-                result = train_and_evaluate(task=NEATCartPoleTask(maximum_generation=maximum_generation),
+                task = NEATCartPoleTask(maximum_generation=maximum_generation, workers=cpu_count())
+                result = train_and_evaluate(task=task,
                                             agent_name=agent_name, agent_config=agent_config, repeats=sample_number,
                                             train_noise_generator=noise_generators[train_radio],
                                             test_noise_generators=noise_generators)
@@ -238,7 +238,8 @@ def task_3():
         for agent_name, agent_config in zip(agent_names, agent_configs):
             record[agent_name] = []
             for generation in generations:
-                result = train_and_evaluate(task=NEATCartPoleTask(maximum_generation=generation),
+                task = NEATCartPoleTask(maximum_generation=generation, workers=cpu_count())
+                result = train_and_evaluate(task=task,
                                             agent_name=agent_name, agent_config=agent_config, repeats=sample_number,
                                             train_noise_generator=noise_generators[train_radio],
                                             test_noise_generators=noise_generators)
@@ -256,7 +257,8 @@ def task_3():
     if not path.exists(path=raw_path + "real-world/adjustments.2.pkl"):
         record, maximum_generation, train_radio = {}, 100, 0.3
         for agent_name, agent_config in zip(agent_names, agent_configs):
-            result = train_and_evaluate(task=NEATCartPoleTask(maximum_generation=maximum_generation),
+            task = NEATCartPoleTask(maximum_generation=maximum_generation, workers=cpu_count())
+            result = train_and_evaluate(task=task,
                                         agent_name=agent_name, agent_config=agent_config, repeats=sample_number,
                                         train_noise_generator=noise_generators[train_radio],
                                         test_noise_generators=noise_generators)
@@ -2,7 +2,6 @@
 @Author      : Haoling Zhang
 @Description : Package all the presented data from the experimental results.
 """
-from collections import Counter
 from copy import deepcopy
 from itertools import product
 from numpy import array, zeros, linspace, expand_dims, abs, mean, min, max, sum, power, argmax, argmin, all, where
@@ -12,7 +11,8 @@ from scipy.stats import gaussian_kde, spearmanr  # noqa
 from umap import UMAP  # noqa
 from warnings import filterwarnings # noqa
 
-from effect import NeuralMotif, calculate_landscape, calculate_gradients, detect_curvature_feature, minimum_loss_search  # noqa
+from effect import NeuralMotif, calculate_landscape, calculate_gradients, minimum_loss_search  # noqa
+from effect import classify_curvature_features  # noqa
 from practice import acyclic_motifs  # noqa
 from works import load_data, save_data  # noqa
 
@@ -167,8 +167,9 @@ def main_04():
         source_motif, target_motif = motifs[argmin(losses)][0], motifs[argmax(losses)][0]
         source_landscape = calculate_landscape(value_range, points, source_motif)
         target_landscape = calculate_landscape(value_range, points, target_motif)
-        source_feature = detect_curvature_feature(source_landscape, 1.0 / (points - 1))
-        target_feature = detect_curvature_feature(target_landscape, 1.0 / (points - 1))
+        convex_flags, concave_flags, _, _ = classify_curvature_features(array([source_landscape, target_landscape]),
+                                                                        1.0 / (points - 1))
+        source_feature, target_feature = convex_flags.astype(float) - concave_flags.astype(float)
         task_data["a"] = tuple([source_landscape, target_landscape, source_feature, target_feature])
 
         escape_data = load_data(load_path=raw_path + "particular/" + motif_types[1] + ".1.escape-process.pkl")
@@ -176,8 +177,9 @@ def main_04():
         source_motif, target_motif = motifs[argmin(losses)][0], motifs[argmax(losses)][0]
         source_landscape = calculate_landscape(value_range, points, source_motif)
         target_landscape = calculate_landscape(value_range, points, target_motif)
-        source_feature = detect_curvature_feature(source_landscape, 1.0 / (points - 1))
-        target_feature = detect_curvature_feature(target_landscape, 1.0 / (points - 1))
+        convex_flags, concave_flags, _, _ = classify_curvature_features(array([source_landscape, target_landscape]),
+                                                                        1.0 / (points - 1))
+        source_feature, target_feature = convex_flags.astype(float) - concave_flags.astype(float)
         task_data["b"] = tuple([source_landscape, target_landscape, source_feature, target_feature])
 
         records = []
@@ -185,25 +187,10 @@ def main_04():
             feature = motif_types[0] + "." + str(motif_index)
             escape_data = load_data(load_path=raw_path + "particular/" + feature + ".escape-process.pkl")
             for index, (motifs, losses) in enumerate(escape_data):
-                source, target = motifs[argmin(losses)][0], motifs[argmax(losses)][0]
-                source_landscape = calculate_landscape(value_range, sample_number + 1, source)
-                target_landscape = calculate_landscape(value_range, sample_number + 1, target)
-                source_concavity = detect_curvature_feature(source_landscape, 1.0 / sample_number)
-                target_concavity = detect_curvature_feature(target_landscape, 1.0 / sample_number)
-                counter_1, counter_2 = Counter(source_concavity.reshape(-1)), Counter(target_concavity.reshape(-1))
-                used_value_1, used_value_2 = max([counter_1[1], counter_1[-1]]), max([counter_2[1], counter_2[-1]])
-                used_ratio_1 = used_value_1 / ((sample_number + 1) ** 2)
-                used_ratio_2 = used_value_2 / ((sample_number + 1) ** 2)
-                source, target = motifs[argmin(losses)][1], motifs[argmax(losses)][1]
-                source_landscape = calculate_landscape(value_range, sample_number + 1, source)
-                target_landscape = calculate_landscape(value_range, sample_number + 1, target)
-                source_concavity = detect_curvature_feature(source_landscape, 1.0 / sample_number)
-                target_concavity = detect_curvature_feature(target_landscape, 1.0 / sample_number)
-                counter_3, counter_4 = Counter(source_concavity.reshape(-1)), Counter(target_concavity.reshape(-1))
-                used_value_3, used_value_4 = max([counter_3[1], counter_3[-1]]), max([counter_4[1], counter_4[-1]])
-                used_ratio_3 = used_value_3 / ((sample_number + 1) ** 2)
-                used_ratio_4 = used_value_4 / ((sample_number + 1) ** 2)
-                records.append([used_ratio_1, used_ratio_2, used_ratio_3, used_ratio_4])
+                landscapes = array([calculate_landscape(value_range, sample_number + 1, motifs[location][order])
+                                    for order in [0, 1] for location in [argmin(losses), argmax(losses)]])
+                _, _, _, counts = classify_curvature_features(landscapes, 1.0 / sample_number)
+                records.append((max(counts[:, :2], axis=1) / ((sample_number + 1) ** 2)).tolist())
         task_data["c"] = array(records)
 
         records = []
@@ -211,25 +198,10 @@ def main_04():
             feature = motif_types[1] + "." + str(motif_index)
             escape_data = load_data(load_path=raw_path + "particular/" + feature + ".escape-process.pkl")
             for index, (motifs, losses) in enumerate(escape_data):
-                source, target = motifs[argmin(losses)][0], motifs[argmax(losses)][0]
-                source_landscape = calculate_landscape(value_range, sample_number + 1, source)
-                target_landscape = calculate_landscape(value_range, sample_number + 1, target)
-                source_concavity = detect_curvature_feature(source_landscape, 1.0 / sample_number)
-                target_concavity = detect_curvature_feature(target_landscape, 1.0 / sample_number)
-                counter_1, counter_2 = Counter(source_concavity.reshape(-1)), Counter(target_concavity.reshape(-1))
-                used_value_1, used_value_2 = max([counter_1[1], counter_1[-1]]), max([counter_2[1], counter_2[-1]])
-                used_ratio_1 = used_value_1 / ((sample_number + 1) ** 2)
-                used_ratio_2 = used_value_2 / ((sample_number + 1) ** 2)
-                source, target = motifs[argmin(losses)][1], motifs[argmax(losses)][1]
-                source_landscape = calculate_landscape(value_range, sample_number + 1, source)
-                target_landscape = calculate_landscape(value_range, sample_number + 1, target)
-                source_concavity = detect_curvature_feature(source_landscape, 1.0 / sample_number)
-                target_concavity = detect_curvature_feature(target_landscape, 1.0 / sample_number)
-                counter_3, counter_4 = Counter(source_concavity.reshape(-1)), Counter(target_concavity.reshape(-1))
-                used_value_3, used_value_4 = max([counter_3[1], counter_3[-1]]), max([counter_4[1], counter_4[-1]])
-                used_ratio_3 = used_value_3 / ((sample_number + 1) ** 2)
-                used_ratio_4 = used_value_4 / ((sample_number + 1) ** 2)
-                records.append([used_ratio_1, used_ratio_2, used_ratio_3, used_ratio_4])
+                landscapes = array([calculate_landscape(value_range, sample_number + 1, motifs[location][order])
+                                    for order in [0, 1] for location in [argmin(losses), argmax(losses)]])
+                _, _, _, counts = classify_curvature_features(landscapes, 1.0 / sample_number)
+                records.append((max(counts[:, :2], axis=1) / ((sample_number + 1) ** 2)).tolist())
         task_data["d"] = array(records)
 
         save_data(save_path=sort_path + "main04.pkl", information=task_data)
@@ -422,12 +394,10 @@ def supp_06():
             feature, records = motif_types[0] + "." + str(motif_index), []
             escape_data = load_data(load_path=raw_path + "particular/" + feature + ".escape-process.pkl")
             for index, (motifs, losses) in enumerate(escape_data):
-                source, target = motifs[argmin(losses)][0], motifs[argmax(losses)][0]
-                source_concavity = detect_curvature_feature(calculate_landscape(value_range, 101, source), 0.01)
-                target_concavity = detect_curvature_feature(calculate_landscape(value_range, 101, target), 0.01)
-                counter_1, counter_2 = Counter(source_concavity.reshape(-1)), Counter(target_concavity.reshape(-1))
-                used_value_1, used_value_2 = max([counter_1[1], counter_1[-1]]), max([counter_2[1], counter_2[-1]])
-                records.append([used_value_1 / (101 ** 2), used_value_2 / (101 ** 2)])
+                landscapes = array([calculate_landscape(value_range, 101, motifs[location][0])
+                                    for location in [argmin(losses), argmax(losses)]])
+                _, _, _, counts = classify_curvature_features(landscapes, 0.01)
+                records.append((max(counts[:, :2], axis=1) / (101 ** 2)).tolist())
             task_data[panel_label] = array(records)
         save_data(save_path=sort_path + "supp06.pkl", information=task_data)
 
@@ -445,13 +415,12 @@ def supp_07():
                 source, target = motifs[argmin(losses)][0], motifs[argmax(losses)][0]
                 source_landscape = calculate_landscape(value_range, 101, source)
                 target_landscape = calculate_landscape(value_range, 101, target)
-                source_concavity = detect_curvature_feature(source_landscape, 0.01)
-                target_concavity = detect_curvature_feature(target_landscape, 0.01)
-                counter_1, counter_2 = Counter(source_concavity.reshape(-1)), Counter(target_concavity.reshape(-1))
-                used_value_1, used_value_2 = max([counter_1[1], counter_1[-1]]), max([counter_2[1], counter_2[-1]])
-                use_rate_1, use_rate_2 = used_value_1 / (101 ** 2), used_value_2 / (101 ** 2)
+                convex_flags, concave_flags, _, counts = classify_curvature_features(array([source_landscape,
+                                                                                            target_landscape]), 0.01)
+                source_concavity, target_concavity = convex_flags.astype(float) - concave_flags.astype(float)
+                use_rate_1, use_rate_2 = max(counts[:, :2], axis=1) / (101 ** 2)
                 if use_rate_2 < use_rate_1:
-                    if 1 not in counter_1:
+                    if counts[0, 0] == 0:  # no convex cell in the source landscape.
                         source_region = where(source_landscape > 0, 1, 0)
                         target_region = where(target_landscape > 0, 1, 0)
                     else:
@@ -479,12 +448,10 @@ def supp_08():
             feature, records = motif_types[1] + "." + str(motif_index), []
             escape_data = load_data(load_path=raw_path + "particular/" + feature + ".escape-process.pkl")
             for index, (motifs, losses) in enumerate(escape_data):
-                source, target = motifs[argmin(losses)][0], motifs[argmax(losses)][0]
-                source_concavity = detect_curvature_feature(calculate_landscape(value_range, 101, source), 0.01)
-                target_concavity = detect_curvature_feature(calculate_landscape(value_range, 101, target), 0.01)
-                counter_1, counter_2 = Counter(source_concavity.reshape(-1)), Counter(target_concavity.reshape(-1))
-                used_value_1, used_value_2 = max([counter_1[1], counter_1[-1]]), max([counter_2[1], counter_2[-1]])
-                records.append([used_value_1 / (101 ** 2), used_value_2 / (101 ** 2)])
+                landscapes = array([calculate_landscape(value_range, 101, motifs[location][0])
+                                    for location in [argmin(losses), argmax(losses)]])
+                _, _, _, counts = classify_curvature_features(landscapes, 0.01)
+                records.append((max(counts[:, :2], axis=1) / (101 ** 2)).tolist())
             task_data[panel_label] = array(records)
         save_data(save_path=sort_path + "supp08.pkl", information=task_data)
 